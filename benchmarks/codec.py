@@ -0,0 +1,78 @@
+"""
+Benchmark of the codec backends on a correlated CEE message, the shape of
+the messages passed between the correlation, normalization and sink tasks.
+jsonutils is included as the baseline previously used by the cache.
+
+Backends whose library is not installed are skipped.  Run from the root of
+the repository:
+
+    python benchmarks/codec.py
+"""
+
+import timeit
+
+from dreadfort import codec
+from dreadfort.openstack.common import jsonutils
+
+ITERATIONS = 20000
+
+MESSAGE = {
+    'profile': 'http://projectdreadfort.org/cee/profiles/base',
+    'ver': '1',
+    'msgid': '-',
+    'pri': '46',
+    'pid': '-',
+    'host': 'tohru',
+    'pname': 'apache',
+    'time': '2013-04-02T14:12:04.873490-05:00',
+    'msg': '127.0.0.1 - - [12/Jul/2013:19:40:58 +0000] '
+           '"GET /test.html HTTP/1.1" 404 466 "-" "curl/7.29.0"',
+    'native': {
+        'origin': {
+            'x-info': 'http://www.rsyslog.com',
+            'swVersion': '7.2.5',
+            'x-pid': '12662',
+            'software': 'rsyslogd'
+        }
+    },
+    'dreadfort': {
+        'tenant': '5164b8f4-16fb-4376-9d29-8a6cbaa02fa9',
+        'correlation': {
+            'tenant_name': 'benchmark',
+            'ep_id': 432,
+            'pattern': 'apache2.cee',
+            'durable': False,
+            'encrypted': False,
+            '@timestamp': '2013-07-12T14:17:00.134000Z',
+            'sinks': ['elasticsearch'],
+            'destinations': {
+                'elasticsearch': {
+                    'transaction_id': None,
+                    'transaction_time': None
+                }
+            }
+        }
+    }
+}
+
+
+def _run(name, dumps, loads):
+    encoded = dumps(MESSAGE)
+    dumps_time = timeit.timeit(lambda: dumps(MESSAGE), number=ITERATIONS)
+    loads_time = timeit.timeit(lambda: loads(encoded), number=ITERATIONS)
+    print('{0:<12} dumps {1:8.2f} usec  loads {2:8.2f} usec  {3:5d} bytes'
+          .format(name,
+                  dumps_time / ITERATIONS * 1000000,
+                  loads_time / ITERATIONS * 1000000,
+                  len(encoded)))
+
+
+if __name__ == '__main__':
+    _run('jsonutils', jsonutils.dumps, jsonutils.loads)
+    for name in ['json', 'simplejson', 'ujson', 'msgpack']:
+        try:
+            backend = codec.get_codec(name)
+        except ValueError:
+            print('{0:<12} not installed'.format(name))
+            continue
+        _run(name, backend.dumps, backend.loads)
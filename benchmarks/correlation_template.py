@@ -0,0 +1,75 @@
+"""
+Microbenchmark of the per message cost of adding correlation data to a
+message, comparing a correlation dictionary built from the event producer
+for every message with a copy of the cached correlation template.
+
+Run from the root of the repository:
+
+    python benchmarks/correlation_template.py
+"""
+
+import timeit
+
+from dreadfort.correlation import correlator
+from dreadfort.data.model import tenant_util
+from dreadfort.data.model.tenant import EventProducer
+from dreadfort.data.model.tenant import Tenant
+from dreadfort.data.model.tenant import Token
+from dreadfort.openstack.common import timeutils
+
+ITERATIONS = 500000
+
+TENANT = Tenant(
+    '1022', Token(),
+    event_producers=[
+        EventProducer(i, 'producer{0}'.format(i), 'syslog',
+                      sinks=['elasticsearch', 'hdfs'])
+        for i in range(20)],
+    tenant_name='benchmark')
+
+
+def _new_message():
+    return {'pname': 'producer10', 'native': {'dreadfort': {}}}
+
+
+def correlate_without_template(tenant, message):
+    """
+    The correlation previously done for every message, building the whole
+    correlation dictionary from the event producer
+    """
+    producer = tenant_util.find_event_producer(
+        tenant, producer_name=message['pname'])
+    if not producer:
+        producer = EventProducer(_id=None, name="default", pattern="default")
+
+    correlation_dict = {
+        'tenant_name': tenant.tenant_name,
+        'ep_id': producer.get_id(),
+        'pattern': producer.pattern,
+        'durable': producer.durable,
+        'encrypted': producer.encrypted,
+        '@timestamp': timeutils.utcnow(),
+        'sinks': producer.sinks,
+        "destinations": dict()
+    }
+    for sink in producer.sinks:
+        correlation_dict["destinations"][sink] = {'transaction_id': None,
+                                                  'transaction_time': None}
+
+    message['native'].pop('dreadfort', None)
+    message.update({'dreadfort': {'tenant': tenant.tenant_id,
+                                  'correlation': correlation_dict}})
+    return message
+
+
+def _run(name, correlate):
+    elapsed = timeit.timeit(
+        lambda: correlate(TENANT, _new_message()), number=ITERATIONS)
+    baseline = timeit.timeit(_new_message, number=ITERATIONS)
+    per_message = (elapsed - baseline) / ITERATIONS * 1000000
+    print('{0:<20} {1:8.3f} usec per message'.format(name, per_message))
+
+
+if __name__ == '__main__':
+    _run('without template', correlate_without_template)
+    _run('with template', correlator._correlate_message)
@@ -1,8 +1,9 @@
 import falcon
 
 from dreadfort.api.tenant.resources import MESSAGE_TOKEN
-from dreadfort.api import (ApiResource, handle_api_exception)
+from dreadfort.api import (abort, ApiResource, handle_api_exception)
 from dreadfort.correlation import correlator
+from dreadfort.correlation import errors
 from dreadfort.api.validator_init import get_validator
 
 
@@ -15,6 +16,9 @@ class PublishMessageResource(ApiResource):
         This method is passed log event data by a tenant. The request will
         have a message token and a tenant id which must be validated either
         by the local cache or by a call to this workers coordinator.
+
+        When the token and tenant are cached the message is correlated
+        inline, otherwise the message is queued for correlation.
         """
 
         # Validate the tenant's JSON event log data as valid JSON.
@@ -23,9 +27,18 @@ class PublishMessageResource(ApiResource):
         # read message token from header
         message_token = req.get_header(MESSAGE_TOKEN, required=True)
 
-        # Queue the message for correlation
-        correlator.correlate_http_message.delay(tenant_id,
-                                                message_token,
-                                                message)
+        try:
+            correlated = correlator.correlate_cached_message(
+                tenant_id, message_token, message)
+        except errors.MessageAuthenticationError:
+            abort(falcon.HTTP_401, 'Message token is not valid for tenant.')
+        except errors.ResourceNotFoundError:
+            abort(falcon.HTTP_404, 'Unable to locate tenant.')
+
+        if not correlated:
+            # Queue the message for correlation
+            correlator.correlate_http_message.delay(tenant_id,
+                                                    message_token,
+                                                    message)
 
         resp.status = falcon.HTTP_202
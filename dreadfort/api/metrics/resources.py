@@ -0,0 +1,24 @@
+"""
+The Metrics Resources module exposes the pipeline metrics recorded by the
+processes of a worker node.
+"""
+import falcon
+
+from dreadfort import api
+from dreadfort import metrics
+
+
+class MetricsResource(api.ApiResource):
+
+    """
+    A resource for retrieving the metrics of the worker node
+    """
+
+    @api.handle_api_exception(operation_name='Metrics GET')
+    def on_get(self, req, resp):
+        """
+        Retrieve the counters and latency histograms of all processes on the
+        worker node
+        """
+        resp.status = falcon.HTTP_200
+        resp.body = api.format_response_body(metrics.collect())
@@ -15,13 +15,14 @@ from dreadfort.openstack.common.timeutils import isotime
 
 MESSAGE_TOKEN = 'MESSAGE-TOKEN'
 MIN_TOKEN_TIME_LIMIT_HRS = 3
+TENANT_NOT_FOUND = 'Unable to locate tenant.'
 
 
 def _tenant_not_found():
     """
     sends an http 404 response to the caller
     """
-    api.abort(falcon.HTTP_404, 'Unable to locate tenant.')
+    api.abort(falcon.HTTP_404, TENANT_NOT_FOUND)
 
 
 def _producer_not_found():
@@ -38,6 +39,13 @@ def _message_token_is_invalid():
     api.abort(falcon.HTTP_404)
 
 
+def _message_token_not_authorized():
+    """
+    sends an http 401 response to the caller
+    """
+    api.abort(falcon.HTTP_401, 'Message token is not valid for tenant.')
+
+
 def _token_time_limit_not_reached():
     """
     sends an http 409 response to the caller
@@ -239,19 +247,15 @@ class EventProducerResource(api.ApiResource):
                     'EventProducer with name {0} already exists with id={1}.'
                     .format(duplicate_producer.name,
                             duplicate_producer.get_id()))
-            event_producer.name = body['name']
+            tenant.rename_event_producer(event_producer, body['name'])
 
-        if 'pattern' in body:
-            event_producer.pattern = str(body['pattern'])
-
-        if 'durable' in body:
-            event_producer.durable = body['durable']
-
-        if 'encrypted' in body:
-            event_producer.encrypted = body['encrypted']
-
-        if 'sinks' in body:
-            event_producer.sinks = body['sinks']
+        pattern = body.get('pattern')
+        tenant.update_event_producer(
+            event_producer,
+            pattern=str(pattern) if pattern is not None else None,
+            durable=body.get('durable'),
+            encrypted=body.get('encrypted'),
+            sinks=body.get('sinks'))
 
         # save the tenant document
         tenant_util.save_tenant(tenant)
@@ -376,3 +380,33 @@ class TokenResource(api.ApiResource):
 
         resp.status = falcon.HTTP_203
         resp.set_header('Location', '/v1/{0}/token'.format(tenant_id))
+
+
+class CorrelationResource(api.ApiResource):
+
+    """
+    The Correlation Resource validates a message token and returns the tenant
+    data used to correlate messages in a single call.
+    """
+
+    @api.handle_api_exception(operation_name='Correlation GET')
+    def on_get(self, req, resp, tenant_id):
+        """
+        Validates a message token for a specified tenant and retrieves the
+        tenant when an HTTP GET call is received
+        """
+
+        # get message token, or abort if token is not in header
+        message_token = req.get_header(MESSAGE_TOKEN, required=True)
+
+        # verify the tenant exists
+        tenant = tenant_util.find_tenant(tenant_id=tenant_id)
+
+        if not tenant:
+            _tenant_not_found()
+
+        if not tenant.token.validate_token(message_token):
+            _message_token_not_authorized()
+
+        resp.status = falcon.HTTP_200
+        resp.body = api.format_response_body({'tenant': tenant.format()})
@@ -0,0 +1,185 @@
+"""
+The codec module encodes and decodes the messages and objects that dreadfort
+passes through its transport, cache and queues.  The backend is chosen in
+the [codec] section of the configuration:
+
+    json        the standard library json module
+    simplejson  simplejson with its C speedups (default)
+    ujson       ujson, a C JSON encoder that does not encode datetimes
+                as strings, they are encoded as unix timestamps instead
+    msgpack     MessagePack, a compact binary encoding
+
+Every available backend is registered as a kombu serializer under the name
+'dreadfort-<backend>', so that workers configured with different backends
+can still decode each other's tasks.  Datetimes are encoded as ISO 8601
+strings by every backend except ujson.
+"""
+
+import datetime
+import json
+
+from kombu import serialization
+from oslo.config import cfg
+import simplejson
+
+from dreadfort import config
+from dreadfort import env
+from dreadfort.openstack.common import timeutils
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+_LOG = env.get_logger(__name__)
+
+# Codec configuration options
+_CODEC_GROUP = cfg.OptGroup(name='codec', title='Codec Options')
+config.get_config().register_group(_CODEC_GROUP)
+
+_CODEC_OPTIONS = [
+    cfg.StrOpt('backend',
+               default='simplejson',
+               choices=['json', 'simplejson', 'ujson', 'msgpack'],
+               help="""library used to encode messages, cached objects and
+               tasks"""
+               )
+]
+
+config.get_config().register_opts(_CODEC_OPTIONS, group=_CODEC_GROUP)
+
+try:
+    config.init_config()
+except config.cfg.ConfigFilesNotFoundError as ex:
+    _LOG.exception(ex.message)
+
+
+def _default(obj):
+    """
+    Encodes the objects that the backends can not encode natively
+    """
+    if isinstance(obj, datetime.datetime):
+        return timeutils.isotime(obj, subsecond=True)
+    raise TypeError('{0!r} can not be encoded'.format(obj))
+
+
+class Codec(object):
+
+    """
+    A pair of functions that encode objects to strings and decode them back,
+    along with the content type and encoding of the encoded strings
+    """
+
+    def __init__(self, name, dumps, loads, content_type,
+                 content_encoding='utf-8', is_json=True):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.is_json = is_json
+
+    @property
+    def serializer(self):
+        """
+        The name the codec is registered under as a kombu serializer
+        """
+        return 'dreadfort-{0}'.format(self.name)
+
+
+def _new_codecs():
+    # the JSON encoders are created once, json.dumps creates a new encoder
+    # on every call when it is given a default function
+    codecs = {
+        'json': Codec(
+            'json',
+            json.JSONEncoder(default=_default).encode,
+            json.loads,
+            'application/x-dreadfort-json'),
+        'simplejson': Codec(
+            'simplejson',
+            simplejson.JSONEncoder(default=_default).encode,
+            simplejson.loads,
+            'application/x-dreadfort-simplejson')
+    }
+
+    if ujson:
+        codecs['ujson'] = Codec(
+            'ujson', ujson.dumps, ujson.loads,
+            'application/x-dreadfort-ujson')
+
+    if msgpack:
+        codecs['msgpack'] = Codec(
+            'msgpack',
+            lambda obj: msgpack.packb(obj, default=_default),
+            lambda data: msgpack.unpackb(data, raw=False),
+            'application/x-dreadfort-msgpack',
+            content_encoding='binary',
+            is_json=False)
+
+    return codecs
+
+
+_CODECS = _new_codecs()
+
+for _codec in _CODECS.itervalues():
+    serialization.register(
+        _codec.serializer, _codec.dumps, _codec.loads,
+        content_type=_codec.content_type,
+        content_encoding=_codec.content_encoding)
+
+# names of the kombu serializers registered for the available backends
+SERIALIZERS = sorted(codec.serializer for codec in _CODECS.itervalues())
+
+
+def get_codec(name):
+    """
+    Returns the codec of a backend, raises a ValueError if the library of
+    the backend is not installed
+    """
+    if name not in _CODECS:
+        raise ValueError('codec backend {0} is not available'.format(name))
+    return _CODECS[name]
+
+
+_BACKEND = config.get_config().codec.backend
+
+try:
+    CODEC = get_codec(_BACKEND)
+except ValueError as ex:
+    _LOG.error('{0}, using simplejson'.format(ex))
+    CODEC = get_codec('simplejson')
+
+# JSON is needed to decode data produced outside of dreadfort, the configured
+# backend is used for that when it is a JSON backend
+JSON_CODEC = CODEC if CODEC.is_json else get_codec('simplejson')
+
+SERIALIZER = CODEC.serializer
+
+
+def dumps(obj):
+    """
+    Encodes an object with the configured backend
+    """
+    return CODEC.dumps(obj)
+
+
+def loads(data):
+    """
+    Decodes a string encoded with the configured backend
+    """
+    return CODEC.loads(data)
+
+
+def loads_json(data):
+    """
+    Decodes a JSON string with the configured backend, or with simplejson if
+    the configured backend is not a JSON backend
+    """
+    return JSON_CODEC.loads(data)
@@ -7,7 +7,8 @@ persisted in case of a service restart.
 
 There are 2 entry points into the pipeline, one for messages that are received
 from a syslog parser, and another entry point for messages posted to the
-http_log endpoint.
+http_log endpoint. Messages received from a syslog parser may also enter the
+pipeline in batches through correlate_message_batch.
 
 Case 1 - Syslog: Entry point - correlate_src_syslog_message
 
@@ -16,6 +17,10 @@ Case 1 - Syslog: Entry point - correlate_src_syslog_message
 
 Case 2 - HTTP: Entry point - correlate_src_http_message
 
+    When the token and tenant are in the local cache, the PublishMessage
+    resource correlates the message inline through correlate_cached_message
+    and only falls back to the queued task on a cache miss.
+
     Token Validation - messages contain a tenant_id and message token which
     are used to validate a message. Previously validated tokens are stored in
     a local cache for faster processing. Message validation is first attempted
@@ -30,28 +35,81 @@ Case 2 - HTTP: Entry point - correlate_src_http_message
 
     Normalization or Storage - The data added to the message is used to decide
     whether the message should be queued for normalization or for storage.
+
+Case 3 - Syslog Batch: Entry point - correlate_message_batch
+
+    formats each syslog message to CEE and groups the messages by tenant.
+    Token validation and tenant retrieval are performed once per tenant group
+    and the correlated messages are queued for normalization or storage in
+    bulk.
 """
 
+from contextlib import contextmanager
 import httplib
+import threading
+import zlib
+
+from oslo.config import cfg
 import requests
 
+from dreadfort import codec
+from dreadfort import config
 from dreadfort import env
 from dreadfort.api.tenant.resources import MESSAGE_TOKEN
+from dreadfort.api.tenant.resources import TENANT_NOT_FOUND
 from dreadfort.api.utils.request import http_request
 from dreadfort.correlation import errors
 from dreadfort.data import cache_handler
-from dreadfort.data.model.tenant import EventProducer
+from dreadfort.data import invalidation
 from dreadfort.data.model import tenant_util
+from dreadfort import metrics
 from dreadfort.normalization import normalizer
+from dreadfort.openstack.common import lockutils
 from dreadfort.openstack.common import timeutils
+from dreadfort import proxy
 from dreadfort.queue import celery
 from dreadfort import sinks
 
 _LOG = env.get_logger(__name__)
 
+# Correlation configuration options
+_CORRELATION_GROUP = cfg.OptGroup(
+    name='correlation', title='Correlation Options')
+config.get_config().register_group(_CORRELATION_GROUP)
+
+_CORRELATION_OPTIONS = [
+    cfg.StrOpt('lock_path',
+               default='/var/lib/dreadfort/locks',
+               help="""directory of the lock files used so that only one
+               coordinator lookup per tenant is in flight on a host"""
+               ),
+    cfg.IntOpt('lock_count',
+               default=64,
+               help="""number of lock files that the coordinator lookups of
+               all tenants are spread over, tenants that share a lock file
+               wait for each other's coordinator requests"""
+               )
+]
+
+config.get_config().register_opts(
+    _CORRELATION_OPTIONS, group=_CORRELATION_GROUP)
+
+try:
+    config.init_config()
+except config.cfg.ConfigFilesNotFoundError as ex:
+    _LOG.exception(ex.message)
+
+LOCK_PATH = config.get_config().correlation.lock_path
+LOCK_COUNT = config.get_config().correlation.lock_count
+
+# tenants that this process is refreshing in the background
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
 
 @celery.task(acks_late=True, max_retries=None,
-             ignore_result=True, serializer="json")
+             ignore_result=True, serializer=codec.SERIALIZER)
+@metrics.timed('correlation.syslog')
 def correlate_syslog_message(message):
     """
     Entry point into correlation pipeline for messages received from the
@@ -64,6 +122,8 @@ def correlate_syslog_message(message):
     validation or a malformed message do not initiate a retry but instead
     allow the task to fail.
     """
+    invalidation.start_listener()
+
     try:
         _format_message_cee(message)
 
@@ -75,7 +135,8 @@ def correlate_syslog_message(message):
 
 
 @celery.task(acks_late=True, max_retries=None,
-             ignore_result=True, serializer="json")
+             ignore_result=True, serializer=codec.SERIALIZER)
+@metrics.timed('correlation.http')
 def correlate_http_message(tenant_id, message_token, message):
     """
     Entry point into correlation pipeline for messages received from the
@@ -88,6 +149,8 @@ def correlate_http_message(tenant_id, message_token, message):
     validation or a malformed message do not initiate a retry but instead allow
     the task to fail.
     """
+    invalidation.start_listener()
+
     try:
         # enter the pipeline by beginning mesage validation
         _validate_token_from_cache(tenant_id, message_token, message)
@@ -99,9 +162,121 @@ def correlate_http_message(tenant_id, message_token, message):
         raise correlate_http_message.retry()
 
 
+@celery.task(acks_late=True, max_retries=None,
+             ignore_result=True, serializer=codec.SERIALIZER)
+@metrics.timed('correlation.batch')
+def correlate_message_batch(messages):
+    """
+    Entry point into correlation pipeline for a batch of messages received
+    from the syslog parser. The messages are converted to CEE format and
+    grouped by tenant so that the message token is validated and the tenant
+    is loaded once per group rather than once per message.
+
+    A failure of one message, or of one tenant group, does not fail the
+    batch. Messages that fail validation are reported in the returned list of
+    (index, error message) tuples. Tenant groups that fail because the
+    coordinator could not be reached are queued again as a new batch.
+    """
+    invalidation.start_listener()
+    metrics.increment('correlation.batch.messages', len(messages))
+
+    failures = list()
+    tenant_groups = dict()
+
+    for index, message in enumerate(messages):
+        try:
+            tenant_id, message_token, cee_message = _convert_to_cee(message)
+        except errors.MessageValidationError as ex:
+            failures.append((index, ex.msg))
+            continue
+
+        tenant_groups.setdefault(tenant_id, list()).append(
+            (index, message, message_token, cee_message))
+
+    # look up the tokens and tenants of all groups in one pass
+    tokens = cache_handler.TokenCache().get_tokens(tenant_groups.keys())
+    tenants = cache_handler.TenantCache().get_tenants(tokens.keys())
+
+    correlated_messages = list()
+
+    for tenant_id, group in tenant_groups.iteritems():
+        try:
+            group_messages, group_failures = _correlate_tenant_group(
+                tenant_id, group, tokens.get(tenant_id),
+                tenants.get(tenant_id))
+            correlated_messages.extend(group_messages)
+            failures.extend(group_failures)
+
+        except errors.CoordinatorCommunicationError as ex:
+            # queue the tenant group to be tried again as its own batch
+            _LOG.exception(ex.message)
+            correlate_message_batch.apply_async(
+                args=[[message for _, message, _, _ in group]],
+                countdown=correlate_message_batch.default_retry_delay)
+
+        except errors.PublishMessageError as ex:
+            failures.extend((index, ex.msg) for index, _, _, _ in group)
+
+    _route_message_batch(correlated_messages)
+
+    for index, error_message in failures:
+        _LOG.debug('Message {0} of batch failed correlation: {1}'.format(
+            index, error_message))
+
+    return failures
+
+
+@metrics.timed('correlation.cached')
+def correlate_cached_message(tenant_id, message_token, message):
+    """
+    Correlate a message using only the local cache, without queueing a
+    correlation task. When the token and tenant are cached, the message is
+    validated and packed with correlation data, then queued for normalization
+    or storage.
+
+    Returns True if the message was correlated, or False if the token or
+    tenant is not cached and the message must go through the queued
+    correlation task. This runs in the thread of an API request, so the
+    message is always queued for normalization rather than normalized
+    inline, which would add the normalizer CPU time to the request. Raises a
+    MessageAuthenticationError for an invalid message token and a
+    ResourceNotFoundError for a tenant known not to exist.
+    """
+    invalidation.start_listener()
+
+    _check_rejection_cache(
+        cache_handler.RejectionCache(), tenant_id, message_token)
+
+    token = cache_handler.TokenCache().get_token(tenant_id)
+    if not token:
+        return False
+
+    if not token.validate_token(message_token):
+        raise errors.MessageAuthenticationError(
+            'Message not authenticated, check your tenant id '
+            'and or message token for validity')
+
+    tenant = cache_handler.TenantCache().get_tenant(tenant_id)
+    if not tenant:
+        return False
+
+    _add_correlation_info_to_message(tenant, message, normalize_inline=False)
+    return True
+
+
 def _format_message_cee(message):
     """
-    Format message as CEE and begin message validation. The incoming message
+    Format message as CEE and begin message validation.
+    """
+    tenant_id, message_token, cee_message = _convert_to_cee(message)
+
+    # send the new cee_message to be validated
+    _validate_token_from_cache(tenant_id, message_token, cee_message)
+
+
+def _convert_to_cee(message):
+    """
+    Convert a message to CEE format. The incoming message
     originates a syslog message (RFC 5424) that has been received on the syslog
     endpoint and parsed into the following JSON format:
 
@@ -136,6 +311,8 @@ def _format_message_cee(message):
             "msg": "{MSG}",
             "native": "{_SDATA}"
         }
+
+    Returns a tuple of the tenant_id, the message token and the CEE message.
     """
     try:
         dreadfort_sd = message['_SDATA']['dreadfort']
@@ -162,8 +339,7 @@ def _format_message_cee(message):
     cee_message['msg'] = message.get('MESSAGE', '-')
     cee_message['native'] = message.get('_SDATA', {})
 
-    # send the new cee_message to be validated
-    _validate_token_from_cache(tenant_id, message_token, cee_message)
+    return tenant_id, message_token, cee_message
 
 
 def _validate_token_from_cache(tenant_id, message_token, message):
@@ -189,7 +365,7 @@ def _validate_token_from_cache(tenant_id, message_token, message):
         _get_tenant_from_cache(tenant_id, message_token, message)
     else:
         # hand off the message to validate the token with the coordinator
-        _validate_token_with_coordinator(tenant_id, message_token, message)
+        _get_tenant_from_coordinator(tenant_id, message_token, message)
 
 
 def _get_tenant_from_cache(tenant_id, message_token, message):
@@ -209,118 +385,446 @@ def _get_tenant_from_cache(tenant_id, message_token, message):
         _add_correlation_info_to_message(tenant, message)
 
 
-def _validate_token_with_coordinator(tenant_id, message_token, message):
+def _get_tenant_from_coordinator(tenant_id, message_token, message):
+    """
+    Call the coordinator to validate the message token and retrieve the
+    tenant, when either is missing from the cache.  The token and tenant are
+    persisted in the local cache for future lookups, and the message is
+    handed off to be packed with correlation data.
+    """
+    tenant = _fetch_tenant_from_coordinator(tenant_id, message_token)
+
+    # add correlation to message
+    _add_correlation_info_to_message(tenant, message)
+
+
+def _fetch_tenant_from_coordinator(tenant_id, message_token, refresh=False):
+    """
+    Validate the message token and retrieve the tenant from the coordinator,
+    saving both to the local cache. When the caches are shared by the
+    processes of the host, lookups are coalesced so that only one
+    coordinator fetch per tenant is in flight on the host at a time. Callers
+    that wait on an in flight fetch use the token and tenant it saved to the
+    cache instead of calling the coordinator again.
+
+    Unknown tenants and invalid message tokens are remembered for a short
+    time, and are rejected without calling the coordinator.
+
+    :param refresh: True to replace a stale token and tenant, which are
+    only reused if another process refreshed them while waiting for the lock
+    """
+    rejection_cache = cache_handler.RejectionCache()
+    _check_rejection_cache(rejection_cache, tenant_id, message_token)
+
+    with _tenant_lock(tenant_id):
+
+        # the cache may have been filled while waiting for the lock
+        if refresh:
+            token = cache_handler.TokenCache().get_fresh_token(tenant_id)
+            tenant = cache_handler.TenantCache().get_fresh_tenant(tenant_id)
+        else:
+            token = cache_handler.TokenCache().get_token(tenant_id)
+            tenant = cache_handler.TenantCache().get_tenant(tenant_id)
+
+        if token and tenant:
+            if not token.validate_token(message_token):
+                raise errors.MessageAuthenticationError(
+                    'Message not authenticated, check your tenant id '
+                    'and or message token for validity')
+            return tenant
+
+        _check_rejection_cache(rejection_cache, tenant_id, message_token)
+
+        config = _get_config_from_cache()
+        try:
+            tenant = _request_validated_tenant(
+                config, tenant_id, message_token)
+
+        except errors.ResourceNotFoundError:
+            rejection_cache.reject_tenant(tenant_id)
+            raise
+
+        except errors.MessageAuthenticationError:
+            rejection_cache.reject_token(tenant_id, message_token)
+            raise
+
+        # update the cache with new token and tenant info
+        _save_tenant_to_cache(tenant_id, tenant)
+
+        return tenant
+
+
+@contextmanager
+def _tenant_lock(tenant_id):
+    """
+    Hold the host wide lock of a tenant while its token and tenant are
+    fetched.  Tenant ids are hashed onto LOCK_COUNT lock files, so that
+    unknown or malformed tenant ids can not create lock files.  The lock is
+    held for the whole coordinator request, so the lookups of tenants that
+    share a lock file are serialized.  Waiting on the lock only pays off
+    when the cache filled by the holder of the lock is shared, otherwise no
+    lock is taken.
+    """
+    if not proxy.caches_are_shared():
+        yield
+        return
+
+    if isinstance(tenant_id, unicode):
+        tenant_id = tenant_id.encode('utf-8')
+    else:
+        tenant_id = str(tenant_id)
+    lock_name = str((zlib.crc32(tenant_id) & 0xffffffff) % LOCK_COUNT)
+
+    with lockutils.lock(lock_name, lock_file_prefix='dreadfort-tenant-',
+                        external=True, lock_path=LOCK_PATH):
+        yield
+
+
+def _refresh_stale_tenant(tenant_id):
     """
-    Call coordinator to validate the message token. If token is validated,
-    persist the token in the local cache for future lookups, and hand off
-    message to retrieve tenant information.
+    Start refreshing a stale tenant and token in a background thread, unless
+    this process is already refreshing them. The stale tenant and token are
+    served until the refresh replaces them.
     """
+    with _refreshing_lock:
+        if tenant_id in _refreshing:
+            return
+        _refreshing.add(tenant_id)
 
-    config = _get_config_from_cache()
+    refresher = threading.Thread(target=_refresh_tenant, args=(tenant_id,))
+    refresher.daemon = True
+    refresher.start()
+
+
+def _refresh_tenant(tenant_id):
+    """
+    Refresh a stale tenant and token from the coordinator, validating the
+    cached token. The tenant is only dropped from the cache when the
+    coordinator confirms that it no longer exists, and the token when the
+    coordinator rejects it. Other failures keep the stale entries until
+    their grace period ends.
+    """
     try:
-        resp = http_request(
-            '{0}/tenant/{1}/token'.format(config.coordinator_uri, tenant_id),
-            {MESSAGE_TOKEN: message_token, 'hostname': config.hostname},
-            http_verb='HEAD')
+        token = cache_handler.TokenCache().get_token(tenant_id)
+        if not token:
+            return
+
+        _fetch_tenant_from_coordinator(tenant_id, token.valid, refresh=True)
+        metrics.increment('cache.refresh.ok')
+
+    except errors.ResourceNotFoundError:
+        metrics.increment('cache.refresh.not_found')
+        invalidation.evict_tenant(tenant_id)
+
+    except errors.MessageAuthenticationError:
+        metrics.increment('cache.refresh.unauthorized')
+        cache_handler.TokenCache().delete_token(tenant_id)
+
+    except Exception as ex:
+        _LOG.exception(ex)
+        metrics.increment('cache.refresh.error')
+
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(tenant_id)
+
+
+cache_handler.set_stale_handler(_refresh_stale_tenant)
+
+
+def _check_rejection_cache(rejection_cache, tenant_id, message_token):
+    """
+    Raise the error previously returned by the coordinator for an unknown
+    tenant or an invalid message token
+    """
+    if rejection_cache.is_tenant_rejected(tenant_id):
+        metrics.increment('cache.rejection.tenant_hit')
+        raise errors.ResourceNotFoundError('unable to locate tenant.')
+
+    if rejection_cache.is_token_rejected(tenant_id, message_token):
+        metrics.increment('cache.rejection.token_hit')
+        raise errors.MessageAuthenticationError(
+            'Message not authenticated, check your tenant id '
+            'and or message token for validity')
+
+
+def _request_validated_tenant(config, tenant_id, message_token):
+    """
+    Call the coordinator to validate a message token and retrieve the tenant
+    data in a single request, and return the tenant as a Tenant object.
+    Raises a MessageAuthenticationError if the token is not valid, and a
+    ResourceNotFoundError if the tenant does not exist.  A coordinator that
+    predates the correlation route is asked with a token request and a
+    tenant request instead.
+    """
+    try:
+        with metrics.timer('coordinator.request'):
+            resp = http_request(
+                '{0}/tenant/{1}/correlation'.format(
+                    config.coordinator_uri, tenant_id),
+                {MESSAGE_TOKEN: message_token, 'hostname': config.hostname},
+                http_verb='GET')
 
     except requests.RequestException as ex:
         _LOG.exception(ex.message)
+        metrics.increment('coordinator.error')
         raise errors.CoordinatorCommunicationError
 
-    if resp.status_code != httplib.OK:
+    if resp.status_code == httplib.OK:
+        metrics.increment('coordinator.ok')
+        response_body = resp.json()
+
+        # load new tenant data from response body
+        return tenant_util.load_tenant_from_dict(response_body['tenant'])
+
+    elif resp.status_code == httplib.UNAUTHORIZED:
+        metrics.increment('coordinator.unauthorized')
         raise errors.MessageAuthenticationError(
             'Message not authenticated, check your tenant id '
             'and or message token for validity')
 
-    # hand off the message to validate the tenant with the coordinator
-    _get_tenant_from_coordinator(tenant_id, message_token, message)
+    elif resp.status_code == httplib.NOT_FOUND:
+        if not _is_tenant_not_found(resp):
+            # the 404 of an unknown route, rather than of an unknown tenant
+            metrics.increment('coordinator.no_correlation_route')
+            _request_token_validation(config, tenant_id, message_token)
+            return _request_tenant(config, tenant_id, message_token)
+
+        metrics.increment('coordinator.not_found')
+        error_message = 'unable to locate tenant.'
+        _LOG.debug(error_message)
+        raise errors.ResourceNotFoundError(error_message)
+    else:
+        # coordinator responds, but coordinator datasink could be unreachable
+        metrics.increment('coordinator.error')
+        raise errors.CoordinatorCommunicationError
 
 
-def _get_tenant_from_coordinator(tenant_id, message_token, message):
+def _is_tenant_not_found(resp):
     """
-    This method retrieves tenant data from the coordinator, and persists the
-    tenant data in the local cache for future lookups. The message is then
-    handed off to be packed with correlation data.
+    Returns True if a 404 response reports an unknown tenant
     """
+    try:
+        return resp.json().get('title') == TENANT_NOT_FOUND
+    except (ValueError, AttributeError):
+        return False
 
-    config = _get_config_from_cache()
 
+def _request_token_validation(config, tenant_id, message_token):
+    """
+    Call the coordinator to validate a message token for a tenant. Raises a
+    MessageAuthenticationError if the token is not valid.
+    """
     try:
-        resp = http_request(
-            '{0}/tenant/{1}'.format(config.coordinator_uri, tenant_id),
-            {MESSAGE_TOKEN: message_token, 'hostname': config.hostname},
-            http_verb='GET')
+        with metrics.timer('coordinator.request'):
+            resp = http_request(
+                '{0}/tenant/{1}/token'.format(
+                    config.coordinator_uri, tenant_id),
+                {MESSAGE_TOKEN: message_token, 'hostname': config.hostname},
+                http_verb='HEAD')
 
     except requests.RequestException as ex:
         _LOG.exception(ex.message)
+        metrics.increment('coordinator.error')
         raise errors.CoordinatorCommunicationError
 
-    if resp.status_code == httplib.OK:
-        response_body = resp.json()
+    if resp.status_code != httplib.OK:
+        metrics.increment('coordinator.unauthorized')
+        raise errors.MessageAuthenticationError(
+            'Message not authenticated, check your tenant id '
+            'and or message token for validity')
 
-        # load new tenant data from response body
-        tenant = tenant_util.load_tenant_from_dict(response_body['tenant'])
 
-        # update the cache with new tenant info
-        _save_tenant_to_cache(tenant_id, tenant)
+def _request_tenant(config, tenant_id, message_token):
+    """
+    Call the coordinator to retrieve the tenant data and return it as a
+    Tenant object. Raises a ResourceNotFoundError if the tenant does not
+    exist.
+    """
+    try:
+        with metrics.timer('coordinator.request'):
+            resp = http_request(
+                '{0}/tenant/{1}'.format(config.coordinator_uri, tenant_id),
+                {MESSAGE_TOKEN: message_token, 'hostname': config.hostname},
+                http_verb='GET')
 
-        # add correlation to message
-        _add_correlation_info_to_message(tenant, message)
+    except requests.RequestException as ex:
+        _LOG.exception(ex.message)
+        metrics.increment('coordinator.error')
+        raise errors.CoordinatorCommunicationError
+
+    if resp.status_code == httplib.OK:
+        metrics.increment('coordinator.ok')
+        return tenant_util.load_tenant_from_dict(resp.json()['tenant'])
 
     elif resp.status_code == httplib.NOT_FOUND:
+        metrics.increment('coordinator.not_found')
         error_message = 'unable to locate tenant.'
         _LOG.debug(error_message)
         raise errors.ResourceNotFoundError(error_message)
     else:
-        # coordinator responds, but coordinator datasink could be unreachable
+        metrics.increment('coordinator.error')
         raise errors.CoordinatorCommunicationError
 
 
-def _add_correlation_info_to_message(tenant, message):
+def _correlate_tenant_group(tenant_id, group, token=None, tenant=None):
+    """
+    Correlate a group of messages that belong to a single tenant. The token
+    and tenant are retrieved once for the whole group, and each message token
+    is then validated locally.
+
+    :param group: list of (index, message, message_token, cee_message) tuples
+    :param token: the cached Token of the tenant, if it was already looked up
+    :param tenant: the cached Tenant, if it was already looked up
+    Returns a tuple of the list of correlated messages and a list of
+    (index, error message) tuples for messages that failed validation.
+    """
+    message_tokens = set(message_token for _, _, message_token, _ in group)
+    token, tenant = _get_tenant_for_batch(
+        tenant_id, message_tokens, token, tenant)
+
+    correlated_messages = list()
+    failures = list()
+
+    for index, _, message_token, cee_message in group:
+        if not token.validate_token(message_token):
+            failures.append((index, 'Message not authenticated, check your '
+                                    'tenant id and or message token for '
+                                    'validity'))
+            continue
+
+        correlated_messages.append(_correlate_message(tenant, cee_message))
+
+    return correlated_messages, failures
+
+
+def _get_tenant_for_batch(tenant_id, message_tokens, token=None,
+                          tenant=None):
+    """
+    Retrieve the token and tenant used to correlate a group of messages,
+    first from the local cache and then from the coordinator. When the token
+    is not cached, each distinct message token of the group is tried against
+    the coordinator until one of them is validated.  A token or tenant that
+    was already looked up for the batch is used without another cache call.
+
+    Returns a tuple of the Token used for message validation and the Tenant.
+    """
+    if not token:
+        token = cache_handler.TokenCache().get_token(tenant_id)
+
+    if token:
+        valid_tokens = [message_token for message_token in message_tokens
+                        if token.validate_token(message_token)]
+        if not valid_tokens:
+            raise errors.MessageAuthenticationError(
+                'Message not authenticated, check your tenant id '
+                'and or message token for validity')
+
+        if not tenant:
+            tenant = cache_handler.TenantCache().get_tenant(tenant_id)
+        if not tenant:
+            tenant = _fetch_tenant_from_coordinator(
+                tenant_id, valid_tokens[0])
+        return token, tenant
+
+    for message_token in message_tokens:
+        try:
+            tenant = _fetch_tenant_from_coordinator(tenant_id, message_token)
+        except errors.MessageAuthenticationError:
+            continue
+        return tenant.token, tenant
+
+    raise errors.MessageAuthenticationError(
+        'Message not authenticated, check your tenant id '
+        'and or message token for validity')
+
+
+def _add_correlation_info_to_message(tenant, message, normalize_inline=True):
+    """
+    Pack the message with correlation data and queue it for normalization or
+    storage.  Callers outside of the correlation tasks set normalize_inline
+    to False to always queue the normalization task.
+    """
+    _correlate_message(tenant, message)
+
+    # If the message data indicates that the message has normalization rules
+    # that apply, Queue the message for normalization processing
+    if normalizer.should_normalize(message):
+        # send the message to normalization then route to sink, running
+        # the normalization task in this process when configured, or for
+        # fast lane messages, to save a trip through the broker
+        if normalize_inline and (normalizer.NORMALIZE_INLINE or
+                                 sinks.use_fast_lane(message)):
+            _normalize_inline(message)
+        else:
+            normalizer.normalize_message.delay(message)
+    else:
+        # Queue the message for indexing/storage
+        sinks.route_message(message)
+
+
+def _normalize_inline(message):
+    """
+    Run the normalization task of a message in this process.  A message that
+    fails is queued for the normalization task instead, so the failure is
+    retried there rather than failing the caller.
+    """
+    try:
+        normalizer.normalize_message(message)
+    except Exception as ex:
+        _LOG.exception(ex)
+        metrics.increment('normalization.inline_failures')
+        normalizer.normalize_message.delay(message)
+
+
+def _correlate_message(tenant, message):
     """
     Pack the message with correlation data. The message will be update by
     adding a dictionary named "dreadfort" that contains tenant specific
     information used in processing the message.
     """
-    # match the producer by the message pname
-    producer = tenant_util.find_event_producer(tenant,
-                                               producer_name=message['pname'])
-
-    # if the producer is not found, create a default producer
-    if not producer:
-        producer = EventProducer(_id=None, name="default", pattern="default")
-
-    # create correlation dictionary
-    correlation_dict = {
-        'tenant_name': tenant.tenant_name,
-        'ep_id': producer.get_id(),
-        'pattern': producer.pattern,
-        'durable': producer.durable,
-        'encrypted': producer.encrypted,
-        '@timestamp': timeutils.utcnow(),
-        'sinks': producer.sinks,
-        "destinations": dict()
-    }
-
-    # configure sink dispatch
-    for sink in producer.sinks:
-        correlation_dict["destinations"][sink] = {'transaction_id': None,
-                                                  'transaction_time': None}
+    # stamp the message with a copy of the producer's correlation template,
+    # the destinations are created for each message because sinks record
+    # their transactions in them
+    template = tenant.get_correlation_template(message['pname'])
+    correlation_dict = template.copy()
+    correlation_dict['@timestamp'] = timeutils.isotime(subsecond=True)
+    correlation_dict['destinations'] = {
+        sink: {'transaction_id': None, 'transaction_time': None}
+        for sink in template['sinks']}
 
     # After successful correlation remove dreadfort information from structured
     # data so that the client's token is scrubbed form the message.
     message['native'].pop('dreadfort', None)
     message.update({'dreadfort': {'tenant': tenant.tenant_id,
                                   'correlation': correlation_dict}})
+    return message
 
-    # If the message data indicates that the message has normalization rules
-    # that apply, Queue the message for normalization processing
-    if normalizer.should_normalize(message):
-        # send the message to normalization then route to sink
-        normalizer.normalize_message.delay(message)
-    else:
-        # Queue the message for indexing/storage
-        sinks.route_message(message)
+
+def _route_message_batch(messages):
+    """
+    Queue a batch of correlated messages for normalization or storage in bulk
+    """
+    normalize_messages = list()
+    normalize_inline_messages = list()
+    route_messages = list()
+
+    for message in messages:
+        if not normalizer.should_normalize(message):
+            route_messages.append(message)
+        elif normalizer.NORMALIZE_INLINE or sinks.use_fast_lane(message):
+            normalize_inline_messages.append(message)
+        else:
+            normalize_messages.append(message)
+
+    if normalize_inline_messages:
+        normalizer.normalize_message_batch(normalize_inline_messages)
+
+    if normalize_messages:
+        normalizer.normalize_message_batch.delay(normalize_messages)
+
+    if route_messages:
+        sinks.route_message_batch(route_messages)
 
 
 def _save_tenant_to_cache(tenant_id, tenant):
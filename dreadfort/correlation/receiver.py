@@ -1,5 +1,12 @@
+import os
+import threading
+import time
+
 from dreadfort import env
 from dreadfort.correlation import correlator
+from dreadfort import metrics
+from dreadfort.queue import celery
+from dreadfort import spool
 from dreadfort import transport
 
 from dreadfort.normalization.normalizer import *
@@ -7,22 +14,261 @@ from dreadfort.normalization.normalizer import *
 _LOG = env.get_logger(__name__)
 
 
+class BrokerCredit(object):
+
+    """
+    Credit based flow control for the correlation queue.  The credit is the
+    number of tasks that may still be queued before the broker queue holds
+    max_queued_tasks tasks.  It is refreshed from the depth of the broker
+    queue at most every credit_interval milliseconds, and every queued task
+    consumes one credit.  Each receiver process keeps its own credit, so the
+    queue may briefly exceed max_queued_tasks by up to one refresh worth of
+    tasks per receiver.
+    """
+
+    def __init__(self, max_queued_tasks=transport.MAX_QUEUED_TASKS,
+                 credit_interval=transport.CREDIT_INTERVAL, queue_name=None):
+        self.max_queued_tasks = max_queued_tasks
+        self.credit_interval = credit_interval / 1000.0
+        self.queue_name = queue_name or celery.conf.CELERY_DEFAULT_QUEUE
+        self.credit = 0
+        self._refreshed_at = 0
+        self._held_back_at = None
+        self._connection = None
+
+    @property
+    def enabled(self):
+        return self.max_queued_tasks > 0
+
+    def wait(self, timeout):
+        """
+        Wait up to timeout milliseconds for credit, returns True if a task
+        may be queued.  Always returns True when flow control is disabled.
+        The time from losing credit to getting it back is recorded across
+        calls, so it is measured however short the timeouts are.
+        """
+        if not self.enabled:
+            return True
+
+        deadline = time.time() + timeout / 1000.0
+        self._refresh()
+
+        while self.credit <= 0:
+            if self._held_back_at is None:
+                self._held_back_at = time.time()
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+
+            time.sleep(min(self.credit_interval, remaining))
+            self._refresh()
+
+        if self._held_back_at is not None:
+            # record how long the receiver was held back by the broker
+            metrics.observe('transport.credit_wait',
+                            time.time() - self._held_back_at)
+            self._held_back_at = None
+
+        return True
+
+    def consume(self):
+        """
+        Consume the credit of a queued task
+        """
+        self.credit -= 1
+
+    def _refresh(self):
+        now = time.time()
+        if now - self._refreshed_at < self.credit_interval:
+            return
+
+        self._refreshed_at = now
+        depth = self._get_queue_depth()
+        if depth is None:
+            # hold back messages while the broker can not be reached
+            self.credit = 0
+            return
+
+        metrics.gauge('correlation.queue_depth', depth)
+        self.credit = self.max_queued_tasks - depth
+
+    def _get_queue_depth(self):
+        try:
+            if self._connection is None:
+                self._connection = celery.connection()
+            return self._connection.default_channel.queue_declare(
+                queue=self.queue_name, passive=True)[1]
+        except Exception as ex:
+            _LOG.exception(ex)
+            if self._connection is not None:
+                self._connection.release()
+                self._connection = None
+            return None
+
+
+class SpoolDrainer(threading.Thread):
+
+    """
+    A daemon thread that replays the batches of a spool, in the order they
+    were spooled, as correlation tasks.  It queues tasks as fast as the
+    flow control credit allows, and retries a batch until the broker
+    accepts it.
+    """
+
+    def __init__(self, spool, credit=None, retry_interval=1.0):
+        super(SpoolDrainer, self).__init__()
+        self.daemon = True
+        self.spool = spool
+        self.credit = credit or BrokerCredit()
+        self.retry_interval = retry_interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.replay()
+
+    def replay(self):
+        """
+        Replays the oldest spooled batch, returns True if it was queued
+        """
+        msgs = self.spool.peek()
+        if msgs is None:
+            self.spool.wait(transport.POLL_INTERVAL / 1000.0)
+            return False
+
+        if not self.credit.wait(transport.POLL_INTERVAL):
+            return False
+
+        try:
+            correlator.correlate_message_batch.delay(msgs)
+        except Exception:
+            _LOG.exception('unable to replay spooled correlation task')
+            self._stopped.wait(self.retry_interval)
+            return False
+
+        self.spool.commit()
+        self.credit.consume()
+        metrics.increment('spool.replayed_messages', len(msgs))
+        return True
+
+    def stop(self):
+        self._stopped.set()
+
+
 class CorrelationInputServer(transport.ZeroMQInputServer):
 
+    """
+    Pulls batches of syslog messages and queues each batch as a single
+    correlation task.  When flow control is enabled, messages are only
+    pulled while the correlation queue has room for another task, so that a
+    slow broker pushes back on the upstream hosts through the socket high
+    water marks instead of piling messages up in memory.
+
+    When the server has a spool, messages keep being pulled while the
+    broker is unavailable or backed up, and are written to the spool
+    instead.  Once anything is spooled, new batches are spooled as well
+    until a SpoolDrainer has replayed the spool, so that batches are queued
+    in the order they were received.
+    """
+
+    def __init__(self, zmq_receiver, credit=None, spool=None, **kwargs):
+        super(CorrelationInputServer, self).__init__(zmq_receiver, **kwargs)
+        self.credit = credit or BrokerCredit()
+        self.spool = spool
+        self.drainer = None
+
+    def start(self):
+        """
+        Open the spool and start its drainer in the process the server runs
+        in, then run the server IO loop
+        """
+        if self.spool is not None:
+            self.spool.open()
+            self.drainer = SpoolDrainer(self.spool)
+            self.drainer.start()
+
+        try:
+            super(CorrelationInputServer, self).start()
+        finally:
+            if self.drainer is not None:
+                self.drainer.stop()
+                self.drainer.join()
+                self.spool.close()
+
     def process_msg(self):
-        msg = self._get_msg()
+        if self.spool is None:
+            if not self.credit.wait(0):
+                # control commands and drains are still handled while the
+                # broker holds the server back
+                self._idle(transport.CREDIT_INTERVAL)
+                return
+            has_credit = True
+        else:
+            has_credit = self.credit.wait(0)
+
+        msgs = self._get_msg_batch()
+        if not msgs:
+            return
+
+        if self.spool is not None and (not has_credit or
+                                       not self.spool.empty):
+            self._spool_msgs(msgs)
+            return
 
         try:
-            # Queue the message for correlation
-            correlator.correlate_syslog_message.delay(msg)
+            # Queue the messages for correlation as a single batch
+            correlator.correlate_message_batch.delay(msgs)
+            self.credit.consume()
+            metrics.increment('transport.received_messages', len(msgs))
         except Exception:
-            _LOG.exception('unable to place persist_message task on queue')
+            _LOG.exception('unable to place correlation task on queue')
+            if self.spool is not None:
+                self._spool_msgs(msgs)
+            else:
+                metrics.increment('transport.dropped_messages', len(msgs))
+
+    def _spool_msgs(self, msgs):
+        if self.spool.append(msgs):
+            metrics.increment('transport.received_messages', len(msgs))
+        else:
+            metrics.increment('transport.dropped_messages', len(msgs))
 
 
-def new_correlation_input_server():
+def _control_host_tuple(index):
+    if not transport.CONTROL_HOST:
+        return None
+    host, port = transport.CONTROL_HOST.split(':')
+    return host, int(port) + index
+
+
+def new_correlation_input_server(index=0):
     """
     Create a correlation input server for receiving json messages form the
-    syslog parser of ZeroMQ
+    syslog parser of ZeroMQ.  The index of the server in its pool selects
+    the port of its control socket and the directory of its spool.
     """
     zmq_receiver = transport.new_zmq_receiver()
-    return CorrelationInputServer(zmq_receiver)
+
+    priority_receivers = list()
+    if transport.PRIORITY_UPSTREAM_HOSTS:
+        priority_receivers.append(transport.new_zmq_receiver(
+            transport.PRIORITY_UPSTREAM_HOSTS))
+
+    server_spool = None
+    if spool.ENABLED:
+        server_spool = spool.Spool(os.path.join(spool.SPOOL_DIR, str(index)))
+
+    return CorrelationInputServer(
+        zmq_receiver, spool=server_spool,
+        priority_receivers=priority_receivers,
+        control_host_tuple=_control_host_tuple(index))
+
+
+def new_correlation_input_servers(count=transport.RECEIVERS):
+    """
+    Create a pool of correlation input servers, each with its own receivers
+    connected to all upstream hosts so that the ZeroMQ PULL sockets share the
+    load of the syslog parser
+    """
+    return [new_correlation_input_server(index) for index in range(count)]
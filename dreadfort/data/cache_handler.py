@@ -1,11 +1,14 @@
+import time
+
 from oslo.config import cfg
 
+from dreadfort import codec
 from dreadfort.config import get_config
 from dreadfort.config import init_config
-from dreadfort.data.model.tenant import (
-    load_tenant_from_dict, load_token_from_dict)
+from dreadfort.data import cache_record
+from dreadfort.data.local_cache import LocalCache
 from dreadfort.data.model.worker import WorkerConfiguration
-from dreadfort.openstack.common import jsonutils
+from dreadfort import metrics
 from dreadfort.proxy import NativeProxy
 
 
@@ -33,6 +36,27 @@ _CACHE_OPTIONS = [
     cfg.StrOpt('cache_token',
                default='cache-token',
                help="""The name of the cache to store worker config values"""
+               ),
+    cfg.IntOpt('local_items',
+               default=1000,
+               help="""Maximum number of deserialized tenants and tokens
+               to keep in process memory, 0 disables the local cache"""
+               ),
+    cfg.IntOpt('grace_expires',
+               default=0,
+               help="""time an expired tenant or token is still served while
+               it is refreshed in the background, 0 disables serving stale
+               tenants and tokens"""
+               ),
+    cfg.IntOpt('negative_expires',
+               default=30,
+               help="""time to remember unknown tenants and invalid
+               message tokens"""
+               ),
+    cfg.IntOpt('negative_items',
+               default=10000,
+               help="""Maximum number of unknown tenants and invalid message
+               tokens to remember, 0 disables negative caching"""
                )
 ]
 
@@ -48,6 +72,138 @@ CONFIG_EXPIRES = conf.cache.config_expires
 CACHE_CONFIG = conf.cache.cache_config
 CACHE_TENANT = conf.cache.cache_tenant
 CACHE_TOKEN = conf.cache.cache_token
+LOCAL_ITEMS = conf.cache.local_items
+GRACE_EXPIRES = conf.cache.grace_expires
+NEGATIVE_EXPIRES = conf.cache.negative_expires
+NEGATIVE_ITEMS = conf.cache.negative_items
+
+# process local caches of ready made Tenant and Token objects that sit in
+# front of the shared cache
+_local_tenants = LocalCache(LOCAL_ITEMS, DEFAULT_EXPIRES, GRACE_EXPIRES)
+_local_tokens = LocalCache(LOCAL_ITEMS, DEFAULT_EXPIRES, GRACE_EXPIRES)
+
+# process local caches of tenants that do not exist and of message tokens
+# that failed validation
+_rejected_tenants = LocalCache(NEGATIVE_ITEMS, NEGATIVE_EXPIRES)
+_rejected_tokens = LocalCache(NEGATIVE_ITEMS, NEGATIVE_EXPIRES)
+
+
+# called with the tenant_id of every stale tenant or token that is served
+_stale_handler = None
+
+
+def set_stale_handler(handler):
+    """
+    Sets the function called with the tenant_id of each stale tenant or
+    token returned from the cache, which is expected to refresh it
+    """
+    global _stale_handler
+    _stale_handler = handler
+
+
+def _fresh_until():
+    return time.time() + DEFAULT_EXPIRES if DEFAULT_EXPIRES else 0
+
+
+def _shared_expires():
+    # entries stay in the shared cache for the grace period after they go
+    # stale
+    return DEFAULT_EXPIRES + GRACE_EXPIRES if DEFAULT_EXPIRES else 0
+
+
+def _served_stale(kind, tenant_id):
+    metrics.increment('cache.{0}.stale_hit'.format(kind))
+    if _stale_handler:
+        _stale_handler(tenant_id)
+
+
+def _load(local_cache, key, record, decode, kind):
+    """
+    Decodes a record of the shared cache and keeps its object in the process
+    local cache until the record goes stale.  Returns a tuple of the object,
+    or None, and whether it is stale.
+    """
+    if record is None:
+        return None, False
+
+    # a record that can not be decoded, such as one written by another
+    # version of dreadfort, is a miss and is replaced on the next set
+    value = decode(record)
+    if value is None:
+        metrics.increment('cache.{0}.unreadable'.format(kind))
+        return None, False
+
+    fresh_until = cache_record.read_fresh_until(record)
+    local_cache.set(key, value, expires_at=fresh_until)
+    return value, bool(
+        GRACE_EXPIRES and fresh_until and fresh_until <= time.time())
+
+
+def _get(cache, local_cache, key, cache_name, decode, kind):
+    value, stale = local_cache.lookup(key)
+    if value:
+        metrics.increment('cache.{0}.local_hit'.format(kind))
+    else:
+        value, stale = _load(
+            local_cache, key, cache.cache_get_or_none(key, cache_name),
+            decode, kind)
+        if not value:
+            metrics.increment('cache.{0}.miss'.format(kind))
+            return None
+        metrics.increment('cache.{0}.hit'.format(kind))
+
+    if stale:
+        _served_stale(kind, key)
+    return value
+
+
+def _get_many(cache, local_cache, keys, cache_name, decode, kind):
+    values = dict()
+    missing_keys = list()
+    stale_keys = list()
+
+    for key in keys:
+        value, stale = local_cache.lookup(key)
+        if value:
+            values[key] = value
+            if stale:
+                stale_keys.append(key)
+        else:
+            missing_keys.append(key)
+
+    if values:
+        metrics.increment('cache.{0}.local_hit'.format(kind), len(values))
+
+    if missing_keys:
+        hits = 0
+        cached = cache.cache_get_many(missing_keys, cache_name)
+        for key, record in cached.iteritems():
+            value, stale = _load(local_cache, key, record, decode, kind)
+            if value:
+                values[key] = value
+                hits += 1
+                if stale:
+                    stale_keys.append(key)
+
+        if hits:
+            metrics.increment('cache.{0}.hit'.format(kind), hits)
+        if len(missing_keys) > hits:
+            metrics.increment(
+                'cache.{0}.miss'.format(kind), len(missing_keys) - hits)
+
+    for key in stale_keys:
+        _served_stale(kind, key)
+    return values
+
+
+def _get_fresh(cache, local_cache, key, cache_name, decode, kind):
+    # the shared cache may hold a newer record than the process local cache
+    value, stale = _load(
+        local_cache, key, cache.cache_get_or_none(key, cache_name),
+        decode, kind)
+    if stale:
+        return None
+    return value
 
 
 class Cache(object):
@@ -65,83 +221,140 @@ class ConfigCache(Cache):
         self.cache.cache_clear(CACHE_CONFIG)
 
     def set_config(self, worker_config):
-        if self.cache.cache_exists('worker_configuration', CACHE_CONFIG):
-            self.cache.cache_update(
-                'worker_configuration',
-                jsonutils.dumps(worker_config.format()),
-                CONFIG_EXPIRES, CACHE_CONFIG)
-        else:
-            self.cache.cache_set(
-                'worker_configuration',
-                jsonutils.dumps(worker_config.format()),
-                CONFIG_EXPIRES, CACHE_CONFIG)
+        self.cache.cache_upsert(
+            'worker_configuration',
+            codec.dumps(worker_config.format()),
+            CONFIG_EXPIRES, CACHE_CONFIG)
 
     def get_config(self):
-        if self.cache.cache_exists('worker_configuration', CACHE_CONFIG):
-            config = jsonutils.loads(
-                self.cache.cache_get('worker_configuration', CACHE_CONFIG))
-            worker_config = WorkerConfiguration(**config)
-            return worker_config
-        return None
+        config = self.cache.cache_get_or_none(
+            'worker_configuration', CACHE_CONFIG)
+        if config is None:
+            return None
+        return WorkerConfiguration(**codec.loads(config))
 
     def delete_config(self):
-        if self.cache.cache_exists('worker_configuration', CACHE_CONFIG):
-            self.cache.cache_del('worker_configuration', CACHE_CONFIG)
+        self.cache.cache_del('worker_configuration', CACHE_CONFIG)
 
 
 class TenantCache(Cache):
 
+    """
+    Caches Tenant objects.  Tenants are kept both in the shared cache and in
+    a process local cache, so that a hot tenant is returned without being
+    deserialized.  Tenants returned from the cache are shared and must not
+    be modified.  When a grace period is configured, an expired tenant is
+    still returned for the grace period and the stale handler is called to
+    refresh it.
+    """
+
     def clear(self):
+        _local_tenants.clear()
         self.cache.cache_clear(CACHE_TENANT)
 
     def set_tenant(self, tenant):
-        if self.cache.cache_exists(tenant.tenant_id, CACHE_TENANT):
-            self.cache.cache_update(
-                tenant.tenant_id, jsonutils.dumps(tenant.format()),
-                DEFAULT_EXPIRES, CACHE_TENANT)
-        else:
-            self.cache.cache_set(
-                tenant.tenant_id, jsonutils.dumps(tenant.format()),
-                DEFAULT_EXPIRES, CACHE_TENANT)
+        fresh_until = _fresh_until()
+        _local_tenants.set(tenant.tenant_id, tenant, expires_at=fresh_until)
+        self.cache.cache_upsert(
+            tenant.tenant_id, cache_record.encode_tenant(tenant, fresh_until),
+            _shared_expires(), CACHE_TENANT)
 
     def get_tenant(self, tenant_id):
-        if self.cache.cache_exists(tenant_id, CACHE_TENANT):
-            tenant_dict = jsonutils.loads(
-                self.cache.cache_get(tenant_id, CACHE_TENANT))
-            tenant = load_tenant_from_dict(tenant_dict)
-            return tenant
+        return _get(self.cache, _local_tenants, tenant_id, CACHE_TENANT,
+                    cache_record.decode_tenant, 'tenant')
 
-        return None
+    def get_tenants(self, tenant_ids):
+        """
+        Returns a dictionary of the cached tenants among tenant_ids, looking
+        up the tenants missing from the process local cache in one pass
+        """
+        return _get_many(self.cache, _local_tenants, tenant_ids,
+                         CACHE_TENANT, cache_record.decode_tenant, 'tenant')
+
+    def get_fresh_tenant(self, tenant_id):
+        """
+        Returns a tenant from the shared cache if it is not stale, replacing
+        the copy in the process local cache, or None
+        """
+        return _get_fresh(self.cache, _local_tenants, tenant_id,
+                          CACHE_TENANT, cache_record.decode_tenant, 'tenant')
 
     def delete_tenant(self, tenant_id):
-        if self.cache.cache_exists(tenant_id, CACHE_TENANT):
-            self.cache.cache_del(tenant_id, CACHE_TENANT)
+        _local_tenants.delete(tenant_id)
+        self.cache.cache_del(tenant_id, CACHE_TENANT)
 
 
 class TokenCache(Cache):
 
+    """
+    Caches Token objects by tenant_id, in the shared cache and in a process
+    local cache.  Expired tokens are served stale like tenants.
+    """
+
     def clear(self):
+        _local_tokens.clear()
         self.cache.cache_clear(CACHE_TOKEN)
 
     def set_token(self, tenant_id, token):
-
-        if self.cache.cache_exists(tenant_id, CACHE_TOKEN):
-            self.cache.cache_update(
-                tenant_id, jsonutils.dumps(token.format()),
-                DEFAULT_EXPIRES, CACHE_TOKEN)
-        else:
-            self.cache.cache_set(
-                tenant_id, jsonutils.dumps(token.format()),
-                DEFAULT_EXPIRES, CACHE_TOKEN)
+        fresh_until = _fresh_until()
+        _local_tokens.set(tenant_id, token, expires_at=fresh_until)
+        self.cache.cache_upsert(
+            tenant_id, cache_record.encode_token(token, fresh_until),
+            _shared_expires(), CACHE_TOKEN)
 
     def get_token(self, tenant_id):
-        if self.cache.cache_exists(tenant_id, CACHE_TOKEN):
-            token_dict = jsonutils.loads(
-                self.cache.cache_get(tenant_id, CACHE_TOKEN))
-            token = load_token_from_dict(token_dict)
-            return token
-        return None
+        return _get(self.cache, _local_tokens, tenant_id, CACHE_TOKEN,
+                    cache_record.decode_token, 'token')
+
+    def get_tokens(self, tenant_ids):
+        """
+        Returns a dictionary of the cached tokens among tenant_ids, looking
+        up the tokens missing from the process local cache in one pass
+        """
+        return _get_many(self.cache, _local_tokens, tenant_ids, CACHE_TOKEN,
+                         cache_record.decode_token, 'token')
+
+    def get_fresh_token(self, tenant_id):
+        """
+        Returns a token from the shared cache if it is not stale, replacing
+        the copy in the process local cache, or None
+        """
+        return _get_fresh(self.cache, _local_tokens, tenant_id, CACHE_TOKEN,
+                          cache_record.decode_token, 'token')
 
     def delete_token(self, tenant_id):
-        if self.cache.cache_exists(tenant_id, CACHE_TOKEN):
-            self.cache.cache_del(tenant_id, CACHE_TOKEN)
+        _local_tokens.delete(tenant_id)
+        self.cache.cache_del(tenant_id, CACHE_TOKEN)
+
+
+class RejectionCache(object):
+
+    """
+    Remembers unknown tenants and invalid message tokens for a short time so
+    that messages from misconfigured clients are rejected locally instead of
+    calling the coordinator for every message.
+    """
+
+    def clear(self):
+        _rejected_tenants.clear()
+        _rejected_tokens.clear()
+
+    def reject_tenant(self, tenant_id):
+        _rejected_tenants.set(tenant_id, True)
+
+    def is_tenant_rejected(self, tenant_id):
+        return _rejected_tenants.get(tenant_id) is not None
+
+    def reject_token(self, tenant_id, message_token):
+        _rejected_tokens.set((tenant_id, message_token), True)
+
+    def is_token_rejected(self, tenant_id, message_token):
+        return _rejected_tokens.get((tenant_id, message_token)) is not None
+
+    def forget_tenant(self, tenant_id):
+        """
+        Removes a tenant and its message tokens from the rejections, once the
+        tenant has been created or changed
+        """
+        _rejected_tenants.delete(tenant_id)
+        _rejected_tokens.delete_matching(lambda key: key[0] == tenant_id)
@@ -0,0 +1,257 @@
+"""
+The cache_record module encodes tenants and tokens as compact binary records
+for the tenant and token caches.  A record is decoded with a few struct
+calls, without parsing JSON or building an intermediate dictionary, and is
+smaller than its JSON so that more tenants fit in a cache of a fixed size.
+
+A record starts with a header holding a magic string, the version of the
+format, the kind of object it encodes and the time until which the object
+is fresh, after which it is served stale while it is refreshed.  It is
+followed by a string table and a body that refers to the strings by their
+index in the table.  Strings are interned, so the sink names and patterns
+that the event producers of a tenant share are stored once.  A record that
+can not be decoded, such as one written in another version of the format,
+is treated as a cache miss.
+"""
+
+import struct
+
+from dreadfort.data.model.tenant import EventProducer
+from dreadfort.data.model.tenant import Tenant
+from dreadfort.data.model.tenant import Token
+
+
+MAGIC = 'DR'
+VERSION = 2
+
+KIND_TENANT = 1
+KIND_TOKEN = 2
+
+# the largest number of strings in a record, index 0 of the string table
+# stands for None
+_MAX_STRINGS = 0xffff
+
+# event producer flags
+_DURABLE = 0x01
+_ENCRYPTED = 0x02
+_INT_ID = 0x04
+
+# magic, version, kind, fresh until, number of strings, length of the
+# strings
+_HEADER = struct.Struct('!2sBBdHI')
+# valid, previous, last changed
+_TOKEN = struct.Struct('!HHH')
+# tenant id, tenant name, number of producers, number of sinks
+_TENANT = struct.Struct('!HHHH')
+# id, name, pattern, flags, number of sinks
+_PRODUCER = 'qHHBH'
+_PRODUCER_FIELDS = len(_PRODUCER)
+_PRODUCER_SIZE = struct.calcsize('!' + _PRODUCER)
+
+
+class _StringTable(object):
+
+    """
+    The strings of a record being encoded, each stored once
+    """
+
+    def __init__(self):
+        self.strings = list()
+        self._indexes = {None: 0}
+
+    def index(self, value):
+        if isinstance(value, str):
+            value = value.decode('utf-8')
+        elif value is not None and not isinstance(value, unicode):
+            value = unicode(value)
+
+        index = self._indexes.get(value)
+        if index is None:
+            index = len(self._indexes)
+            if index > _MAX_STRINGS:
+                raise ValueError('Too many strings for a cache record')
+            self._indexes[value] = index
+            self.strings.append(value)
+        return index
+
+    def pack(self, kind, fresh_until, body):
+        # the lengths are in characters, so that all of the strings are
+        # decoded at once and then sliced apart
+        lengths = struct.pack(
+            '!{0}I'.format(len(self.strings)),
+            *[len(value) for value in self.strings])
+        strings = u''.join(self.strings).encode('utf-8')
+        return ''.join([
+            _HEADER.pack(
+                MAGIC, VERSION, kind, fresh_until, len(self.strings),
+                len(strings)),
+            lengths, strings] + body)
+
+
+def _unpack_strings(record, kind):
+    """
+    Returns the strings of a record, starting with None, and the offset of
+    its body, or a tuple of None if the record is not of the given kind and
+    version
+    """
+    if len(record) < _HEADER.size:
+        return None, None
+
+    magic, version, record_kind, fresh_until, count, size = \
+        _HEADER.unpack_from(record)
+    if magic != MAGIC or version != VERSION or record_kind != kind:
+        return None, None
+
+    offset = _HEADER.size
+    lengths = struct.unpack_from('!{0}I'.format(count), record, offset)
+    offset += 4 * count
+    text = record[offset:offset + size].decode('utf-8')
+    offset += size
+
+    strings = [None]
+    start = 0
+    for length in lengths:
+        strings.append(text[start:start + length])
+        start += length
+    return strings, offset
+
+
+def read_fresh_until(record):
+    """
+    Returns the time until which the object of a record is fresh, 0 if it
+    never goes stale, or None if the record can not be decoded
+    """
+    try:
+        magic, version, kind, fresh_until, count, size = \
+            _HEADER.unpack_from(record)
+    except struct.error:
+        return None
+    if magic != MAGIC or version != VERSION:
+        return None
+    return fresh_until
+
+
+def _pack_token(strings, token):
+    return _TOKEN.pack(
+        strings.index(token.valid),
+        strings.index(token.previous),
+        strings.index(token.last_changed))
+
+
+def _unpack_token(strings, record, offset):
+    valid, previous, last_changed = _TOKEN.unpack_from(record, offset)
+    return Token(strings[valid], strings[previous], strings[last_changed])
+
+
+def encode_token(token, fresh_until=0):
+    """
+    Returns the cache record of a Token that is fresh until the given time
+    """
+    strings = _StringTable()
+    body = _pack_token(strings, token)
+    return strings.pack(KIND_TOKEN, fresh_until, [body])
+
+
+def decode_token(record):
+    """
+    Returns the Token of a cache record, or None if the record can not be
+    decoded
+    """
+    try:
+        strings, offset = _unpack_strings(record, KIND_TOKEN)
+        if strings is None:
+            return None
+        return _unpack_token(strings, record, offset)
+    except (struct.error, IndexError, UnicodeDecodeError):
+        return None
+
+
+def encode_tenant(tenant, fresh_until=0):
+    """
+    Returns the cache record of a Tenant and its Token and event producers
+    that is fresh until the given time.
+    The fields of all event producers are followed by the sinks of all
+    event producers, so each is unpacked with a single call.
+    """
+    strings = _StringTable()
+    producers = list()
+    sinks = list()
+
+    for producer in tenant.event_producers:
+        producer_id = producer.get_id()
+        flags = 0
+        if producer.durable:
+            flags |= _DURABLE
+        if producer.encrypted:
+            flags |= _ENCRYPTED
+
+        if isinstance(producer_id, (int, long)) and \
+                not isinstance(producer_id, bool):
+            flags |= _INT_ID
+        else:
+            producer_id = strings.index(producer_id)
+
+        producers.extend([
+            producer_id,
+            strings.index(producer.name),
+            strings.index(producer.pattern),
+            flags,
+            len(producer.sinks)])
+        sinks.extend(strings.index(sink) for sink in producer.sinks)
+
+    body = [
+        _TENANT.pack(
+            strings.index(tenant.tenant_id),
+            strings.index(tenant.tenant_name),
+            len(tenant.event_producers),
+            len(sinks)),
+        _pack_token(strings, tenant.token),
+        struct.pack(
+            '!' + _PRODUCER * len(tenant.event_producers), *producers),
+        struct.pack('!{0}H'.format(len(sinks)), *sinks)]
+
+    return strings.pack(KIND_TENANT, fresh_until, body)
+
+
+def decode_tenant(record):
+    """
+    Returns the Tenant of a cache record, or None if the record can not be
+    decoded
+    """
+    try:
+        strings, offset = _unpack_strings(record, KIND_TENANT)
+        if strings is None:
+            return None
+
+        tenant_id, tenant_name, producer_count, sink_count = \
+            _TENANT.unpack_from(record, offset)
+        offset += _TENANT.size
+        token = _unpack_token(strings, record, offset)
+        offset += _TOKEN.size
+
+        producers = struct.unpack_from(
+            '!' + _PRODUCER * producer_count, record, offset)
+        offset += _PRODUCER_SIZE * producer_count
+        sinks = [strings[sink] for sink in struct.unpack_from(
+            '!{0}H'.format(sink_count), record, offset)]
+
+        event_producers = list()
+        first_sink = 0
+        for field in xrange(0, len(producers), _PRODUCER_FIELDS):
+            producer_id, name, pattern, flags, producer_sinks = \
+                producers[field:field + _PRODUCER_FIELDS]
+            if not flags & _INT_ID:
+                producer_id = strings[producer_id]
+
+            event_producers.append(EventProducer(
+                producer_id, strings[name], strings[pattern],
+                bool(flags & _DURABLE), bool(flags & _ENCRYPTED),
+                sinks[first_sink:first_sink + producer_sinks]))
+            first_sink += producer_sinks
+
+        return Tenant(
+            strings[tenant_id], token,
+            event_producers=event_producers,
+            tenant_name=strings[tenant_name])
+    except (struct.error, IndexError, UnicodeDecodeError):
+        return None
@@ -0,0 +1,170 @@
+"""
+The invalidation module pushes tenant changes from the coordinator to the
+workers, so that workers evict cached tenants and tokens as soon as they
+change instead of waiting for the cache entries to expire.
+
+Coordinator processes publish the id of a changed tenant to a forwarder
+running on the coordinator host.  Every worker process that caches tenants
+runs a listener thread that subscribes to the forwarders of all
+coordinators and evicts the tenant and token of each tenant id it receives.
+"""
+
+import os
+import threading
+
+from oslo.config import cfg
+
+from dreadfort import config
+from dreadfort.data import cache_handler
+from dreadfort import env
+from dreadfort import transport
+
+
+_LOG = env.get_logger(__name__)
+
+# Invalidation configuration options
+_INVALIDATION_GROUP = cfg.OptGroup(
+    name='invalidation', title='Cache Invalidation Options')
+config.get_config().register_group(_INVALIDATION_GROUP)
+
+_INVALIDATION_OPTIONS = [
+    cfg.BoolOpt('enabled',
+                default=False,
+                help="""publish tenant changes from the coordinator and
+                evict changed tenants from worker caches"""
+                ),
+    cfg.StrOpt('publish_host',
+               default='127.0.0.1:5101',
+               help="""host:port of the forwarder that coordinator processes
+               publish tenant changes to"""
+               ),
+    cfg.StrOpt('broadcast_host',
+               default='0.0.0.0:5102',
+               help="""host:port the forwarder binds for worker
+               subscriptions"""
+               ),
+    cfg.ListOpt('coordinator_hosts',
+                default=['127.0.0.1:5102'],
+                help="""list of coordinator host:port pairs that workers
+                subscribe to for tenant changes"""
+                )
+]
+
+config.get_config().register_opts(
+    _INVALIDATION_OPTIONS, group=_INVALIDATION_GROUP)
+
+try:
+    config.init_config()
+except config.cfg.ConfigFilesNotFoundError as ex:
+    _LOG.exception(ex.message)
+
+_CONF = config.get_config()
+
+ENABLED = _CONF.invalidation.enabled
+
+TENANT_TOPIC = 'tenant'
+
+# the publisher and listener are created once per process, and are
+# recreated in a child process after a fork
+_publisher = None
+_publisher_pid = None
+_listener = None
+_listener_pid = None
+_lock = threading.Lock()
+
+
+def _host_tuple(host_port_str):
+    return host_port_str.split(':')
+
+
+def publish_tenant_change(tenant_id):
+    """
+    Publish that a tenant has changed.  Publishing is best effort, the cache
+    expiry remains the fallback for changes that are not delivered.
+    """
+    global _publisher, _publisher_pid
+
+    if not ENABLED:
+        return
+
+    with _lock:
+        if _publisher_pid != os.getpid():
+            _publisher = transport.ZeroMQPublisher(
+                _host_tuple(_CONF.invalidation.publish_host))
+            _publisher.connect()
+            # the forwarder drops messages published before its
+            # subscriptions reach the new socket
+            if not _publisher.wait_for_subscription(
+                    transport.POLL_INTERVAL):
+                _LOG.warning('No subscription from the invalidation '
+                             'forwarder, tenant changes may be lost')
+            _publisher_pid = os.getpid()
+
+        _publisher.publish(TENANT_TOPIC, str(tenant_id))
+
+
+def new_forwarder():
+    """
+    Create a forwarder that relays tenant changes from the coordinator
+    processes on this host to the subscribed workers
+    """
+    return transport.ZeroMQForwarder(
+        _host_tuple(_CONF.invalidation.publish_host),
+        _host_tuple(_CONF.invalidation.broadcast_host))
+
+
+def evict_tenant(tenant_id):
+    """
+    Remove a tenant and its token from the tenant and token caches, and
+    forget that the tenant or its message tokens were rejected
+    """
+    cache_handler.TenantCache().delete_tenant(tenant_id)
+    cache_handler.TokenCache().delete_token(tenant_id)
+    cache_handler.RejectionCache().forget_tenant(tenant_id)
+
+
+class TenantChangeListener(threading.Thread):
+
+    """
+    A daemon thread that receives tenant changes and evicts the changed
+    tenants from the caches of the process it runs in
+    """
+
+    def __init__(self, subscriber):
+        super(TenantChangeListener, self).__init__()
+        self.daemon = True
+        self.subscriber = subscriber
+
+    def run(self):
+        self.subscriber.connect()
+
+        while True:
+            try:
+                topic, tenant_id = self.subscriber.get()
+                evict_tenant(tenant_id)
+            except Exception as ex:
+                _LOG.exception(ex)
+
+
+def start_listener():
+    """
+    Start the tenant change listener of the current process if invalidation
+    is enabled and the listener is not already running.  This is safe to
+    call for every message, it only starts a thread once per process.
+    """
+    global _listener, _listener_pid
+
+    if not ENABLED or _listener_pid == os.getpid():
+        return
+
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+
+        subscriber = transport.ZeroMQSubscriber(
+            [_host_tuple(host)
+             for host in _CONF.invalidation.coordinator_hosts],
+            [TENANT_TOPIC])
+        _listener = TenantChangeListener(subscriber)
+        _listener.start()
+        _listener_pid = os.getpid()
@@ -0,0 +1,113 @@
+"""
+The local_cache module provides a process local, size bounded cache with
+least recently used eviction and per key expiry.  It is used to keep ready
+made objects in memory so that frequently used entries do not have to be
+deserialized from the shared cache on every lookup.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class LocalCache(object):
+
+    """
+    A thread safe LRU cache where every entry expires after a set number of
+    seconds.  When the cache holds max_items entries, the least recently used
+    entry is evicted to make room for a new one.  An expired entry is kept
+    as a stale entry for a further grace number of seconds.
+    """
+
+    def __init__(self, max_items, expires, grace=0):
+        """
+        Creates a new LocalCache
+
+        :param max_items: maximum number of entries to hold, a value of 0
+        disables the cache
+        :param expires: default number of seconds an entry is kept, a value
+        of 0 keeps entries until they are evicted
+        :param grace: number of seconds an expired entry is still returned
+        as a stale entry
+        """
+        self.max_items = max_items
+        self.expires = expires
+        self.grace = grace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value stored for a key, or None if the key is not cached
+        or its entry has expired beyond the grace period
+        """
+        return self.lookup(key)[0]
+
+    def lookup(self, key):
+        """
+        Returns a tuple of the value stored for a key and whether its entry
+        has expired and is only kept for the grace period.  The value is
+        None if the key is not cached.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None, False
+
+            expires_at, value = entry
+            now = time.time()
+            if expires_at and expires_at + self.grace <= now:
+                return None, False
+
+            # re-insert the entry to mark it as most recently used
+            self._entries[key] = entry
+            return value, bool(expires_at and expires_at <= now)
+
+    def set(self, key, value, expires=None, expires_at=None):
+        """
+        Stores a value for a key, evicting the least recently used entries
+        when the cache is full
+
+        :param expires: number of seconds the entry is kept, the default
+        expiry of the cache if None
+        :param expires_at: time at which the entry expires, instead of a
+        number of seconds
+        """
+        if self.max_items <= 0:
+            return
+
+        if expires_at is None:
+            if expires is None:
+                expires = self.expires
+            expires_at = time.time() + expires if expires else 0
+
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.max_items:
+                self._entries.popitem(last=False)
+            self._entries[key] = (expires_at, value)
+
+    def delete(self, key):
+        """
+        Removes a key from the cache
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_matching(self, match):
+        """
+        Removes the keys for which match(key) returns True
+        """
+        with self._lock:
+            for key in [key for key in self._entries if match(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        """
+        Removes all entries from the cache
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
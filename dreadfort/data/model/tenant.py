@@ -91,7 +91,11 @@ class Tenant(object):
 
     """
     Tenants are users of the environments being monitored for
-    application events.
+    application events.  A tenant indexes its event producers by id and by
+    name, so event producers must be added, removed, renamed and updated
+    through the tenant to keep the indexes up to date.  The correlation
+    templates of the event producers are built when the tenant is loaded and
+    rebuilt whenever an event producer changes.
     """
 
     def __init__(self, tenant_id, token, event_producers=None,
@@ -108,10 +112,113 @@ class Tenant(object):
         self.token = token
         self.event_producers = event_producers
         self.tenant_name = tenant_name
+        self._index_event_producers()
 
     def get_id(self):
         return self._id
 
+    def _index_event_producers(self):
+        """
+        Builds the id and name indexes of the tenant's event producers.  When
+        producers share an id or name, the first one in the list is indexed.
+        """
+        self._producers_by_id = dict()
+        self._producers_by_name = dict()
+
+        for producer in self.event_producers:
+            self._producers_by_id.setdefault(producer.get_id(), producer)
+            self._producers_by_name.setdefault(producer.name, producer)
+
+        self._build_correlation_templates()
+
+    def _build_correlation_templates(self):
+        """
+        Builds the correlation template of each indexed event producer, and
+        the template of a default producer that unknown producer names share
+        so that they can not grow the templates
+        """
+        self._correlation_templates = dict(
+            (name, self._correlation_template(producer))
+            for name, producer in self._producers_by_name.iteritems())
+        self._correlation_templates[None] = self._correlation_template(
+            EventProducer(_id=None, name="default", pattern="default"))
+
+    def _correlation_template(self, producer):
+        return {
+            'tenant_name': self.tenant_name,
+            'ep_id': producer.get_id(),
+            'pattern': producer.pattern,
+            'durable': producer.durable,
+            'encrypted': producer.encrypted,
+            'sinks': producer.sinks
+        }
+
+    def add_event_producer(self, event_producer):
+        """
+        Adds an event producer to the tenant
+        """
+        self.event_producers.append(event_producer)
+        self._producers_by_id.setdefault(
+            event_producer.get_id(), event_producer)
+        self._producers_by_name.setdefault(
+            event_producer.name, event_producer)
+        self._build_correlation_templates()
+
+    def remove_event_producer(self, event_producer):
+        """
+        Removes an event producer from the tenant
+        """
+        self.event_producers.remove(event_producer)
+        self._index_event_producers()
+
+    def rename_event_producer(self, event_producer, name):
+        """
+        Changes the name of one of the tenant's event producers
+        """
+        event_producer.name = name
+        self._index_event_producers()
+
+    def update_event_producer(self, event_producer, pattern=None,
+                              durable=None, encrypted=None, sinks=None):
+        """
+        Changes the fields of one of the tenant's event producers that are
+        not None
+        """
+        if pattern is not None:
+            event_producer.pattern = pattern
+        if durable is not None:
+            event_producer.durable = durable
+        if encrypted is not None:
+            event_producer.encrypted = encrypted
+        if sinks is not None:
+            event_producer.sinks = sinks
+        self._build_correlation_templates()
+
+    def get_event_producer_by_id(self, producer_id):
+        """
+        Returns the event producer with the given id, or None
+        """
+        return self._producers_by_id.get(producer_id)
+
+    def get_event_producer_by_name(self, producer_name):
+        """
+        Returns the event producer with the given name, or None
+        """
+        return self._producers_by_name.get(producer_name)
+
+    def get_correlation_template(self, producer_name):
+        """
+        Returns the correlation data shared by all messages of the named event
+        producer, without the per message timestamp and destinations.
+        Messages from an unknown producer share the template of a default
+        producer.  The template is shared by the messages of the producer and
+        must not be modified, messages are stamped with a copy of it.
+        """
+        template = self._correlation_templates.get(producer_name)
+        if template is None:
+            template = self._correlation_templates[None]
+        return template
+
     def format(self):
         return {'tenant_id': self.tenant_id,
                 'tenant_name': self.tenant_name,
@@ -4,6 +4,7 @@ with instances of the Tenant class and its member objects
 """
 
 from dreadfort.data.handlers import mongodb
+from dreadfort.data import invalidation
 from dreadfort.data.handlers.elasticsearch import mapping_tasks
 from dreadfort.data.model.tenant import EventProducer
 from dreadfort.data.model.tenant import (
@@ -34,7 +35,8 @@ def find_tenant(tenant_id, create_on_missing=False):
 
 def create_tenant(tenant_id, tenant_name=None):
     """
-    Creates a new tenant and and persists to the datastore
+    Creates a new tenant and and persists to the datastore, and publish the
+    change so that workers stop rejecting the tenant
     """
     # create new token for the tenant
     new_token = Token()
@@ -49,6 +51,8 @@ def create_tenant(tenant_id, tenant_name=None):
     # and enables time to live for the default doc_type
     mapping_tasks.create_index.delay(tenant_id)
 
+    invalidation.publish_tenant_change(tenant_id)
+
 
 def retrieve_tenant(tenant_id):
     """
@@ -64,9 +68,11 @@ def retrieve_tenant(tenant_id):
 
 def save_tenant(tenant):
     """
-    Update an existing tenant in the datastore
+    Update an existing tenant in the datastore, and publish the change so
+    that workers evict the tenant from their caches
     """
     _db_handler.update('tenant', tenant.format_for_save())
+    invalidation.publish_tenant_change(tenant.tenant_id)
 
 
 def create_event_producer(tenant, name, pattern, durable, encrypted, sinks):
@@ -82,7 +88,7 @@ def create_event_producer(tenant, name, pattern, durable, encrypted, sinks):
         encrypted,
         sinks)
     # add the event_producer to the tenant
-    tenant.event_producers.append(new_event_producer)
+    tenant.add_event_producer(new_event_producer)
     # save the tenant's data
     save_tenant(tenant)
 
@@ -102,7 +108,7 @@ def delete_event_producer(tenant, event_producer):
     the tenant in the datastore
     """
     # remove any references to the event producer being deleted
-    tenant.event_producers.remove(event_producer)
+    tenant.remove_event_producer(event_producer)
     # save the tenant document
     save_tenant(tenant)
 
@@ -112,14 +118,11 @@ def find_event_producer(tenant, producer_id=None, producer_name=None):
     searches the given tenant for a producer matching either the id or name
     """
     if producer_id:
-        producer_id = int(producer_id)
-        for producer in tenant.event_producers:
-            if producer_id == producer.get_id():
-                return producer
+        producer = tenant.get_event_producer_by_id(int(producer_id))
+        if producer:
+            return producer
 
     if producer_name:
-        for producer in tenant.event_producers:
-            if producer_name == producer.name:
-                return producer
+        return tenant.get_event_producer_by_name(producer_name)
 
     return None
@@ -0,0 +1,393 @@
+"""
+The shared_cache module provides a cache that is shared by all processes of
+a host through a memory mapped file, so that uWSGI workers, celery workers
+and receiver processes use one tenant and token cache.  Placing the file on
+a tmpfs such as /dev/shm keeps it in memory.
+
+The file is a header followed by fixed size slots.  Slots are grouped into
+buckets of WAYS slots, and a key can only be stored in the bucket its hash
+selects.  When a bucket is full, the least recently used of its slots is
+evicted, which approximates LRU eviction over the whole cache.  The size of
+the file is the memory budget of the cache.  Items larger than a slot, such
+as the tenants with many event producers, are stored in a second region of
+larger slots, and an item larger than those is not cached.
+
+A file created with another layout is replaced by renaming a new file over
+it.  It is never truncated in place, because other processes may still have
+it mapped.
+
+Every slot starts with a sequence number.  Writers make it odd while they
+change the slot and even again when they are done, and hold an exclusive
+lock on the byte range of the bucket, so writes to different buckets do not
+wait for each other.  Readers take no lock, they copy the slot and retry if
+its sequence number was odd or changed while it was copied.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+from dreadfort import env
+from dreadfort import metrics
+
+
+_LOG = env.get_logger(__name__)
+
+MAGIC = 'DFSC'
+VERSION = 2
+
+# slots in each bucket
+WAYS = 8
+
+# times a reader copies a slot that is being written before giving up
+READ_RETRIES = 16
+
+# times the file is opened again after another process replaced it
+OPEN_RETRIES = 3
+
+# keys of the items too large to cache that a warning is logged for
+MAX_WARNED_KEYS = 1000
+
+# magic, version, slot size, slot count, large slot size, large slot count
+_FILE_HEADER = struct.Struct('=4sIIIII')
+_FILE_HEADER_SIZE = 64
+
+# sequence, key hash, expires at, last access, key length, value length
+_SLOT_HEADER = struct.Struct('=IIddHI')
+_SEQUENCE = struct.Struct('=I')
+_SEQUENCE_MASK = 0xffffffff
+_LAST_ACCESS = struct.Struct('=d')
+_LAST_ACCESS_OFFSET = 16
+
+
+class _Region(object):
+
+    """
+    The buckets of the slots of one size
+    """
+
+    def __init__(self, start, slot_size, size):
+        self.start = start
+        self.slot_size = slot_size
+        self.bucket_size = slot_size * WAYS
+        self.bucket_count = max(size // self.bucket_size, 1)
+        self.slot_count = self.bucket_count * WAYS
+        self.end = start + self.slot_count * slot_size
+        self.max_item_size = slot_size - _SLOT_HEADER.size
+
+    def bucket(self, key_hash):
+        start = self.start + (key_hash % self.bucket_count) * \
+            self.bucket_size
+        return start, self.bucket_size
+
+
+class SharedCacheServer(object):
+
+    """
+    A stand in for the uWSGI cache functions backed by a memory mapped file.
+    Named caches share the slots of the file, the name of a cache is part of
+    the keys of its items.  An expiry of 0 keeps an item until it is evicted.
+    """
+
+    def __init__(self, path, size, slot_size, large_size=0,
+                 large_slot_size=0):
+        """
+        Opens the shared cache file, creating it when it does not exist or
+        replacing it when it was created with a different layout
+
+        :param path: path of the shared cache file
+        :param size: size in bytes of the slots of the file
+        :param slot_size: size in bytes of each slot
+        :param large_size: size in bytes of the slots for items larger than
+        slot_size, 0 to not cache those items
+        :param large_slot_size: size in bytes of each large slot
+        """
+        self.path = path
+        self._regions = [_Region(_FILE_HEADER_SIZE, slot_size, size)]
+        if large_size and large_slot_size > slot_size:
+            self._regions.append(_Region(
+                self._regions[0].end, large_slot_size, large_size))
+
+        self.slot_size = slot_size
+        self.slot_count = self._regions[0].slot_count
+        self.size = self._regions[-1].end
+        self.max_item_size = self._regions[-1].max_item_size
+
+        # record locks are held per process, the lock keeps the threads of
+        # a process from writing a bucket at the same time
+        self._lock = threading.Lock()
+        self._warned_keys = set()
+        self._fd = self._open_file()
+        try:
+            self._map = mmap.mmap(self._fd, self.size)
+        except Exception:
+            os.close(self._fd)
+            raise
+
+    def _layout(self):
+        large = self._regions[1] if len(self._regions) > 1 else None
+        return _FILE_HEADER.pack(
+            MAGIC, VERSION, self.slot_size, self.slot_count,
+            large.slot_size if large else 0,
+            large.slot_count if large else 0)
+
+    def _open_file(self):
+        """
+        Returns a descriptor of the shared cache file, once it has the
+        layout of this cache
+        """
+        expected = self._layout()
+        for _ in range(OPEN_RETRIES):
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX, _FILE_HEADER_SIZE, 0)
+                if os.fstat(fd).st_ino != os.stat(self.path).st_ino:
+                    # another process replaced the file while it was opened
+                    os.close(fd)
+                    continue
+
+                file_size = os.fstat(fd).st_size
+                if file_size == 0:
+                    # no process can have mapped an empty file
+                    _LOG.info('Creating shared cache {0}'.format(self.path))
+                    self._write_layout(fd, expected)
+                elif file_size != self.size or \
+                        os.read(fd, _FILE_HEADER.size) != expected:
+                    _LOG.info('Replacing shared cache {0}'.format(self.path))
+                    self._replace_file(expected)
+                    os.close(fd)
+                    continue
+
+                fcntl.lockf(fd, fcntl.LOCK_UN, _FILE_HEADER_SIZE, 0)
+                return fd
+            except Exception:
+                os.close(fd)
+                raise
+
+        raise IOError('Shared cache {0} keeps being replaced'.format(
+            self.path))
+
+    def _write_layout(self, fd, header):
+        os.ftruncate(fd, self.size)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, header)
+
+    def _replace_file(self, header):
+        tmp_path = '{0}.{1}'.format(self.path, os.getpid())
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            self._write_layout(fd, header)
+        finally:
+            os.close(fd)
+        os.rename(tmp_path, self.path)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def _read(self, offset, full_key, key_hash):
+        """
+        Returns a (state, value) tuple for a slot, where state is None if the
+        slot holds another key, False if it holds the key but it has expired
+        and True if it holds the key
+        """
+        slot_map = self._map
+        for _ in range(READ_RETRIES):
+            seq, slot_hash, expires_at, last_access, key_length, \
+                value_length = _SLOT_HEADER.unpack_from(slot_map, offset)
+            if seq & 1:
+                continue
+            if slot_hash != key_hash or key_length != len(full_key):
+                return None, None
+
+            start = offset + _SLOT_HEADER.size
+            key = slot_map[start:start + key_length]
+            value = slot_map[start + key_length:
+                             start + key_length + value_length]
+
+            if _SEQUENCE.unpack_from(slot_map, offset)[0] != seq:
+                continue
+            if key != full_key:
+                return None, None
+            if expires_at and expires_at <= time.time():
+                return False, None
+            return True, value
+
+        # the slot is being rewritten, treat it as a miss
+        return None, None
+
+    def _find(self, region, full_key, key_hash):
+        start, bucket_size = region.bucket(key_hash)
+        for offset in xrange(start, start + bucket_size, region.slot_size):
+            found, value = self._read(offset, full_key, key_hash)
+            if found is not None:
+                return offset, found, value
+        return None, None, None
+
+    def _find_any(self, full_key, key_hash):
+        for region in self._regions:
+            offset, found, value = self._find(region, full_key, key_hash)
+            if offset is not None:
+                return offset, found, value
+        return None, None, None
+
+    def _write(self, offset, key_hash, expires_at, full_key, value):
+        slot_map = self._map
+        seq = _SEQUENCE.unpack_from(slot_map, offset)[0]
+        odd_seq = (seq + 1) & _SEQUENCE_MASK
+        _SEQUENCE.pack_into(slot_map, offset, odd_seq)
+
+        start = offset + _SLOT_HEADER.size
+        slot_map[start:start + len(full_key) + len(value)] = full_key + value
+        _SLOT_HEADER.pack_into(
+            slot_map, offset, odd_seq, key_hash, expires_at, time.time(),
+            len(full_key), len(value))
+
+        _SEQUENCE.pack_into(slot_map, offset, (seq + 2) & _SEQUENCE_MASK)
+
+    def _clear_slot(self, offset):
+        seq = _SEQUENCE.unpack_from(self._map, offset)[0]
+        odd_seq = (seq + 1) & _SEQUENCE_MASK
+        _SEQUENCE.pack_into(self._map, offset, odd_seq)
+        _SLOT_HEADER.pack_into(self._map, offset, odd_seq, 0, 0, 0, 0, 0)
+        _SEQUENCE.pack_into(self._map, offset, (seq + 2) & _SEQUENCE_MASK)
+
+    def _victim(self, region, start, bucket_size):
+        # an empty or expired slot, or else the least recently used one
+        now = time.time()
+        victim = None
+        victim_access = None
+        for offset in xrange(start, start + bucket_size, region.slot_size):
+            seq, slot_hash, expires_at, last_access, key_length, \
+                value_length = _SLOT_HEADER.unpack_from(self._map, offset)
+            if not key_length or (expires_at and expires_at <= now):
+                return offset, False
+            if victim is None or last_access < victim_access:
+                victim = offset
+                victim_access = last_access
+        return victim, True
+
+    def _region_for(self, item_size):
+        for region in self._regions:
+            if item_size <= region.max_item_size:
+                return region
+        return None
+
+    def _too_large(self, full_key, item_size):
+        metrics.increment('cache.shared.too_large')
+        if full_key in self._warned_keys or \
+                len(self._warned_keys) >= MAX_WARNED_KEYS:
+            return
+
+        self._warned_keys.add(full_key)
+        _LOG.warning(
+            'Item {0!r} of {1} bytes is larger than the {2} bytes of a '
+            'shared cache slot and is not cached'.format(
+                full_key, item_size, self.max_item_size))
+
+    def _store(self, key, value, cache_expires, cache_name, replace):
+        full_key = '{0}\0{1}'.format(cache_name, key)
+        item_size = len(full_key) + len(value)
+        region = self._region_for(item_size)
+        if region is None:
+            self._too_large(full_key, item_size)
+            return None
+
+        key_hash = zlib.crc32(full_key) & 0xffffffff
+        expires_at = time.time() + cache_expires if cache_expires else 0
+        start, bucket_size = region.bucket(key_hash)
+        others = [other for other in self._regions if other is not region]
+
+        if not replace and any(
+                self._find(other, full_key, key_hash)[1] for other in others):
+            return None
+
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, bucket_size, start)
+            try:
+                offset, found, current = self._find(
+                    region, full_key, key_hash)
+                if found and not replace:
+                    return None
+
+                if offset is None:
+                    offset, evicted = self._victim(
+                        region, start, bucket_size)
+                    if evicted:
+                        metrics.increment('cache.shared.evictions')
+
+                self._write(offset, key_hash, expires_at, full_key, value)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, bucket_size, start)
+
+        # a copy in slots of the other size would shadow the new value
+        for other in others:
+            self._delete(other, full_key, key_hash)
+        return True
+
+    def _delete(self, region, full_key, key_hash):
+        start, bucket_size = region.bucket(key_hash)
+
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, bucket_size, start)
+            try:
+                offset, found, value = self._find(region, full_key, key_hash)
+                if offset is not None:
+                    self._clear_slot(offset)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, bucket_size, start)
+
+    def cache_get(self, key, cache_name):
+        full_key = '{0}\0{1}'.format(cache_name, key)
+        offset, found, value = self._find_any(
+            full_key, zlib.crc32(full_key) & 0xffffffff)
+        if not found:
+            return None
+
+        # the access time is only a hint for eviction, it is updated
+        # without a lock
+        _LAST_ACCESS.pack_into(
+            self._map, offset + _LAST_ACCESS_OFFSET, time.time())
+        return value
+
+    def cache_exists(self, key, cache_name):
+        return self.cache_get(key, cache_name) is not None
+
+    def cache_set(self, key, value, cache_expires, cache_name):
+        # like uWSGI, cache_set does not replace an existing item
+        return self._store(key, value, cache_expires, cache_name, False)
+
+    def cache_update(self, key, value, cache_expires, cache_name):
+        return self._store(key, value, cache_expires, cache_name, True)
+
+    def cache_del(self, key, cache_name):
+        full_key = '{0}\0{1}'.format(cache_name, key)
+        key_hash = zlib.crc32(full_key) & 0xffffffff
+        for region in self._regions:
+            self._delete(region, full_key, key_hash)
+
+    def cache_clear(self, cache_name):
+        for region in self._regions:
+            self._clear_region(region, cache_name)
+
+    def _clear_region(self, region, cache_name):
+        prefix = '{0}\0'.format(cache_name)
+        bucket_size = region.bucket_size
+
+        for bucket in xrange(region.bucket_count):
+            start = region.start + bucket * bucket_size
+            with self._lock:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX, bucket_size, start)
+                try:
+                    for offset in xrange(
+                            start, start + bucket_size, region.slot_size):
+                        key_start = offset + _SLOT_HEADER.size
+                        if self._map[key_start:key_start + len(prefix)] == \
+                                prefix:
+                            self._clear_slot(offset)
+                finally:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, bucket_size, start)
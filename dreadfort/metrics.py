@@ -0,0 +1,342 @@
+"""
+The metrics module records counts, gauges and latency histograms for the
+stages of the message pipeline.  Recording a metric only updates in-memory
+counters of the current process, so instrumentation can be left on in
+production.
+
+Every process periodically writes a snapshot of its metrics to a file in the
+metrics directory, and once more when it exits.  The worker persona reads
+the snapshots of all processes on the host and exposes their sum for
+scraping.  Gauges are combined by taking their highest value across the
+processes.  The snapshots of processes that have exited are removed, so
+their metrics are no longer reported.
+"""
+
+import atexit
+from bisect import bisect_left
+from contextlib import contextmanager
+import errno
+from functools import wraps
+import os
+import threading
+import time
+
+from oslo.config import cfg
+
+from dreadfort import config
+from dreadfort import env
+from dreadfort.openstack.common import jsonutils
+
+
+_LOG = env.get_logger(__name__)
+
+# Metrics configuration options
+_METRICS_GROUP = cfg.OptGroup(name='metrics', title='Metrics Options')
+config.get_config().register_group(_METRICS_GROUP)
+
+_METRICS_OPTIONS = [
+    cfg.BoolOpt('enabled',
+                default=True,
+                help="""record pipeline metrics"""
+                ),
+    cfg.StrOpt('metrics_dir',
+               default='/var/lib/dreadfort/metrics',
+               help="""directory where each process writes its metrics"""
+               ),
+    cfg.IntOpt('flush_interval',
+               default=10,
+               help="""number of seconds between writes of the metrics of
+               a process"""
+               )
+]
+
+config.get_config().register_opts(_METRICS_OPTIONS, group=_METRICS_GROUP)
+
+try:
+    config.init_config()
+except config.cfg.ConfigFilesNotFoundError as ex:
+    _LOG.exception(ex.message)
+
+_CONF = config.get_config()
+
+ENABLED = _CONF.metrics.enabled
+METRICS_DIR = _CONF.metrics.metrics_dir
+FLUSH_INTERVAL = _CONF.metrics.flush_interval
+
+# upper bounds in seconds of the latency histogram buckets, observations
+# above the last bound are counted in an overflow bucket
+BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+_counters = dict()
+_gauges = dict()
+_histograms = dict()
+_lock = threading.Lock()
+_pid = [os.getpid()]
+_flusher_pid = [None]
+
+
+class Histogram(object):
+
+    """
+    Counts observed values in buckets with fixed upper bounds
+    """
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def format(self):
+        return {'bounds': self.bounds,
+                'counts': self.counts,
+                'count': self.count,
+                'sum': self.sum}
+
+
+def increment(name, value=1):
+    """
+    Adds a value to a counter
+    """
+    if not ENABLED:
+        return
+
+    with _lock:
+        _discard_after_fork()
+        _counters[name] = _counters.get(name, 0) + value
+
+    _start_flusher()
+
+
+def gauge(name, value):
+    """
+    Sets a gauge to its current value
+    """
+    if not ENABLED:
+        return
+
+    with _lock:
+        _discard_after_fork()
+        _gauges[name] = value
+
+    _start_flusher()
+
+
+def observe(name, seconds):
+    """
+    Records a duration in a latency histogram
+    """
+    if not ENABLED:
+        return
+
+    with _lock:
+        _discard_after_fork()
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    _start_flusher()
+
+
+@contextmanager
+def timer(name):
+    """
+    A context manager that records how long its block takes to run
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe(name, time.time() - start)
+
+
+def timed(name):
+    """
+    A decorator that records how long each call of a function takes
+    """
+    def timed_decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return timed_decorator
+
+
+def snapshot():
+    """
+    Returns the metrics recorded by the current process
+    """
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'histograms': dict(
+                (name, histogram.format())
+                for name, histogram in _histograms.iteritems())
+        }
+
+
+def reset():
+    """
+    Discards the metrics recorded by the current process
+    """
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def _discard_after_fork():
+    # a forked child starts with a copy of its parent's metrics, which are
+    # already reported by the parent
+    if _pid[0] != os.getpid():
+        _pid[0] = os.getpid()
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+class _Flusher(threading.Thread):
+
+    """
+    A daemon thread that writes the metrics of the process it runs in every
+    FLUSH_INTERVAL seconds, so that an idle process still reports them
+    """
+
+    def __init__(self):
+        super(_Flusher, self).__init__()
+        self.daemon = True
+
+    def run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            _flush_safely()
+
+
+def _start_flusher():
+    # only the flusher thread writes, so recording a metric never waits on
+    # the metrics directory
+    if _flusher_pid[0] == os.getpid():
+        return
+
+    with _lock:
+        if _flusher_pid[0] == os.getpid():
+            return
+        _flusher_pid[0] = os.getpid()
+
+    _Flusher().start()
+
+
+def _flush_safely():
+    try:
+        flush()
+    except (IOError, OSError) as ex:
+        _LOG.warning('Unable to write metrics: {0}'.format(ex))
+
+
+def _flush_at_exit():
+    # a forked child that recorded nothing still holds its parent's metrics
+    if ENABLED and _pid[0] == os.getpid():
+        _flush_safely()
+
+
+atexit.register(_flush_at_exit)
+
+
+def flush(metrics_dir=None):
+    """
+    Writes the metrics of the current process to its file in the metrics
+    directory.  The file is replaced atomically so that readers never see a
+    partial snapshot.
+    """
+    metrics_dir = metrics_dir or METRICS_DIR
+    if not os.path.isdir(metrics_dir):
+        os.mkdir(metrics_dir)
+
+    path = os.path.join(metrics_dir, '{0}.json'.format(os.getpid()))
+    tmp_path = '{0}.tmp'.format(path)
+    with open(tmp_path, 'w') as metrics_file:
+        metrics_file.write(jsonutils.dumps(snapshot()))
+    os.rename(tmp_path, path)
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as ex:
+        # EPERM means the process exists but belongs to another user
+        return ex.errno != errno.ESRCH
+    return True
+
+
+def _remove_stale(path):
+    try:
+        os.remove(path)
+    except OSError as ex:
+        # another reader may have removed it first
+        if ex.errno != errno.ENOENT:
+            _LOG.warning('Unable to remove metrics: {0}'.format(ex))
+
+
+def collect(metrics_dir=None):
+    """
+    Returns the sum of the metrics written by all running processes on the
+    host.  The files of processes that have exited are removed.
+    """
+    metrics_dir = metrics_dir or METRICS_DIR
+    counters = dict()
+    gauges = dict()
+    histograms = dict()
+
+    if not os.path.isdir(metrics_dir):
+        return {'counters': counters, 'gauges': gauges,
+                'histograms': histograms}
+
+    for file_name in os.listdir(metrics_dir):
+        if not file_name.endswith('.json'):
+            continue
+
+        path = os.path.join(metrics_dir, file_name)
+        try:
+            pid = int(file_name[:-len('.json')])
+        except ValueError:
+            continue
+
+        if not _process_exists(pid):
+            _remove_stale(path)
+            continue
+
+        try:
+            with open(path) as metrics_file:
+                process_metrics = jsonutils.loads(metrics_file.read())
+        except (IOError, ValueError) as ex:
+            _LOG.warning('Unable to read metrics: {0}'.format(ex))
+            continue
+
+        for name, value in process_metrics['counters'].iteritems():
+            counters[name] = counters.get(name, 0) + value
+
+        for name, value in process_metrics.get('gauges', {}).iteritems():
+            gauges[name] = max(gauges.get(name, value), value)
+
+        for name, histogram in process_metrics['histograms'].iteritems():
+            total = histograms.setdefault(name, {
+                'bounds': histogram['bounds'],
+                'counts': [0] * len(histogram['counts']),
+                'count': 0,
+                'sum': 0.0})
+            total['counts'] = [
+                a + b for a, b in zip(total['counts'], histogram['counts'])]
+            total['count'] += histogram['count']
+            total['sum'] += histogram['sum']
+
+    return {'counters': counters, 'gauges': gauges,
+            'histograms': histograms}
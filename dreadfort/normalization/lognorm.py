@@ -18,7 +18,12 @@ _NORMALIZATION = [
     cfg.StrOpt('rules_dir',
                default=None,
                help="""directory to load rules from"""
-               )
+               ),
+    cfg.BoolOpt('inline',
+                default=False,
+                help="""normalize messages in the worker that correlates
+                them instead of queueing a separate normalization task"""
+                )
 ]
 
 config.get_config().register_opts(
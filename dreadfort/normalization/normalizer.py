@@ -1,13 +1,17 @@
+from dreadfort import codec
+from dreadfort import config
 from dreadfort import env
+from dreadfort import metrics
 from dreadfort.queue import celery
 from dreadfort.normalization.lognorm import get_normalizer
 from dreadfort import sinks
-import json
 
 
 _LOG = env.get_logger(__name__)
 _normalizer, loaded_normalizer_rules = get_normalizer()
 
+NORMALIZE_INLINE = config.get_config().liblognorm.inline
+
 
 def should_normalize(message):
     """Returns true only if the pattern is in the loaded rules
@@ -19,7 +23,7 @@ def should_normalize(message):
     return should_normalize and can_normalize
 
 
-@celery.task(acks_late=True, max_retries=None, serializer="json")
+@celery.task(acks_late=True, max_retries=None, serializer=codec.SERIALIZER)
 def normalize_message(message):
     """
     This code takes a message and normalizes it into a dictionary. This
@@ -27,10 +31,40 @@ def normalize_message(message):
     of the normalization. This dictionary is then assigned to the message
     under the normalized field.
     """
+    _normalize(message)
+    sinks.route_message(message)
+
+
+@celery.task(acks_late=True, max_retries=None, serializer=codec.SERIALIZER)
+def normalize_message_batch(messages):
+    """
+    Normalizes a batch of messages and routes the batch to the sinks in bulk.
+    A message that fails normalization is logged and dropped, the rest of
+    the batch is still routed.
+    """
+    normalized_messages = list()
+    for message in messages:
+        try:
+            _normalize(message)
+        except Exception as ex:
+            _LOG.exception(ex)
+            metrics.increment('normalization.failed_messages')
+            continue
+        normalized_messages.append(message)
+
+    if normalized_messages:
+        sinks.route_message_batch(normalized_messages)
+
+
+@metrics.timed('normalization.normalize')
+def _normalize(message):
+    """
+    Assigns the normalized dictionary of a message to the message under the
+    normalized field.
+    """
     pattern = message['dreadfort']['correlation']['pattern']
-    normalized_doc = json.loads(
+    normalized_doc = codec.loads_json(
         _normalizer.normalize(message['msg']).as_json())
     message['normalized'] = {
         pattern: normalized_doc
     }
-    sinks.route_message(message)
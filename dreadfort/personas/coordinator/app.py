@@ -5,9 +5,10 @@ import falcon
 from dreadfort.api.status.resources import (
     WorkerStatusResource, WorkersStatusResource)
 from dreadfort.api.tenant.resources import (
-    EventProducerResource, EventProducersResource,
+    CorrelationResource, EventProducerResource, EventProducersResource,
     UserResource, TenantResource, TokenResource)
 from dreadfort.api.version.resources import VersionResource
+from dreadfort.data import invalidation
 from dreadfort import env
 from dreadfort.queue import celery
 
@@ -29,6 +30,7 @@ def start_up():
     event_producers = EventProducersResource()
     event_producer = EventProducerResource()
     token = TokenResource()
+    correlation = CorrelationResource()
 
     # Create API
     application = api = falcon.API()
@@ -47,6 +49,7 @@ def start_up():
                   event_producer)
 
     api.add_route('/v1/tenant/{tenant_id}/token', token)
+    api.add_route('/v1/tenant/{tenant_id}/correlation', correlation)
 
     celery_proc = Process(target=celery.worker_main)
     celery_proc.start()
@@ -54,4 +57,14 @@ def start_up():
         'Celery started as process: {}'.format(celery_proc.pid)
     )
 
+    if invalidation.ENABLED:
+        # relay tenant changes published by the api processes to workers
+        forwarder = invalidation.new_forwarder()
+        forwarder_proc = Process(target=forwarder.start)
+        forwarder_proc.start()
+        _LOG.info(
+            'Tenant change forwarder started as process: {}'.format(
+                forwarder_proc.pid)
+        )
+
     return application
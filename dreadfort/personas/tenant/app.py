@@ -3,6 +3,7 @@ from datetime import timedelta
 
 import falcon
 
+from dreadfort.api.tenant.resources import CorrelationResource
 from dreadfort.api.tenant.resources import EventProducerResource
 from dreadfort.api.tenant.resources import EventProducersResource
 from dreadfort.api.tenant.resources import UserResource
@@ -10,6 +11,7 @@ from dreadfort.api.tenant.resources import TenantResource
 from dreadfort.api.tenant.resources import TokenResource
 from dreadfort.api.version.resources import VersionResource
 from dreadfort.data.datastore import COORDINATOR_DB, get_data_handler
+from dreadfort.data import invalidation
 from dreadfort import env
 from dreadfort.personas.common import publish_stats
 from dreadfort.queue import celery
@@ -28,6 +30,7 @@ def start_up():
     event_producers = EventProducersResource()
     event_producer = EventProducerResource()
     token = TokenResource()
+    correlation = CorrelationResource()
 
     # Create API
     application = api = falcon.API()
@@ -42,6 +45,7 @@ def start_up():
     api.add_route('/v1/tenant/{tenant_id}/producers/{event_producer_id}',
                   event_producer)
     api.add_route('/v1/tenant/{tenant_id}/token', token)
+    api.add_route('/v1/tenant/{tenant_id}/correlation', correlation)
 
     celery.conf.CELERYBEAT_SCHEDULE = {
         'worker_stats': {
@@ -57,4 +61,14 @@ def start_up():
         'Celery started as process: {}'.format(celery_proc.pid)
     )
 
+    if invalidation.ENABLED:
+        # relay tenant changes published by the api processes to workers
+        forwarder = invalidation.new_forwarder()
+        forwarder_proc = Process(target=forwarder.start)
+        forwarder_proc.start()
+        _LOG.info(
+            'Tenant change forwarder started as process: {}'.format(
+                forwarder_proc.pid)
+        )
+
     return application
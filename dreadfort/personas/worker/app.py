@@ -4,6 +4,7 @@ from datetime import timedelta
 import falcon
 
 from dreadfort.api.http_log.resources import PublishMessageResource
+from dreadfort.api.metrics.resources import MetricsResource
 from dreadfort.api.version.resources import VersionResource
 from dreadfort import config
 from dreadfort import env
@@ -28,16 +29,18 @@ def start_up():
     # http correlation endpoint
     api.add_route('/v1/tenant/{tenant_id}/publish', PublishMessageResource())
 
-    # syslog correlation endpoint
-    server = receiver.new_correlation_input_server()
+    # pipeline metrics of the worker processes
+    api.add_route('/v1/metrics', MetricsResource())
 
-    server_proc = Process(target=server.start)
-    server_proc.start()
+    # syslog correlation endpoint
+    for server in receiver.new_correlation_input_servers():
+        server_proc = Process(target=server.start)
+        server_proc.start()
 
-    _LOG.info(
-        'ZeroMQ reception server started as process: {}'.format(
-            server_proc.pid)
-    )
+        _LOG.info(
+            'ZeroMQ reception server started as process: {}'.format(
+                server_proc.pid)
+        )
 
     celery.conf.CELERYBEAT_SCHEDULE = {
         'worker_stats': {
@@ -1,3 +1,25 @@
+"""
+The proxy module gives access to the caches of dreadfort.  The backend is
+chosen in the [cache] section of the configuration:
+
+    uwsgi   the uWSGI caches.  When dreadfort does not run under uWSGI, as
+            in celery workers, receiver processes and tests, the caches are
+            provided by an in-process backend with the same named caches, so
+            every process still gets caching.  The in-process caches are not
+            shared between processes.
+    shared  a cache in a memory mapped file shared by all processes of the
+            host, see dreadfort.data.shared_cache
+"""
+
+import threading
+
+from oslo.config import cfg
+
+from dreadfort import config
+from dreadfort import env
+from dreadfort.data.local_cache import LocalCache
+from dreadfort.data.shared_cache import SharedCacheServer
+
 try:
     import uwsgi
     UWSGI = True
@@ -6,43 +28,215 @@ except ImportError:
     UWSGI = False
 
 
+# in-process cache configuration options
+_CACHE_GROUP = cfg.OptGroup(name='cache', title='Cache Options')
+config.get_config().register_group(_CACHE_GROUP)
+
+_PROXY_OPTIONS = [
+    cfg.StrOpt('backend',
+               default='uwsgi',
+               choices=['uwsgi', 'shared'],
+               help="""cache backend, the uWSGI caches or a cache shared by
+               all processes of the host"""
+               ),
+    cfg.IntOpt('fallback_items',
+               default=1000,
+               help="""maximum number of items in each named cache when
+               dreadfort does not run under uWSGI"""
+               ),
+    cfg.StrOpt('shared_path',
+               default='/dev/shm/dreadfort-cache',
+               help="""file mapped by the shared cache backend"""
+               ),
+    cfg.IntOpt('shared_size',
+               default=64 * 1024 * 1024,
+               help="""memory budget in bytes of the shared cache"""
+               ),
+    cfg.IntOpt('shared_slot_size',
+               default=8192,
+               help="""size in bytes of a shared cache slot"""
+               ),
+    cfg.IntOpt('shared_large_size',
+               default=8 * 1024 * 1024,
+               help="""memory budget in bytes of the shared cache for items
+               larger than a slot, 0 to not cache them"""
+               ),
+    cfg.IntOpt('shared_large_slot_size',
+               default=64 * 1024,
+               help="""size in bytes of a large shared cache slot, larger
+               items are not cached"""
+               )
+]
+
+config.get_config().register_opts(_PROXY_OPTIONS, group=_CACHE_GROUP)
+
+try:
+    config.init_config()
+except config.cfg.ConfigFilesNotFoundError:
+    pass
+
+_LOG = env.get_logger(__name__)
+
+_CONF = config.get_config()
+
+BACKEND = _CONF.cache.backend
+FALLBACK_ITEMS = _CONF.cache.fallback_items
+SHARED_PATH = _CONF.cache.shared_path
+SHARED_SIZE = _CONF.cache.shared_size
+SHARED_SLOT_SIZE = _CONF.cache.shared_slot_size
+SHARED_LARGE_SIZE = _CONF.cache.shared_large_size
+SHARED_LARGE_SLOT_SIZE = _CONF.cache.shared_large_slot_size
+
+
+class LocalCacheServer(object):
+
+    """
+    An in-process stand in for the uWSGI cache functions.  Each named cache
+    is a LocalCache holding at most max_items items, created on first use.
+    An expiry of 0 keeps an item until it is evicted, as it does in uWSGI.
+    """
+
+    def __init__(self, max_items=FALLBACK_ITEMS):
+        self.max_items = max_items
+        self._caches = dict()
+        self._lock = threading.Lock()
+
+    def _cache(self, cache_name):
+        cache = self._caches.get(cache_name)
+        if cache is None:
+            with self._lock:
+                cache = self._caches.setdefault(
+                    cache_name, LocalCache(self.max_items, 0))
+        return cache
+
+    def cache_exists(self, key, cache_name):
+        return self._cache(cache_name).get(key) is not None
+
+    def cache_get(self, key, cache_name):
+        return self._cache(cache_name).get(key)
+
+    def cache_set(self, key, value, cache_expires, cache_name):
+        # like uWSGI, cache_set does not replace an existing item
+        cache = self._cache(cache_name)
+        if cache.get(key) is not None:
+            return None
+        cache.set(key, value, cache_expires)
+        return True
+
+    def cache_update(self, key, value, cache_expires, cache_name):
+        self._cache(cache_name).set(key, value, cache_expires)
+        return True
+
+    def cache_del(self, key, cache_name):
+        self._cache(cache_name).delete(key)
+
+    def cache_clear(self, cache_name):
+        self._cache(cache_name).clear()
+
+
+# the in-process caches are shared by every NativeProxy of a process
+_local_server = LocalCacheServer()
+
+# the shared cache is opened once per process, a forked child keeps using
+# the mapping of its parent
+_shared_server = None
+_shared_lock = threading.Lock()
+
+
+def _get_shared_server():
+    global _shared_server
+
+    if _shared_server is None:
+        with _shared_lock:
+            if _shared_server is None:
+                try:
+                    _shared_server = SharedCacheServer(
+                        SHARED_PATH, SHARED_SIZE, SHARED_SLOT_SIZE,
+                        SHARED_LARGE_SIZE, SHARED_LARGE_SLOT_SIZE)
+                except (IOError, OSError) as ex:
+                    _LOG.error('Unable to open shared cache {0}: {1}, '
+                               'using in-process caches'.format(
+                                   SHARED_PATH, ex))
+                    _shared_server = _local_server
+    return _shared_server
+
+
+def _get_server():
+    if BACKEND == 'shared':
+        return _get_shared_server()
+    return uwsgi if UWSGI else _local_server
+
+
+def caches_are_shared():
+    """
+    Returns True if the caches of this process are shared with the other
+    processes of the host, rather than kept in the process
+    """
+    return _get_server() is not _local_server
+
+
 class NativeProxy(object):
 
     def __init__(self):
-        self.server = uwsgi
+        self.server = _get_server()
         self.UWSGI = UWSGI
         # Default timeout = 15 minutes
 
     def cache_exists(self, key, cache_name):
-        if self.UWSGI:
-            return self.server.cache_exists(key, cache_name)
-        else:
-            return None
+        return self.server.cache_exists(key, cache_name)
 
     def cache_get(self, key, cache_name):
-        if self.UWSGI:
-            return self.server.cache_get(key, cache_name)
-        else:
-            return None
+        return self.server.cache_get(key, cache_name)
 
     def cache_set(self, key, value, cache_expires, cache_name):
-        if self.UWSGI:
-            self.server.cache_set(
-                key, value, cache_expires, cache_name)
+        self.server.cache_set(
+            key, value, cache_expires, cache_name)
 
     def cache_update(self, key, value, cache_expires, cache_name):
-        if self.UWSGI:
-            self.server.cache_update(
-                key, value, cache_expires, cache_name)
+        self.server.cache_update(
+            key, value, cache_expires, cache_name)
+
+    def cache_get_or_none(self, key, cache_name):
+        """
+        Returns the value of a key, or None if the key is not cached, with a
+        single cache call
+        """
+        return self.server.cache_get(key, cache_name)
+
+    def cache_upsert(self, key, value, cache_expires, cache_name):
+        """
+        Stores the value of a key whether or not the key is already cached,
+        with a single cache call
+        """
+        self.server.cache_update(key, value, cache_expires, cache_name)
+
+    def cache_get_many(self, keys, cache_name):
+        """
+        Returns a dictionary of the values of the cached keys among keys
+        """
+        cache_get = self.server.cache_get
+        values = dict()
+        for key in keys:
+            value = cache_get(key, cache_name)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def cache_set_many(self, items, cache_expires, cache_name):
+        """
+        Stores the values of a dictionary of keys and values
+        """
+        cache_update = self.server.cache_update
+        for key, value in items.iteritems():
+            cache_update(key, value, cache_expires, cache_name)
 
     def cache_del(self, key, cache_name):
-        if self.UWSGI:
-            self.server.cache_del(key, cache_name)
+        self.server.cache_del(key, cache_name)
 
     def cache_clear(self, cache_name):
-        if self.UWSGI:
-            self.server.cache_clear(cache_name)
+        self.server.cache_clear(cache_name)
 
     def restart(self):
+        # the server may be a shared cache, which can not reload the workers
         if self.UWSGI:
-            self.server.reload()
+            uwsgi.reload()
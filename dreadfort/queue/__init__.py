@@ -2,6 +2,7 @@ from celery import Celery
 
 from oslo.config import cfg
 
+from dreadfort import codec
 import dreadfort.config as config
 from dreadfort import env
 
@@ -26,8 +27,9 @@ _CELERY = [
                 help="""disable celery rate limit"""
                 ),
     cfg.StrOpt('CELERY_TASK_SERIALIZER',
-               default="json",
-               help="""default serialization method to use"""
+               default=None,
+               help="""default serialization method to use, defaults to the
+               serializer of the [codec] backend"""
                )
 ]
 
@@ -47,5 +49,7 @@ celery = Celery('dreadfort', broker=celery_conf.BROKER_URL)
 celery.conf.BROKER_URL = celery_conf.BROKER_URL
 celery.conf.CELERYD_CONCURRENCY = celery_conf.CELERYD_CONCURRENCY
 celery.conf.CELERY_DISABLE_RATE_LIMITS = celery_conf.CELERY_DISABLE_RATE_LIMITS
-celery.conf.CELERY_TASK_SERIALIZER = celery_conf.CELERY_TASK_SERIALIZER
+celery.conf.CELERY_TASK_SERIALIZER = (
+    celery_conf.CELERY_TASK_SERIALIZER or codec.SERIALIZER)
+celery.conf.CELERY_ACCEPT_CONTENT = ['json'] + codec.SERIALIZERS
 celery.conf.CELERYD_HIJACK_ROOT_LOGGER = False
@@ -1,4 +1,6 @@
 # hoist into package namespace
 from dreadfort.sinks.dispatch import route_message
+from dreadfort.sinks.dispatch import route_message_batch
+from dreadfort.sinks.dispatch import use_fast_lane
 from dreadfort.sinks.dispatch import DEFAULT_SINK
 from dreadfort.sinks.dispatch import VALID_SINKS
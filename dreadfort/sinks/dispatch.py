@@ -17,7 +17,13 @@ _SINK = [
     cfg.StrOpt('default_sink',
                default='elasticsearch',
                help="""default data sink"""
-               )
+               ),
+    cfg.BoolOpt('fast_lane',
+                default=False,
+                help="""store messages of non-durable event producers
+                without queueing them through tasks, and without
+                persisting them on the broker"""
+                )
 ]
 
 config.get_config().register_opts(_SINK, group=_DATA_SINKS_GROUP)
@@ -31,9 +37,38 @@ conf = config.get_config()
 
 VALID_SINKS = conf.data_sinks.valid_sinks
 DEFAULT_SINK = conf.data_sinks.default_sink
+FAST_LANE = conf.data_sinks.fast_lane
+
+
+def use_fast_lane(message):
+    """
+    Returns True if a correlated message takes the fast lane, which skips
+    the task queues between correlation and the sinks
+    """
+    return FAST_LANE and not message['dreadfort']['correlation']['durable']
 
 
 def route_message(message):
     message_sinks = message['dreadfort']['correlation']['sinks']
     if 'elasticsearch' in message_sinks:
-        elasticsearch.put_message.delay(message)
+        if use_fast_lane(message):
+            elasticsearch.put_transient_messages([message])
+        else:
+            elasticsearch.put_message.delay(message)
+
+
+def route_message_batch(messages):
+    es_messages = list()
+    fast_lane_messages = list()
+
+    for message in messages:
+        if 'elasticsearch' in message['dreadfort']['correlation']['sinks']:
+            if use_fast_lane(message):
+                fast_lane_messages.append(message)
+            else:
+                es_messages.append(message)
+
+    if fast_lane_messages:
+        elasticsearch.put_transient_messages(fast_lane_messages)
+    if es_messages:
+        elasticsearch.put_message_batch.delay(es_messages)
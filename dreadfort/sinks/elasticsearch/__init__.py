@@ -1,3 +1,5 @@
 # bring put_message task into dreadfort.sinks.elasticsearch namespace
 from dreadfort.sinks.elasticsearch.sink import put_message
+from dreadfort.sinks.elasticsearch.sink import put_message_batch
+from dreadfort.sinks.elasticsearch.sink import put_transient_messages
 from dreadfort.sinks.elasticsearch.sink import ElasticSearchStreamBulker
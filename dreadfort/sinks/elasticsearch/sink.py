@@ -3,6 +3,10 @@ This module contains operations for implementing an elasticsearch data sink.
 It exposes a task that allows messages to be queued for indexing.  It then
 exposes the ElasticSearchBulkStreamer which creates a pool of processes for
 pulling a stream off of the queue and performing bulk flushes to Elasticsearch.
+
+Messages of non-durable producers may instead be published straight to the
+indexing queue with put_transient_messages, without going through a task.
+These index requests are not persisted by the broker.
 """
 from multiprocessing import cpu_count, Process
 import signal
@@ -13,9 +17,11 @@ from kombu import Connection, Exchange, Queue
 from kombu.pools import producers
 from elasticsearch import helpers as es_helpers
 
+from dreadfort import codec
 import dreadfort.config as config
 from dreadfort import env
 from dreadfort.data.handlers import elasticsearch
+from dreadfort import metrics
 from dreadfort.queue import celery
 
 
@@ -47,13 +53,11 @@ except Exception as ex:
     _LOG.exception(ex)
 
 
-def _queue_index_request(index, doc_type, document, ttl=TTL):
+def _create_index_action(index, doc_type, document, ttl=TTL):
     """
-    places a message index request on the queue
+    creates the metadata for an index operation
     """
-
-    # create the metadata for index operation
-    action = {
+    return {
         '_index': index,
         '_type': doc_type,
         '_id': str(uuid.uuid4()),
@@ -61,13 +65,40 @@ def _queue_index_request(index, doc_type, document, ttl=TTL):
         '_source': document
     }
 
+
+def _queue_index_request(index, doc_type, document, ttl=TTL):
+    """
+    places a message index request on the queue
+    """
+
+    # create the metadata for index operation
+    action = _create_index_action(index, doc_type, document, ttl)
+
     # publish the message
     with producers[connection].acquire(block=True) as producer:
         producer.publish(action, routing_key=ELASTICSEARCH_QUEUE,
-                         serializer='json', declare=[es_queue])
+                         serializer=codec.SERIALIZER, declare=[es_queue])
+
+
+def _queue_index_requests(messages, ttl=TTL, delivery_mode=None):
+    """
+    places an index request for each message on the queue, publishing all
+    of them through a single producer
+    """
+    with producers[connection].acquire(block=True) as producer:
+        for message in messages:
+            action = _create_index_action(
+                index=message['dreadfort']['tenant'],
+                doc_type=message['dreadfort']['correlation']['pattern'],
+                document=message,
+                ttl=ttl)
+            producer.publish(action, routing_key=ELASTICSEARCH_QUEUE,
+                             serializer=codec.SERIALIZER, declare=[es_queue],
+                             delivery_mode=delivery_mode)
 
 
 @celery.task
+@metrics.timed('sink.elasticsearch.put_message')
 def put_message(message):
     """
     Builds an indexing requests for a message, then sends the request
@@ -83,6 +114,35 @@ def put_message(message):
         put_message.retry()
 
 
+@celery.task
+@metrics.timed('sink.elasticsearch.put_message_batch')
+def put_message_batch(messages):
+    """
+    Builds indexing requests for a batch of messages, then sends the requests
+    to be queued in bulk
+    """
+    try:
+        _queue_index_requests(messages)
+    except Exception as ex:
+        _LOG.exception(ex.message)
+        put_message_batch.retry()
+
+
+@metrics.timed('sink.elasticsearch.put_transient_messages')
+def put_transient_messages(messages):
+    """
+    Publishes indexing requests for messages of non-durable producers
+    directly to the indexing queue as transient messages.  The requests are
+    best effort, they are dropped if they can not be published.
+    """
+    try:
+        _queue_index_requests(messages, delivery_mode='transient')
+    except Exception as ex:
+        _LOG.exception(ex.message)
+        metrics.increment(
+            'sink.elasticsearch.transient_dropped', len(messages))
+
+
 def get_queue_stream(ack_list, bulk_timeout=60):
     """
     A generator that pulls messages off a queue and yields the result.
@@ -100,6 +160,23 @@ def get_queue_stream(ack_list, bulk_timeout=60):
             yield msg.payload
 
 
+class _TimedBulkClient(object):
+
+    """
+    Wraps an elasticsearch client to record the latency of bulk requests
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def bulk(self, *args, **kwargs):
+        with metrics.timer('sink.elasticsearch.bulk'):
+            return self._client.bulk(*args, **kwargs)
+
+
 def flush_to_es():
     """
     Flushes a stream of messages to elasticsearch using bulk flushing.
@@ -119,7 +196,7 @@ def flush_to_es():
             ack_list = list()
             actions = get_queue_stream(ack_list)
             bulker = es_helpers.streaming_bulk(
-                es_client, actions, chunk_size=BULK_SIZE)
+                _TimedBulkClient(es_client), actions, chunk_size=BULK_SIZE)
             _LOG.error("Post flush")
 
             for response in bulker:
@@ -128,6 +205,9 @@ def flush_to_es():
 
                 if msg_ok:
                     msg.ack()
+                    metrics.increment('sink.elasticsearch.indexed')
+                else:
+                    metrics.increment('sink.elasticsearch.failed')
 
         except Exception as ex:
             _LOG.exception(ex)
@@ -0,0 +1,416 @@
+"""
+The spool module provides a local, append-only store-and-forward spool.
+Receivers write message batches to the spool while the broker is
+unavailable or backed up, and a drainer replays them in order once the
+broker recovers.
+
+A spool is a directory of segment files, named after their increasing
+sequence number.  Each record in a segment is a header, holding the length
+and CRC32 of the payload, the number of messages in it and the time it was
+spooled, followed by the payload, a batch of messages encoded with the
+configured codec.  Appends are written straight to the segment file and are
+fsynced together at most every fsync_interval milliseconds, so a crash may
+lose the batches appended since the last fsync.  The position of the next
+record to replay is kept in a cursor file that is saved on the same
+interval, so a crash may replay some batches twice.  Segments are deleted
+once all of their records have been replayed.
+"""
+
+from collections import deque
+import os
+import struct
+import threading
+import time
+import zlib
+
+from oslo.config import cfg
+
+from dreadfort import codec
+from dreadfort import config
+from dreadfort import env
+from dreadfort import metrics
+
+
+_LOG = env.get_logger(__name__)
+
+# Spool configuration options
+_SPOOL_GROUP = cfg.OptGroup(name='spool', title='Spool Options')
+config.get_config().register_group(_SPOOL_GROUP)
+
+_SPOOL_OPTIONS = [
+    cfg.BoolOpt('enabled',
+                default=False,
+                help="""spool messages to disk while the broker is
+                unavailable or backed up"""
+                ),
+    cfg.StrOpt('spool_dir',
+               default='/var/lib/dreadfort/spool',
+               help="""directory where each receiver process keeps its
+               spool"""
+               ),
+    cfg.IntOpt('segment_size',
+               default=64 * 1024 * 1024,
+               help="""size in bytes at which a new segment file is
+               started"""
+               ),
+    cfg.IntOpt('max_size',
+               default=1024 * 1024 * 1024,
+               help="""maximum number of bytes of segment files kept by
+               each spool, messages are dropped once it is reached"""
+               ),
+    cfg.IntOpt('fsync_interval',
+               default=100,
+               help="""maximum number of milliseconds between fsyncs of the
+               spooled messages"""
+               )
+]
+
+config.get_config().register_opts(_SPOOL_OPTIONS, group=_SPOOL_GROUP)
+
+try:
+    config.init_config()
+except config.cfg.ConfigFilesNotFoundError as ex:
+    _LOG.exception(ex.message)
+
+_CONF = config.get_config()
+
+ENABLED = _CONF.spool.enabled
+SPOOL_DIR = _CONF.spool.spool_dir
+SEGMENT_SIZE = _CONF.spool.segment_size
+MAX_SIZE = _CONF.spool.max_size
+FSYNC_INTERVAL = _CONF.spool.fsync_interval
+
+SEGMENT_SUFFIX = '.seg'
+CURSOR_FILE = 'cursor'
+
+# payload length, payload crc32, number of messages, time spooled
+_RECORD_HEADER = struct.Struct('!IIId')
+
+
+def _segment_name(segment):
+    return '{0:020d}{1}'.format(segment, SEGMENT_SUFFIX)
+
+
+class Spool(object):
+
+    """
+    An on-disk FIFO of message batches.  One thread may append batches while
+    another replays them with peek() and commit().
+    """
+
+    def __init__(self, spool_dir, segment_size=SEGMENT_SIZE,
+                 max_size=MAX_SIZE, fsync_interval=FSYNC_INTERVAL):
+        """
+        Creates a new Spool, open() must be called before it is used
+
+        :param spool_dir: directory of the segment files of the spool
+        :param segment_size: size in bytes at which a new segment is started
+        :param max_size: maximum number of bytes of segment files
+        :param fsync_interval: maximum number of milliseconds between fsyncs
+        """
+        self.spool_dir = spool_dir
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.fsync_interval = fsync_interval / 1000.0
+        self.size = 0
+
+        self._lock = threading.Condition()
+        self._segments = list()
+        self._segment_sizes = dict()
+        self._next_segment = 0
+        # (segment, offset, length, message count, time spooled) of every
+        # record that has not been replayed yet
+        self._records = deque()
+        self._depth = 0
+        self._fd = None
+        self._dirty = False
+        self._synced_at = 0
+        self._cursor = None
+        self._cursor_saved_at = 0
+        self._opened = False
+
+    @property
+    def depth(self):
+        """
+        Number of spooled messages that have not been replayed
+        """
+        return self._depth
+
+    @property
+    def empty(self):
+        return not self._records
+
+    @property
+    def age(self):
+        """
+        Number of seconds the oldest spooled record has waited, 0 when the
+        spool is empty
+        """
+        try:
+            return time.time() - self._records[0][4]
+        except IndexError:
+            return 0
+
+    def open(self):
+        """
+        Opens the spool, recovering the records that were not replayed
+        before the spool was last closed
+        """
+        with self._lock:
+            if not os.path.isdir(self.spool_dir):
+                os.makedirs(self.spool_dir)
+
+            self._segments = sorted(
+                int(name[:-len(SEGMENT_SUFFIX)])
+                for name in os.listdir(self.spool_dir)
+                if name.endswith(SEGMENT_SUFFIX))
+
+            cursor = self._load_cursor()
+            if cursor is None and self._segments:
+                cursor = (self._segments[0], 0)
+
+            for segment in list(self._segments):
+                if cursor and segment < cursor[0]:
+                    self._delete_segment(segment)
+                    continue
+
+                offset = cursor[1] if segment == cursor[0] else 0
+                self._scan_segment(segment, offset)
+
+            if cursor:
+                self._next_segment = max(self._segments + [cursor[0]]) + 1
+
+            self._cursor = cursor
+            self._opened = True
+            self._update_metrics()
+
+    def append(self, msgs):
+        """
+        Appends a batch of messages to the spool, returns False if the batch
+        was dropped because the spool is full
+        """
+        payload = codec.dumps(msgs)
+        spooled_at = time.time()
+        record = _RECORD_HEADER.pack(
+            len(payload), zlib.crc32(payload) & 0xffffffff, len(msgs),
+            spooled_at) + payload
+
+        with self._lock:
+            if self.size + len(record) > self.max_size:
+                metrics.increment('spool.dropped_messages', len(msgs))
+                return False
+
+            if self._fd is None or (
+                    self._segment_sizes[self._segments[-1]] and
+                    self._segment_sizes[self._segments[-1]] + len(record) >
+                    self.segment_size):
+                self._new_segment()
+
+            segment = self._segments[-1]
+            offset = self._segment_sizes[segment]
+            os.write(self._fd, record)
+
+            self._segment_sizes[segment] += len(record)
+            self.size += len(record)
+            self._records.append(
+                (segment, offset, len(record), len(msgs), spooled_at))
+            self._depth += len(msgs)
+            self._dirty = True
+
+            if spooled_at - self._synced_at >= self.fsync_interval:
+                self._sync()
+
+            self._lock.notify()
+
+        metrics.increment('spool.appended_messages', len(msgs))
+        self._update_metrics()
+        return True
+
+    def peek(self):
+        """
+        Returns the oldest batch of messages that has not been replayed, or
+        None if the spool is empty.  Records that can not be read are
+        skipped.
+        """
+        with self._lock:
+            self._maybe_sync()
+            while self._records:
+                segment, offset, length, count, spooled_at = self._records[0]
+                try:
+                    return self._read_record(segment, offset, length)
+                except (IOError, OSError, ValueError) as ex:
+                    _LOG.exception(ex)
+                    metrics.increment('spool.corrupt_records')
+                    self._commit()
+
+    def commit(self):
+        """
+        Marks the batch returned by the last peek() as replayed
+        """
+        with self._lock:
+            if self._records:
+                self._commit()
+
+        self._update_metrics()
+
+    def wait(self, timeout):
+        """
+        Waits up to timeout seconds for the spool to hold a record
+        """
+        with self._lock:
+            self._maybe_sync()
+            if not self._records:
+                self._lock.wait(timeout)
+        self._update_metrics()
+
+    def sync(self):
+        """
+        Flushes the appended records and the cursor to disk
+        """
+        with self._lock:
+            self._sync()
+            self._save_cursor()
+
+    def close(self):
+        with self._lock:
+            if not self._opened:
+                return
+            self._sync()
+            self._save_cursor()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._opened = False
+
+    def _path(self, name):
+        return os.path.join(self.spool_dir, name)
+
+    def _new_segment(self):
+        if self._fd is not None:
+            self._sync()
+            os.close(self._fd)
+
+        segment = self._next_segment
+        self._next_segment += 1
+        if self._cursor is None:
+            self._cursor = (segment, 0)
+
+        self._fd = os.open(self._path(_segment_name(segment)),
+                           os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._segments.append(segment)
+        self._segment_sizes[segment] = 0
+
+    def _scan_segment(self, segment, offset):
+        path = self._path(_segment_name(segment))
+        size = os.path.getsize(path)
+
+        with open(path, 'rb') as segment_file:
+            segment_file.seek(offset)
+            while offset + _RECORD_HEADER.size <= size:
+                length, crc, count, spooled_at = _RECORD_HEADER.unpack(
+                    segment_file.read(_RECORD_HEADER.size))
+                record_length = _RECORD_HEADER.size + length
+                if offset + record_length > size:
+                    break
+                self._records.append(
+                    (segment, offset, record_length, count, spooled_at))
+                self._depth += count
+                segment_file.seek(length, os.SEEK_CUR)
+                offset += record_length
+
+        if offset < size:
+            # the tail of a record that was being written during a crash
+            _LOG.warning('Truncating incomplete record in {0}'.format(path))
+            with open(path, 'r+b') as segment_file:
+                segment_file.truncate(offset)
+            size = offset
+
+        self._segment_sizes[segment] = size
+        self.size += size
+
+        if segment == self._segments[-1]:
+            self._fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+
+    def _read_record(self, segment, offset, length):
+        with open(self._path(_segment_name(segment)), 'rb') as segment_file:
+            segment_file.seek(offset)
+            record = segment_file.read(length)
+
+        if len(record) != length:
+            raise ValueError('Spool record is truncated')
+
+        payload_length, crc, count, spooled_at = _RECORD_HEADER.unpack_from(
+            record)
+        payload = record[_RECORD_HEADER.size:]
+        if (payload_length != len(payload) or
+                zlib.crc32(payload) & 0xffffffff != crc):
+            raise ValueError('Spool record checksum mismatch')
+
+        return codec.loads(payload)
+
+    def _commit(self):
+        segment, offset, length, count, spooled_at = self._records.popleft()
+        self._depth -= count
+        self._cursor = (segment, offset + length)
+
+        # delete the segments that hold no more records to replay
+        next_segment = self._records[0][0] if self._records else None
+        for old_segment in list(self._segments):
+            if next_segment is not None and old_segment >= next_segment:
+                break
+            if old_segment == self._segments[-1] and self._records:
+                break
+            if old_segment == self._segments[-1]:
+                # the spool is empty, start the next append in a new segment
+                os.close(self._fd)
+                self._fd = None
+                self._dirty = False
+            self._delete_segment(old_segment)
+
+        if time.time() - self._cursor_saved_at >= self.fsync_interval:
+            self._save_cursor()
+
+    def _delete_segment(self, segment):
+        try:
+            os.remove(self._path(_segment_name(segment)))
+        except OSError as ex:
+            _LOG.exception(ex)
+        self._segments.remove(segment)
+        self.size -= self._segment_sizes.pop(segment, 0)
+
+    def _maybe_sync(self):
+        # appends only sync once the interval has passed, records appended
+        # just before the spool goes quiet are synced by the reader
+        if self._dirty and \
+                time.time() - self._synced_at >= self.fsync_interval:
+            self._sync()
+
+    def _sync(self):
+        if self._dirty and self._fd is not None:
+            os.fsync(self._fd)
+        self._dirty = False
+        self._synced_at = time.time()
+
+    def _load_cursor(self):
+        try:
+            with open(self._path(CURSOR_FILE)) as cursor_file:
+                segment, offset = cursor_file.read().split()
+                return int(segment), int(offset)
+        except (IOError, ValueError):
+            return None
+
+    def _save_cursor(self):
+        self._cursor_saved_at = time.time()
+        if self._cursor is None:
+            return
+
+        path = self._path(CURSOR_FILE)
+        tmp_path = '{0}.tmp'.format(path)
+        with open(tmp_path, 'w') as cursor_file:
+            cursor_file.write('{0} {1}'.format(*self._cursor))
+        os.rename(tmp_path, path)
+
+    def _update_metrics(self):
+        metrics.gauge('spool.depth', self._depth)
+        metrics.gauge('spool.bytes', self.size)
+        metrics.gauge('spool.age', self.age)
@@ -6,6 +6,7 @@ import falcon
 import falcon.testing as testing
 from dreadfort.api.http_log.resources import PublishMessageResource
 from dreadfort.api.tenant.resources import MESSAGE_TOKEN
+from dreadfort.correlation import errors
 from dreadfort.data.model import tenant
 from dreadfort.openstack.common import jsonutils
 
@@ -75,8 +76,12 @@ class WhenTestingPublishMessage(testing.TestBase):
 
     def test_returns_202_for_non_durable_message(self):
         correlate_http_msg_func = MagicMock()
+        correlate_cached_msg_func = MagicMock(return_value=False)
         with patch('dreadfort.correlation.correlator.correlate_http_message',
-                   correlate_http_msg_func):
+                   correlate_http_msg_func), \
+                patch('dreadfort.correlation.correlator.'
+                      'correlate_cached_message',
+                      correlate_cached_msg_func):
             self.simulate_request(
                 self.test_route,
                 method='POST',
@@ -89,6 +94,47 @@ class WhenTestingPublishMessage(testing.TestBase):
 
         self.assertEquals(falcon.HTTP_202, self.srmock.status)
 
+    def _simulate_publish(self, correlate_cached_msg_func):
+        correlate_http_msg_func = MagicMock()
+        with patch('dreadfort.correlation.correlator.correlate_http_message',
+                   correlate_http_msg_func), \
+                patch('dreadfort.correlation.correlator.'
+                      'correlate_cached_message',
+                      correlate_cached_msg_func):
+            self.simulate_request(
+                self.test_route,
+                method='POST',
+                headers={
+                    'content-type': 'application/json',
+                    MESSAGE_TOKEN: self.token
+                },
+                body=jsonutils.dumps(self.message))
+        return correlate_http_msg_func
+
+    def test_returns_202_and_does_not_queue_cached_message(self):
+        correlate_http_msg_func = self._simulate_publish(
+            MagicMock(return_value=True))
+        self.assertFalse(correlate_http_msg_func.delay.called)
+        self.assertEquals(falcon.HTTP_202, self.srmock.status)
+
+    def test_queues_message_on_cache_miss(self):
+        correlate_http_msg_func = self._simulate_publish(
+            MagicMock(return_value=False))
+        self.assertTrue(correlate_http_msg_func.delay.called)
+        self.assertEquals(falcon.HTTP_202, self.srmock.status)
+
+    def test_returns_401_for_invalid_message_token(self):
+        correlate_http_msg_func = self._simulate_publish(
+            MagicMock(side_effect=errors.MessageAuthenticationError))
+        self.assertFalse(correlate_http_msg_func.delay.called)
+        self.assertEquals(falcon.HTTP_401, self.srmock.status)
+
+    def test_returns_404_for_unknown_tenant(self):
+        correlate_http_msg_func = self._simulate_publish(
+            MagicMock(side_effect=errors.ResourceNotFoundError))
+        self.assertFalse(correlate_http_msg_func.delay.called)
+        self.assertEquals(falcon.HTTP_404, self.srmock.status)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from mock import MagicMock
+from mock import patch
+
+import falcon
+
+from dreadfort.api.metrics.resources import MetricsResource
+from dreadfort.openstack.common import jsonutils
+
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(WhenTestingMetricsResource())
+    return test_suite
+
+
+class WhenTestingMetricsResource(unittest.TestCase):
+
+    def setUp(self):
+        self.req = MagicMock()
+        self.resp = MagicMock()
+        self.resource = MetricsResource()
+        self.metrics = {
+            'counters': {'cache.tenant.hit': 3},
+            'histograms': {}
+        }
+
+    def test_should_return_collected_metrics(self):
+        with patch('dreadfort.api.metrics.resources.metrics.collect',
+                   MagicMock(return_value=self.metrics)):
+            self.resource.on_get(self.req, self.resp)
+        self.assertEqual(falcon.HTTP_200, self.resp.status)
+        self.assertEqual(jsonutils.loads(self.resp.body), self.metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ import falcon.testing as testing
 from mock import MagicMock
 from mock import patch
 with patch('dreadfort.api.tenant.resources.tenant_util', MagicMock()):
+    from dreadfort.api.tenant.resources import CorrelationResource
     from dreadfort.api.tenant.resources import EventProducerResource
     from dreadfort.api.tenant.resources import EventProducersResource
     from dreadfort.api.tenant.resources import MESSAGE_TOKEN
@@ -37,6 +38,8 @@ def suite():
     test_suite.addTest(TestingTokenResourceOnGet())
     test_suite.addTest(TestingTokenResourceOnPost())
 
+    test_suite.addTest(TestingCorrelationResourceOnGet())
+
     return test_suite
 
 
@@ -798,6 +801,38 @@ class TestingEventProducerResourceOnPut(TenantApiTestBase):
             )
             self.assertEqual(falcon.HTTP_200, self.srmock.status)
 
+    def test_producer_update_rebuilds_correlation_template(self):
+        with patch(
+                'dreadfort.api.tenant.resources.tenant_util.find_tenant',
+                self.tenant_found), \
+                patch(
+                    'dreadfort.api.tenant.resources.tenant_util.save_tenant',
+                    MagicMock()):
+            self.simulate_request(
+                '/v1/tenant/{tenant_id}/producers/{event_producer_id}'.format(
+                    tenant_id=self.tenant_id,
+                    event_producer_id=self.producer_id
+                ),
+                method='PUT',
+                headers={'content-type': 'application/json'},
+                body=jsonutils.dumps(
+                    {
+                        'event_producer': {
+                            'name': self.producer_name,
+                            'pattern': 'apache',
+                            'durable': True,
+                            'sinks': ['hdfs']
+                        }
+                    }
+                )
+            )
+            self.assertEqual(falcon.HTTP_200, self.srmock.status)
+
+        template = self.tenant.get_correlation_template(self.producer_name)
+        self.assertEqual(template['pattern'], 'apache')
+        self.assertTrue(template['durable'])
+        self.assertEqual(template['sinks'], ['hdfs'])
+
 
 class TestingEventProducerResourceOnDelete(TenantApiTestBase):
 
@@ -1022,6 +1057,56 @@ class TestingTokenResourceOnPost(TenantApiTestBase):
                            self.timestamp_original)
 
 
+class TestingCorrelationResourceOnGet(TenantApiTestBase):
+
+    def _set_resource(self):
+        self.resource = CorrelationResource()
+        self.test_route = '/v1/tenant/{tenant_id}/correlation'
+        self.api.add_route(self.test_route, self.resource)
+
+    def test_return_400_for_no_message_token_header(self):
+        with patch('dreadfort.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_found):
+            self.simulate_request(self.test_route, method='GET')
+            self.assertEqual(falcon.HTTP_400, self.srmock.status)
+
+    def test_return_404_for_tenant_not_found(self):
+        with patch('dreadfort.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_not_found):
+            self.simulate_request(
+                self.test_route,
+                method='GET',
+                headers={MESSAGE_TOKEN: self.token_original})
+            self.assertEqual(falcon.HTTP_404, self.srmock.status)
+
+    def test_return_401_for_invalid_token(self):
+        with patch('dreadfort.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_found):
+            self.simulate_request(
+                self.test_route,
+                method='GET',
+                headers={MESSAGE_TOKEN: self.token_invalid})
+            self.assertEqual(falcon.HTTP_401, self.srmock.status)
+
+    def test_should_return_200_previous_token(self):
+        with patch('dreadfort.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_found):
+            self.simulate_request(
+                self.test_route,
+                method='GET',
+                headers={MESSAGE_TOKEN: self.token_previous})
+            self.assertEqual(falcon.HTTP_200, self.srmock.status)
+
+    def test_should_return_tenant_json(self):
+        self.req.get_header.return_value = self.token_original
+        with patch('dreadfort.api.tenant.resources.tenant_util.find_tenant',
+                   self.tenant_found):
+            self.resource.on_get(self.req, self.resp, self.tenant_id)
+
+        parsed_body = jsonutils.loads(self.resp.body)
+        self.assertEqual(parsed_body['tenant'], self.tenant.format())
+
+
 class TestingTokenResourceValidation(TenantApiTestBase):
 
     def _set_resource(self):
@@ -0,0 +1,77 @@
+import datetime
+import unittest
+
+from kombu import serialization
+from mock import patch
+
+from dreadfort import codec
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingCodec())
+    return suite
+
+
+class WhenTestingCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.message = {
+            'host': 'tohru',
+            'pname': 'apache',
+            'native': {'origin': {'x-pid': '12662'}},
+            'dreadfort': {
+                'tenant': '1022',
+                'correlation': {
+                    'ep_id': 432,
+                    'durable': False,
+                    'sinks': ['elasticsearch']
+                }
+            }
+        }
+
+    def test_backends_round_trip_messages(self):
+        for name in ['json', 'simplejson', 'ujson', 'msgpack']:
+            try:
+                backend = codec.get_codec(name)
+            except ValueError:
+                continue
+            self.assertEqual(
+                backend.loads(backend.dumps(self.message)), self.message)
+
+    def test_get_codec_of_unavailable_backend(self):
+        with self.assertRaises(ValueError):
+            codec.get_codec('pickle')
+
+    def test_datetimes_are_encoded_as_iso_8601(self):
+        timestamp = datetime.datetime(2013, 7, 12, 14, 17, 0, 134000)
+        for name in ['json', 'simplejson']:
+            backend = codec.get_codec(name)
+            self.assertEqual(
+                backend.loads(backend.dumps({'@timestamp': timestamp})),
+                {'@timestamp': '2013-07-12T14:17:00.134000Z'})
+
+    def test_codecs_are_registered_with_kombu(self):
+        for serializer in codec.SERIALIZERS:
+            content_type, content_encoding, data = serialization.dumps(
+                self.message, serializer=serializer)
+            self.assertEqual(
+                serialization.loads(data, content_type, content_encoding),
+                self.message)
+
+    def test_dumps_and_loads_use_configured_backend(self):
+        backend = codec.get_codec('json')
+        with patch.object(codec, 'CODEC', backend):
+            self.assertEqual(
+                codec.dumps(self.message), backend.dumps(self.message))
+            self.assertEqual(
+                codec.loads(backend.dumps(self.message)), self.message)
+
+    def test_loads_json_with_binary_backend(self):
+        with patch.object(codec, 'JSON_CODEC', codec.get_codec('simplejson')):
+            self.assertEqual(
+                codec.loads_json('{"host": "tohru"}'), {'host': 'tohru'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,8 @@
+import copy
 import httplib
+import os
+import shutil
+import tempfile
 import unittest
 
 from mock import MagicMock
@@ -96,6 +100,22 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
             coordinator_uri='http://192.168.1.2/v1')
         self.get_config = MagicMock(return_value=self.config)
         self.tenant_found = MagicMock(return_value=self.tenant)
+        correlator.cache_handler.ConfigCache().clear()
+        correlator.cache_handler.TenantCache().clear()
+        correlator.cache_handler.TokenCache().clear()
+        correlator.cache_handler.RejectionCache().clear()
+        self.lock_path = tempfile.mkdtemp()
+        self.lock_path_patch = patch.object(
+            correlator, 'LOCK_PATH', self.lock_path)
+        self.lock_path_patch.start()
+
+    def tearDown(self):
+        self.lock_path_patch.stop()
+        shutil.rmtree(self.lock_path)
+        correlator.cache_handler.ConfigCache().clear()
+        correlator.cache_handler.TenantCache().clear()
+        correlator.cache_handler.TokenCache().clear()
+        correlator.cache_handler.RejectionCache().clear()
 
     def test_correlate_syslog_message_exception(self):
         http_request = MagicMock(side_effect=requests.RequestException)
@@ -155,17 +175,18 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
             get_tenant_from_cache_func.assert_called_once_with(
                 self.tenant_id, self.message_token, self.src_msg)
 
-    def test_validate_token_from_cache_calls_validate_token_coordinator(self):
-        validate_token_from_coordinator_func = MagicMock()
+    def test_validate_token_from_cache_calls_get_tenant_from_coordinator(
+            self):
+        get_tenant_from_coordinator_func = MagicMock()
         with patch.object(correlator.cache_handler.TokenCache, 'get_token',
                           self.get_none), \
                 patch('dreadfort.correlation.correlator.'
-                      '_validate_token_with_coordinator',
-                      validate_token_from_coordinator_func):
+                      '_get_tenant_from_coordinator',
+                      get_tenant_from_coordinator_func):
 
             correlator._validate_token_from_cache(
                 self.tenant_id, self.message_token, self.src_msg)
-            validate_token_from_coordinator_func.assert_called_once_with(
+            get_tenant_from_coordinator_func.assert_called_once_with(
                 self.tenant_id, self.message_token, self.src_msg)
 
     # Tests for _get_tenant_from_cache
@@ -197,22 +218,10 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
             add_correlation_info_to_message_func.assert_called_once_with(
                 self.tenant, self.src_msg)
 
-    # Tests for _validate_token_with_coordinator
-    def test_validate_token_with_coordinator_throws_communication_error(self):
-        http_request = MagicMock(side_effect=requests.RequestException)
-
-        with patch.object(correlator, '_get_config_from_cache',
-                          self.get_config),\
-            patch('dreadfort.correlation.correlator.http_request',
-                  http_request):
-
-            with self.assertRaises(errors.CoordinatorCommunicationError):
-                correlator._validate_token_with_coordinator(
-                    self.tenant_id, self.message_token, self.src_msg)
-
-    def test_validate_token_with_coordinator_throws_auth_error(self):
+    # Tests for _get_tenant_from_coordinator
+    def test_get_tenant_from_coordinator_throws_auth_error(self):
         response = MagicMock()
-        response.status_code = httplib.NOT_FOUND
+        response.status_code = httplib.UNAUTHORIZED
         http_request = MagicMock(return_value=response)
 
         with patch.object(correlator, '_get_config_from_cache',
@@ -221,28 +230,27 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
                       http_request):
 
             with self.assertRaises(errors.MessageAuthenticationError):
-                correlator._validate_token_with_coordinator(
+                correlator._get_tenant_from_coordinator(
                     self.tenant_id, self.invalid_message_token, self.src_msg)
 
-    def test_validate_token_with_coordinator_calls_get_tenant(self):
-        response = MagicMock()
-        response.status_code = httplib.OK
-        http_request = MagicMock(return_value=response)
-        get_tenant_from_coordinator_func = MagicMock()
-        with patch.object(correlator, '_get_config_from_cache',
-                          self.get_config), \
-            patch('dreadfort.correlation.correlator.http_request',
-                  http_request),\
+    def test_get_tenant_from_coordinator_calls_add_correlation(self):
+        fetch_tenant_from_coordinator_func = MagicMock(
+            return_value=self.tenant)
+        add_correlation_info_to_message_func = MagicMock()
+        with patch('dreadfort.correlation.correlator.'
+                   '_fetch_tenant_from_coordinator',
+                   fetch_tenant_from_coordinator_func), \
             patch('dreadfort.correlation.correlator.'
-                  '_get_tenant_from_coordinator',
-                  get_tenant_from_coordinator_func):
-            correlator._validate_token_with_coordinator(self.tenant_id,
-                                                        self.message_token,
-                                                        self.src_msg)
-        get_tenant_from_coordinator_func.assert_called_once_with(
-            self.tenant_id, self.message_token, self.src_msg)
+                  '_add_correlation_info_to_message',
+                  add_correlation_info_to_message_func):
+            correlator._get_tenant_from_coordinator(self.tenant_id,
+                                                    self.message_token,
+                                                    self.src_msg)
+        fetch_tenant_from_coordinator_func.assert_called_once_with(
+            self.tenant_id, self.message_token)
+        add_correlation_info_to_message_func.assert_called_once_with(
+            self.tenant, self.src_msg)
 
-    # Tests for _get_tenant_from_coordinator
     def test_get_tenant_from_coordinator_throws_communication_error(self):
         http_request = MagicMock(
             side_effect=requests.RequestException)
@@ -257,33 +265,132 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
                                                         self.message_token,
                                                         self.src_msg)
 
-    def test_get_tenant_from_coordinator_throws_auth_error(self):
+    # Tests for _request_validated_tenant
+    def test_request_validated_tenant_returns_tenant(self):
+        response = MagicMock()
+        response.status_code = httplib.OK
+        http_request = MagicMock(return_value=response)
+
+        with patch('dreadfort.correlation.correlator.http_request',
+                   http_request), \
+                patch('dreadfort.correlation.correlator.tenant_util.'
+                      'load_tenant_from_dict',
+                      self.tenant_found):
+            tenant = correlator._request_validated_tenant(
+                self.config, self.tenant_id, self.message_token)
+
+        self.assertEqual(tenant, self.tenant)
+        http_request.assert_called_once_with(
+            'http://192.168.1.2/v1/tenant/{0}/correlation'.format(
+                self.tenant_id),
+            {'MESSAGE-TOKEN': self.message_token, 'hostname': 'worker01'},
+            http_verb='GET')
+
+    def test_request_validated_tenant_counts_coordinator_outcome(self):
+        increment = MagicMock()
+        response = MagicMock()
+        response.status_code = httplib.NOT_FOUND
+        response.json.return_value = {'title': 'Unable to locate tenant.'}
+        with patch('dreadfort.correlation.correlator.http_request',
+                   MagicMock(return_value=response)), \
+                patch('dreadfort.correlation.correlator.metrics.increment',
+                      increment):
+            with self.assertRaises(errors.ResourceNotFoundError):
+                correlator._request_validated_tenant(
+                    self.config, self.tenant_id, self.message_token)
+        increment.assert_called_once_with('coordinator.not_found')
+
+    def test_request_validated_tenant_throws_auth_error(self):
+        response = MagicMock()
+        response.status_code = httplib.UNAUTHORIZED
+        http_request = MagicMock(return_value=response)
+
+        with patch('dreadfort.correlation.correlator.http_request',
+                   http_request):
+
+            with self.assertRaises(errors.MessageAuthenticationError):
+                correlator._request_validated_tenant(
+                    self.config, self.tenant_id, self.invalid_message_token)
+
+    def test_request_validated_tenant_throws_resource_not_found_error(self):
         response = MagicMock()
         response.status_code = httplib.NOT_FOUND
+        response.json.return_value = {'title': 'Unable to locate tenant.'}
         http_request = MagicMock(return_value=response)
 
-        with patch.object(correlator, '_get_config_from_cache',
-                          self.get_config), \
-                patch('dreadfort.correlation.correlator.http_request',
-                      http_request):
+        with patch('dreadfort.correlation.correlator.http_request',
+                   http_request):
 
             with self.assertRaises(errors.ResourceNotFoundError):
-                correlator._get_tenant_from_coordinator(
-                    self.tenant_id, self.invalid_message_token, self.src_msg)
+                correlator._request_validated_tenant(
+                    self.config, self.tenant_id, self.invalid_message_token)
+
+    def test_request_validated_tenant_falls_back_without_route(self):
+        route_missing = MagicMock()
+        route_missing.status_code = httplib.NOT_FOUND
+        route_missing.json.side_effect = ValueError('No JSON')
+        token_valid = MagicMock()
+        token_valid.status_code = httplib.OK
+        tenant_found = MagicMock()
+        tenant_found.status_code = httplib.OK
+        tenant_found.json.return_value = {'tenant': 'tenant document'}
+        http_request = MagicMock(
+            side_effect=[route_missing, token_valid, tenant_found])
+
+        with patch('dreadfort.correlation.correlator.http_request',
+                   http_request), \
+                patch('dreadfort.correlation.correlator.tenant_util.'
+                      'load_tenant_from_dict',
+                      self.tenant_found):
+            tenant = correlator._request_validated_tenant(
+                self.config, self.tenant_id, self.message_token)
+
+        self.assertEqual(tenant, self.tenant)
+        self.tenant_found.assert_called_once_with('tenant document')
+        headers = {'MESSAGE-TOKEN': self.message_token,
+                   'hostname': 'worker01'}
+        http_request.assert_any_call(
+            'http://192.168.1.2/v1/tenant/{0}/token'.format(self.tenant_id),
+            headers, http_verb='HEAD')
+        http_request.assert_called_with(
+            'http://192.168.1.2/v1/tenant/{0}'.format(self.tenant_id),
+            headers, http_verb='GET')
+
+    def test_request_validated_tenant_fallback_throws_auth_error(self):
+        route_missing = MagicMock()
+        route_missing.status_code = httplib.NOT_FOUND
+        route_missing.json.return_value = {'title': '404 Not Found'}
+        token_invalid = MagicMock()
+        token_invalid.status_code = httplib.UNAUTHORIZED
+        http_request = MagicMock(side_effect=[route_missing, token_invalid])
+
+        with patch('dreadfort.correlation.correlator.http_request',
+                   http_request):
+            with self.assertRaises(errors.MessageAuthenticationError):
+                correlator._request_validated_tenant(
+                    self.config, self.tenant_id, self.invalid_message_token)
+        self.assertEqual(http_request.call_count, 2)
+
+    def test_request_tenant_throws_resource_not_found_error(self):
+        response = MagicMock()
+        response.status_code = httplib.NOT_FOUND
+        with patch('dreadfort.correlation.correlator.http_request',
+                   MagicMock(return_value=response)):
+            with self.assertRaises(errors.ResourceNotFoundError):
+                correlator._request_tenant(
+                    self.config, self.tenant_id, self.message_token)
 
-    def test_get_tenant_from_coordinator_throws_resource_not_found_error(self):
+    def test_request_validated_tenant_throws_communication_error(self):
         response = MagicMock()
         response.status_code = httplib.BAD_REQUEST
         http_request = MagicMock(return_value=response)
 
-        with patch.object(correlator, '_get_config_from_cache',
-                          self.get_config), \
-                patch('dreadfort.correlation.correlator.http_request',
-                      http_request):
+        with patch('dreadfort.correlation.correlator.http_request',
+                   http_request):
 
             with self.assertRaises(errors.CoordinatorCommunicationError):
-                correlator._get_tenant_from_coordinator(
-                    self.tenant_id, self.invalid_message_token, self.src_msg)
+                correlator._request_validated_tenant(
+                    self.config, self.tenant_id, self.invalid_message_token)
 
     def test_get_tenant_from_coordinator_calls_get_tenant(self):
         response = MagicMock()
@@ -306,6 +413,199 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
         add_correlation_info_to_message_func.assert_called_once_with(
             self.tenant, self.src_msg)
 
+    # Tests for _fetch_tenant_from_coordinator
+    def test_fetch_tenant_from_coordinator_saves_tenant_to_cache(self):
+        response = MagicMock()
+        response.status_code = httplib.OK
+        http_request = MagicMock(return_value=response)
+        save_tenant_to_cache_func = MagicMock()
+        with patch.object(correlator, '_get_config_from_cache',
+                          self.get_config), \
+                patch('dreadfort.correlation.correlator.http_request',
+                      http_request), \
+                patch('dreadfort.correlation.correlator.tenant_util.'
+                      'load_tenant_from_dict',
+                      self.tenant_found), \
+                patch('dreadfort.correlation.correlator.'
+                      '_save_tenant_to_cache',
+                      save_tenant_to_cache_func):
+            tenant = correlator._fetch_tenant_from_coordinator(
+                self.tenant_id, self.message_token)
+
+        self.assertEqual(tenant, self.tenant)
+        save_tenant_to_cache_func.assert_called_once_with(
+            self.tenant_id, self.tenant)
+
+    def test_fetch_tenant_from_coordinator_uses_cache_filled_in_flight(self):
+        http_request = MagicMock()
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token), \
+                patch.object(correlator.cache_handler.TenantCache,
+                             'get_tenant', self.get_tenant), \
+                patch('dreadfort.correlation.correlator.http_request',
+                      http_request):
+            tenant = correlator._fetch_tenant_from_coordinator(
+                self.tenant_id, self.message_token)
+
+            with self.assertRaises(errors.MessageAuthenticationError):
+                correlator._fetch_tenant_from_coordinator(
+                    self.tenant_id, self.invalid_message_token)
+
+        self.assertEqual(tenant, self.tenant)
+        self.assertFalse(http_request.called)
+
+    def test_fetch_tenant_from_coordinator_rejects_unknown_tenant(self):
+        response = MagicMock()
+        response.status_code = httplib.NOT_FOUND
+        response.json.return_value = {'title': 'Unable to locate tenant.'}
+        http_request = MagicMock(return_value=response)
+        with patch.object(correlator, '_get_config_from_cache',
+                          self.get_config), \
+                patch('dreadfort.correlation.correlator.http_request',
+                      http_request):
+            for _ in range(2):
+                with self.assertRaises(errors.ResourceNotFoundError):
+                    correlator._fetch_tenant_from_coordinator(
+                        self.tenant_id, self.message_token)
+
+        self.assertEqual(http_request.call_count, 1)
+
+    def test_fetch_tenant_from_coordinator_rejects_invalid_token(self):
+        response = MagicMock()
+        response.status_code = httplib.UNAUTHORIZED
+        http_request = MagicMock(return_value=response)
+        with patch.object(correlator, '_get_config_from_cache',
+                          self.get_config), \
+                patch('dreadfort.correlation.correlator.http_request',
+                      http_request):
+            for _ in range(2):
+                with self.assertRaises(errors.MessageAuthenticationError):
+                    correlator._fetch_tenant_from_coordinator(
+                        self.tenant_id, self.invalid_message_token)
+
+        self.assertEqual(http_request.call_count, 1)
+
+    def test_fetch_tenant_from_coordinator_refreshes_stale_tenant(self):
+        response = MagicMock()
+        response.status_code = httplib.OK
+        http_request = MagicMock(return_value=response)
+        save_tenant_to_cache_func = MagicMock()
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token), \
+                patch.object(correlator.cache_handler.TenantCache,
+                             'get_tenant', self.get_tenant), \
+                patch.object(correlator, '_get_config_from_cache',
+                             self.get_config), \
+                patch('dreadfort.correlation.correlator.http_request',
+                      http_request), \
+                patch('dreadfort.correlation.correlator.tenant_util.'
+                      'load_tenant_from_dict',
+                      self.tenant_found), \
+                patch('dreadfort.correlation.correlator.'
+                      '_save_tenant_to_cache',
+                      save_tenant_to_cache_func):
+            tenant = correlator._fetch_tenant_from_coordinator(
+                self.tenant_id, self.message_token, refresh=True)
+
+        self.assertEqual(tenant, self.tenant)
+        self.assertTrue(http_request.called)
+        save_tenant_to_cache_func.assert_called_once_with(
+            self.tenant_id, self.tenant)
+
+    def test_tenant_lock_is_not_taken_without_shared_caches(self):
+        lock_func = MagicMock()
+        with patch('dreadfort.correlation.correlator.proxy.'
+                   'caches_are_shared', MagicMock(return_value=False)), \
+                patch('dreadfort.correlation.correlator.lockutils.lock',
+                      lock_func):
+            with correlator._tenant_lock(self.tenant_id):
+                pass
+
+        self.assertFalse(lock_func.called)
+
+    def test_tenant_locks_are_spread_over_lock_count_files(self):
+        lock_names = set()
+        with patch('dreadfort.correlation.correlator.proxy.'
+                   'caches_are_shared', MagicMock(return_value=True)), \
+                patch.object(correlator, 'LOCK_COUNT', 4):
+            for tenant_id in [str(n) for n in range(100)] + ['x' * 300]:
+                with correlator._tenant_lock(tenant_id):
+                    pass
+                lock_names.update(os.listdir(self.lock_path))
+
+        self.assertEqual(len(lock_names), 4)
+
+    # Tests for refreshing stale tenants
+    def test_refresh_stale_tenant_starts_one_refresh_per_tenant(self):
+        thread = MagicMock()
+        with patch('dreadfort.correlation.correlator.threading.Thread',
+                   thread):
+            correlator._refresh_stale_tenant(self.tenant_id)
+            correlator._refresh_stale_tenant(self.tenant_id)
+        correlator._refreshing.clear()
+
+        thread.assert_called_once_with(
+            target=correlator._refresh_tenant, args=(self.tenant_id,))
+        thread.return_value.start.assert_called_once_with()
+
+    def test_refresh_tenant_fetches_with_cached_token(self):
+        fetch_tenant_func = MagicMock(return_value=self.tenant)
+        correlator._refreshing.add(self.tenant_id)
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token), \
+                patch.object(correlator, '_fetch_tenant_from_coordinator',
+                             fetch_tenant_func):
+            correlator._refresh_tenant(self.tenant_id)
+
+        fetch_tenant_func.assert_called_once_with(
+            self.tenant_id, self.token.valid, refresh=True)
+        self.assertNotIn(self.tenant_id, correlator._refreshing)
+
+    def test_refresh_tenant_evicts_tenant_not_found(self):
+        evict_tenant_func = MagicMock()
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token), \
+                patch.object(correlator, '_fetch_tenant_from_coordinator',
+                             MagicMock(
+                                 side_effect=errors.ResourceNotFoundError(
+                                     'unable to locate tenant.'))), \
+                patch('dreadfort.correlation.correlator.invalidation.'
+                      'evict_tenant', evict_tenant_func):
+            correlator._refresh_tenant(self.tenant_id)
+
+        evict_tenant_func.assert_called_once_with(self.tenant_id)
+
+    def test_refresh_tenant_keeps_stale_tenant_on_coordinator_error(self):
+        evict_tenant_func = MagicMock()
+        delete_token_func = MagicMock()
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token), \
+                patch.object(correlator.cache_handler.TokenCache,
+                             'delete_token', delete_token_func), \
+                patch.object(correlator, '_fetch_tenant_from_coordinator',
+                             MagicMock(side_effect=errors.
+                                       CoordinatorCommunicationError)), \
+                patch('dreadfort.correlation.correlator.invalidation.'
+                      'evict_tenant', evict_tenant_func):
+            correlator._refresh_tenant(self.tenant_id)
+
+        self.assertFalse(evict_tenant_func.called)
+        self.assertFalse(delete_token_func.called)
+
+    def test_refresh_tenant_drops_rejected_token(self):
+        delete_token_func = MagicMock()
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token), \
+                patch.object(correlator.cache_handler.TokenCache,
+                             'delete_token', delete_token_func), \
+                patch.object(correlator, '_fetch_tenant_from_coordinator',
+                             MagicMock(
+                                 side_effect=errors.MessageAuthenticationError(
+                                     'Message not authenticated'))):
+            correlator._refresh_tenant(self.tenant_id)
+
+        delete_token_func.assert_called_once_with(self.tenant_id)
+
     # Tests for _add_correlation_info_to_message
     def test_add_correlation_info_to_message(self):
         route_message_func = MagicMock()
@@ -315,5 +615,303 @@ class WhenTestingCorrelationPipeline(unittest.TestCase):
                 self.tenant, self.cee_msg)
         route_message_func.assert_called_once_with(self.cee_msg)
 
+    def test_add_correlation_info_to_message_queues_normalization(self):
+        normalize_message = MagicMock()
+        with patch('dreadfort.correlation.correlator.normalizer.'
+                   'should_normalize', MagicMock(return_value=True)), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'NORMALIZE_INLINE', False), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'normalize_message', normalize_message):
+            correlator._add_correlation_info_to_message(
+                self.tenant, self.cee_msg)
+        normalize_message.delay.assert_called_once_with(self.cee_msg)
+        self.assertFalse(normalize_message.called)
+
+    def test_add_correlation_info_to_message_normalizes_inline(self):
+        normalize_message = MagicMock()
+        with patch('dreadfort.correlation.correlator.normalizer.'
+                   'should_normalize', MagicMock(return_value=True)), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'NORMALIZE_INLINE', True), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'normalize_message', normalize_message):
+            correlator._add_correlation_info_to_message(
+                self.tenant, self.cee_msg)
+        normalize_message.assert_called_once_with(self.cee_msg)
+        self.assertFalse(normalize_message.delay.called)
+
+    def test_add_correlation_info_to_message_queues_when_not_inline(self):
+        normalize_message = MagicMock()
+        with patch('dreadfort.correlation.correlator.normalizer.'
+                   'should_normalize', MagicMock(return_value=True)), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'NORMALIZE_INLINE', True), \
+                patch('dreadfort.correlation.correlator.sinks.'
+                      'use_fast_lane', MagicMock(return_value=True)), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'normalize_message', normalize_message):
+            correlator._add_correlation_info_to_message(
+                self.tenant, self.cee_msg, normalize_inline=False)
+        normalize_message.delay.assert_called_once_with(self.cee_msg)
+        self.assertFalse(normalize_message.called)
+
+    def test_add_correlation_info_to_message_queues_failed_inline(self):
+        normalize_message = MagicMock(side_effect=ValueError('bad'))
+        increment = MagicMock()
+        with patch('dreadfort.correlation.correlator.normalizer.'
+                   'should_normalize', MagicMock(return_value=True)), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'NORMALIZE_INLINE', True), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'normalize_message', normalize_message), \
+                patch('dreadfort.correlation.correlator.metrics.increment',
+                      increment):
+            correlator._add_correlation_info_to_message(
+                self.tenant, self.cee_msg)
+        normalize_message.delay.assert_called_once_with(self.cee_msg)
+        increment.assert_called_once_with('normalization.inline_failures')
+
+    # Tests for _route_message_batch
+    def test_route_message_batch_normalizes_inline(self):
+        normalize_message_batch = MagicMock()
+        route_message_batch = MagicMock()
+        with patch('dreadfort.correlation.correlator.normalizer.'
+                   'should_normalize',
+                   MagicMock(side_effect=[True, False])), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'NORMALIZE_INLINE', True), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'normalize_message_batch', normalize_message_batch), \
+                patch('dreadfort.correlation.correlator.sinks.'
+                      'route_message_batch', route_message_batch):
+            correlator._route_message_batch(['normalized', 'routed'])
+        normalize_message_batch.assert_called_once_with(['normalized'])
+        self.assertFalse(normalize_message_batch.delay.called)
+        route_message_batch.assert_called_once_with(['routed'])
+
+    def test_route_message_batch_normalizes_fast_lane_messages_inline(self):
+        normalize_message_batch = MagicMock()
+        with patch('dreadfort.correlation.correlator.normalizer.'
+                   'should_normalize', MagicMock(return_value=True)), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'NORMALIZE_INLINE', False), \
+                patch('dreadfort.correlation.correlator.sinks.'
+                      'use_fast_lane',
+                      MagicMock(side_effect=lambda msg: msg == 'fast')), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'normalize_message_batch', normalize_message_batch):
+            correlator._route_message_batch(['fast', 'durable'])
+        normalize_message_batch.assert_called_once_with(['fast'])
+        normalize_message_batch.delay.assert_called_once_with(['durable'])
+
+    def test_route_message_batch_routes_past_failed_normalization(self):
+        route_message_batch = MagicMock()
+        with patch('dreadfort.correlation.correlator.normalizer.'
+                   'should_normalize',
+                   MagicMock(side_effect=[True, True, False])), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      'NORMALIZE_INLINE', True), \
+                patch('dreadfort.correlation.correlator.normalizer.'
+                      '_normalize',
+                      MagicMock(side_effect=[ValueError('bad'), None])), \
+                patch('dreadfort.correlation.correlator.sinks.'
+                      'route_message_batch', route_message_batch):
+            correlator._route_message_batch(['bad', 'normalized', 'routed'])
+        route_message_batch.assert_any_call(['normalized'])
+        route_message_batch.assert_any_call(['routed'])
+
+    # Tests for _correlate_message
+    def test_correlate_message_stamps_copy_of_template(self):
+        self.cee_msg['pname'] = 'producer1'
+        message = correlator._correlate_message(self.tenant, self.cee_msg)
+        correlation = message['dreadfort']['correlation']
+        template = self.tenant.get_correlation_template('producer1')
+
+        self.assertEqual(message['dreadfort']['tenant'], self.tenant_id)
+        self.assertEqual(correlation['ep_id'], 432)
+        self.assertTrue(correlation['durable'])
+        self.assertIn('@timestamp', correlation)
+        self.assertNotIn('@timestamp', template)
+        self.assertIsNot(correlation, template)
+        self.assertEqual(
+            correlation['destinations'],
+            {'elasticsearch': {'transaction_id': None,
+                               'transaction_time': None}})
+
+    def test_correlate_message_uses_default_producer(self):
+        message = correlator._correlate_message(self.tenant, self.cee_msg)
+        correlation = message['dreadfort']['correlation']
+        self.assertIsNone(correlation['ep_id'])
+        self.assertEqual(correlation['pattern'], 'default')
+
+    # Tests for correlate_cached_message
+    def test_correlate_cached_message_correlates_inline(self):
+        add_correlation_info_to_message_func = MagicMock()
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token), \
+                patch.object(correlator.cache_handler.TenantCache,
+                             'get_tenant', self.get_tenant), \
+                patch('dreadfort.correlation.correlator.'
+                      '_add_correlation_info_to_message',
+                      add_correlation_info_to_message_func):
+            correlated = correlator.correlate_cached_message(
+                self.tenant_id, self.message_token, self.cee_msg)
+
+        self.assertTrue(correlated)
+        add_correlation_info_to_message_func.assert_called_once_with(
+            self.tenant, self.cee_msg, normalize_inline=False)
+
+    def test_correlate_cached_message_returns_false_on_cache_miss(self):
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token), \
+                patch.object(correlator.cache_handler.TenantCache,
+                             'get_tenant', self.get_none):
+            correlated = correlator.correlate_cached_message(
+                self.tenant_id, self.message_token, self.cee_msg)
+
+        self.assertFalse(correlated)
+
+    def test_correlate_cached_message_throws_auth_error(self):
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token):
+            with self.assertRaises(errors.MessageAuthenticationError):
+                correlator.correlate_cached_message(
+                    self.tenant_id, self.invalid_message_token, self.cee_msg)
+
+    def test_correlate_cached_message_throws_not_found_error(self):
+        correlator.cache_handler.RejectionCache().reject_tenant(
+            self.tenant_id)
+        with self.assertRaises(errors.ResourceNotFoundError):
+            correlator.correlate_cached_message(
+                self.tenant_id, self.message_token, self.cee_msg)
+
+    # Tests for correlate_message_batch
+    def test_correlate_message_batch_gets_tenant_once_per_group(self):
+        get_tenant_for_batch_func = MagicMock(
+            return_value=(self.token, self.tenant))
+        route_message_batch_func = MagicMock()
+        with patch('dreadfort.correlation.correlator._get_tenant_for_batch',
+                   get_tenant_for_batch_func), \
+                patch('dreadfort.correlation.correlator._route_message_batch',
+                      route_message_batch_func):
+            failures = correlator.correlate_message_batch(
+                [copy.deepcopy(self.src_msg), copy.deepcopy(self.src_msg)])
+
+        self.assertEqual(failures, [])
+        get_tenant_for_batch_func.assert_called_once_with(
+            self.tenant_id, set([self.message_token]), None, None)
+        correlated_messages = route_message_batch_func.call_args[0][0]
+        self.assertEqual(len(correlated_messages), 2)
+        for message in correlated_messages:
+            self.assertEqual(message['dreadfort']['tenant'], self.tenant_id)
+
+    def test_correlate_message_batch_prefetches_tokens_and_tenants(self):
+        get_tokens_func = MagicMock(
+            return_value={self.tenant_id: self.token})
+        get_tenants_func = MagicMock(
+            return_value={self.tenant_id: self.tenant})
+        get_tenant_for_batch_func = MagicMock(
+            return_value=(self.token, self.tenant))
+        with patch.object(correlator.cache_handler.TokenCache, 'get_tokens',
+                          get_tokens_func), \
+                patch.object(correlator.cache_handler.TenantCache,
+                             'get_tenants', get_tenants_func), \
+                patch('dreadfort.correlation.correlator._get_tenant_for_batch',
+                      get_tenant_for_batch_func), \
+                patch('dreadfort.correlation.correlator._route_message_batch',
+                      MagicMock()):
+            correlator.correlate_message_batch([copy.deepcopy(self.src_msg)])
+
+        get_tokens_func.assert_called_once_with([self.tenant_id])
+        get_tenants_func.assert_called_once_with([self.tenant_id])
+        get_tenant_for_batch_func.assert_called_once_with(
+            self.tenant_id, set([self.message_token]), self.token,
+            self.tenant)
+
+    def test_get_tenant_for_batch_uses_prefetched_token_and_tenant(self):
+        get_token_func = MagicMock()
+        get_tenant_func = MagicMock()
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          get_token_func), \
+                patch.object(correlator.cache_handler.TenantCache,
+                             'get_tenant', get_tenant_func):
+            token, tenant = correlator._get_tenant_for_batch(
+                self.tenant_id, set([self.message_token]), self.token,
+                self.tenant)
+
+        self.assertIs(token, self.token)
+        self.assertIs(tenant, self.tenant)
+        self.assertFalse(get_token_func.called)
+        self.assertFalse(get_tenant_func.called)
+
+    def test_correlate_message_batch_reports_failed_messages(self):
+        invalid_token_msg = copy.deepcopy(self.src_msg)
+        invalid_token_msg['_SDATA']['dreadfort']['token'] = \
+            self.invalid_message_token
+        get_tenant_for_batch_func = MagicMock(
+            return_value=(self.token, self.tenant))
+        route_message_batch_func = MagicMock()
+        with patch('dreadfort.correlation.correlator._get_tenant_for_batch',
+                   get_tenant_for_batch_func), \
+                patch('dreadfort.correlation.correlator._route_message_batch',
+                      route_message_batch_func):
+            failures = correlator.correlate_message_batch(
+                [{}, invalid_token_msg, copy.deepcopy(self.src_msg)])
+
+        self.assertEqual([index for index, _ in failures], [0, 1])
+        correlated_messages = route_message_batch_func.call_args[0][0]
+        self.assertEqual(len(correlated_messages), 1)
+
+    def test_correlate_message_batch_requeues_group_on_comm_error(self):
+        get_tenant_for_batch_func = MagicMock(
+            side_effect=errors.CoordinatorCommunicationError)
+        apply_async_func = MagicMock()
+        with patch('dreadfort.correlation.correlator._get_tenant_for_batch',
+                   get_tenant_for_batch_func), \
+                patch.object(correlator.correlate_message_batch,
+                             'apply_async', apply_async_func), \
+                patch('dreadfort.correlation.correlator._route_message_batch',
+                      MagicMock()):
+            failures = correlator.correlate_message_batch([self.src_msg])
+
+        self.assertEqual(failures, [])
+        self.assertEqual(
+            apply_async_func.call_args[1]['args'], [[self.src_msg]])
+
+    def test_get_tenant_for_batch_from_cache(self):
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token), \
+                patch.object(correlator.cache_handler.TenantCache,
+                             'get_tenant', self.get_tenant):
+            token, tenant = correlator._get_tenant_for_batch(
+                self.tenant_id, set([self.message_token]))
+
+        self.assertEqual(token, self.token)
+        self.assertEqual(tenant, self.tenant)
+
+    def test_get_tenant_for_batch_throws_auth_error_from_cache(self):
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_token):
+            with self.assertRaises(errors.MessageAuthenticationError):
+                correlator._get_tenant_for_batch(
+                    self.tenant_id, set([self.invalid_message_token]))
+
+    def test_get_tenant_for_batch_fetches_from_coordinator(self):
+        fetch_tenant_from_coordinator_func = MagicMock(
+            side_effect=[errors.MessageAuthenticationError, self.tenant])
+        with patch.object(correlator.cache_handler.TokenCache, 'get_token',
+                          self.get_none), \
+                patch('dreadfort.correlation.correlator.'
+                      '_fetch_tenant_from_coordinator',
+                      fetch_tenant_from_coordinator_func):
+            token, tenant = correlator._get_tenant_for_batch(
+                self.tenant_id,
+                [self.invalid_message_token, self.message_token])
+
+        self.assertEqual(token, self.token)
+        self.assertEqual(tenant, self.tenant)
+        self.assertEqual(fetch_tenant_from_coordinator_func.call_count, 2)
+
 if __name__ == '__main__':
     unittest.main()
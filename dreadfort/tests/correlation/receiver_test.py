@@ -73,19 +73,249 @@ class WhenTestingCorrelationInputServer(unittest.TestCase):
         }
         zmq_receiver = MagicMock()
         zmq_receiver.get.return_value = json.dumps(self.src_msg)
-        self.server = receiver.CorrelationInputServer(zmq_receiver)
+        zmq_receiver.has_pending = False
+        self.server = receiver.CorrelationInputServer(
+            zmq_receiver, batch_size=2)
+        self.server._poller = MagicMock()
+        self.server._poller.poll.return_value = [(zmq_receiver.socket, 1)]
 
     def test_process_msg(self):
         correlate_func = MagicMock()
         with patch('dreadfort.correlation.correlator.'
-                   'correlate_syslog_message', correlate_func):
+                   'correlate_message_batch', correlate_func):
             self.server.process_msg()
-            correlate_func.assert_called_once()
+        correlate_func.delay.assert_called_once_with(
+            [self.src_msg, self.src_msg])
+
+    def test_process_msg_without_messages(self):
+        correlate_func = MagicMock()
+        self.server._poller.poll.return_value = []
+        with patch('dreadfort.correlation.correlator.'
+                   'correlate_message_batch', correlate_func):
+            self.server.process_msg()
+        self.assertFalse(correlate_func.delay.called)
+
+    def test_process_msg_waits_for_credit(self):
+        correlate_func = MagicMock()
+        self.server.credit = MagicMock()
+        self.server.credit.wait.return_value = False
+        idle_func = MagicMock()
+        with patch('dreadfort.correlation.correlator.'
+                   'correlate_message_batch', correlate_func), \
+                patch.object(self.server, '_idle', idle_func):
+            self.server.process_msg()
+        self.assertFalse(self.server.zmq_receiver.get.called)
+        self.assertFalse(correlate_func.delay.called)
+        idle_func.assert_called_once_with(receiver.transport.CREDIT_INTERVAL)
+
+    def test_process_msg_drains_without_credit(self):
+        self.server.credit = MagicMock()
+        self.server.credit.wait.return_value = False
+        self.server._poller.poll.return_value = []
+        self.server._stop.clear()
+        self.server.drain()
+
+        self.server.process_msg()
+
+        self.assertTrue(self.server._stop.is_set())
+
+    def test_process_msg_consumes_credit(self):
+        correlate_func = MagicMock()
+        self.server.credit = MagicMock()
+        self.server.credit.wait.return_value = True
+        with patch('dreadfort.correlation.correlator.'
+                   'correlate_message_batch', correlate_func):
+            self.server.process_msg()
+        self.server.credit.consume.assert_called_once_with()
 
     def test_new_correlation_input_server(self):
         server = receiver.new_correlation_input_server()
         self.assertIsInstance(server, receiver.CorrelationInputServer)
 
+    def test_new_correlation_input_servers(self):
+        servers = receiver.new_correlation_input_servers(3)
+        self.assertEqual(len(servers), 3)
+        self.assertIsNot(servers[0].zmq_receiver, servers[1].zmq_receiver)
+
+    def test_new_correlation_input_servers_with_control_sockets(self):
+        with patch('dreadfort.transport.CONTROL_HOST', '127.0.0.1:5200'), \
+                patch('dreadfort.transport.PRIORITY_UPSTREAM_HOSTS',
+                      ['127.0.0.1:5001']):
+            servers = receiver.new_correlation_input_servers(2)
+        self.assertEqual(servers[0].control_host, 'tcp://127.0.0.1:5200')
+        self.assertEqual(servers[1].control_host, 'tcp://127.0.0.1:5201')
+        self.assertEqual(
+            servers[0].priority_receivers[0].upstream_hosts,
+            ['tcp://127.0.0.1:5001'])
+
+    def test_process_msg_spools_when_broker_fails(self):
+        correlate_func = MagicMock()
+        correlate_func.delay.side_effect = IOError()
+        self.server.spool = MagicMock()
+        self.server.spool.empty = True
+        with patch('dreadfort.correlation.correlator.'
+                   'correlate_message_batch', correlate_func):
+            self.server.process_msg()
+        self.server.spool.append.assert_called_once_with(
+            [self.src_msg, self.src_msg])
+
+    def test_process_msg_spools_without_credit(self):
+        correlate_func = MagicMock()
+        self.server.credit = MagicMock()
+        self.server.credit.wait.return_value = False
+        self.server.spool = MagicMock()
+        self.server.spool.empty = True
+        with patch('dreadfort.correlation.correlator.'
+                   'correlate_message_batch', correlate_func):
+            self.server.process_msg()
+        self.server.credit.wait.assert_called_once_with(0)
+        self.assertFalse(correlate_func.delay.called)
+        self.server.spool.append.assert_called_once_with(
+            [self.src_msg, self.src_msg])
+
+    def test_process_msg_spools_behind_spooled_messages(self):
+        correlate_func = MagicMock()
+        self.server.spool = MagicMock()
+        self.server.spool.empty = False
+        with patch('dreadfort.correlation.correlator.'
+                   'correlate_message_batch', correlate_func):
+            self.server.process_msg()
+        self.assertFalse(correlate_func.delay.called)
+        self.assertTrue(self.server.spool.append.called)
+
+    def test_new_correlation_input_server_with_spool(self):
+        with patch('dreadfort.spool.ENABLED', True), \
+                patch('dreadfort.spool.SPOOL_DIR', '/tmp/spool'):
+            server = receiver.new_correlation_input_server(2)
+        self.assertEqual(server.spool.spool_dir, '/tmp/spool/2')
+
+
+class WhenTestingSpoolDrainer(unittest.TestCase):
+
+    def setUp(self):
+        self.spool = MagicMock()
+        self.credit = MagicMock()
+        self.credit.wait.return_value = True
+        self.drainer = receiver.SpoolDrainer(
+            self.spool, self.credit, retry_interval=0)
+        self.msgs = [{'key': 'value'}]
+
+    def _replay(self, correlate_func):
+        with patch('dreadfort.correlation.correlator.'
+                   'correlate_message_batch', correlate_func):
+            return self.drainer.replay()
+
+    def test_replay_queues_spooled_batch(self):
+        correlate_func = MagicMock()
+        self.spool.peek.return_value = self.msgs
+        self.assertTrue(self._replay(correlate_func))
+        correlate_func.delay.assert_called_once_with(self.msgs)
+        self.spool.commit.assert_called_once_with()
+        self.credit.consume.assert_called_once_with()
+
+    def test_replay_waits_for_spooled_batch(self):
+        correlate_func = MagicMock()
+        self.spool.peek.return_value = None
+        self.assertFalse(self._replay(correlate_func))
+        self.assertTrue(self.spool.wait.called)
+        self.assertFalse(correlate_func.delay.called)
+
+    def test_replay_keeps_batch_when_broker_fails(self):
+        correlate_func = MagicMock()
+        correlate_func.delay.side_effect = IOError()
+        self.spool.peek.return_value = self.msgs
+        self.assertFalse(self._replay(correlate_func))
+        self.assertFalse(self.spool.commit.called)
+
+    def test_replay_waits_for_credit(self):
+        correlate_func = MagicMock()
+        self.credit.wait.return_value = False
+        self.spool.peek.return_value = self.msgs
+        self.assertFalse(self._replay(correlate_func))
+        self.assertFalse(correlate_func.delay.called)
+        self.assertFalse(self.spool.commit.called)
+
+
+class WhenTestingBrokerCredit(unittest.TestCase):
+
+    def setUp(self):
+        self.credit = receiver.BrokerCredit(
+            max_queued_tasks=10, credit_interval=0, queue_name='celery')
+        self.sleep = MagicMock()
+
+    def test_wait_without_flow_control(self):
+        credit = receiver.BrokerCredit(max_queued_tasks=0)
+        self.assertFalse(credit.enabled)
+        self.assertTrue(credit.wait(0))
+
+    def test_wait_grants_credit_below_max_queued_tasks(self):
+        with patch.object(self.credit, '_get_queue_depth',
+                          MagicMock(return_value=7)):
+            self.assertTrue(self.credit.wait(100))
+        self.assertEqual(self.credit.credit, 3)
+
+        self.credit.consume()
+        self.assertEqual(self.credit.credit, 2)
+
+    def test_wait_times_out_while_queue_is_full(self):
+        with patch.object(self.credit, '_get_queue_depth',
+                          MagicMock(return_value=10)), \
+                patch('dreadfort.correlation.receiver.time.sleep',
+                      self.sleep):
+            self.assertFalse(self.credit.wait(0))
+
+    def test_wait_resumes_when_queue_drains(self):
+        with patch.object(self.credit, '_get_queue_depth',
+                          MagicMock(side_effect=[12, 10, 4])), \
+                patch('dreadfort.correlation.receiver.time.sleep',
+                      self.sleep):
+            self.assertTrue(self.credit.wait(1000))
+        self.assertEqual(self.sleep.call_count, 2)
+        self.assertEqual(self.credit.credit, 6)
+
+    def test_wait_records_time_held_back_across_calls(self):
+        observe = MagicMock()
+        now = [100.0]
+        with patch.object(self.credit, '_get_queue_depth',
+                          MagicMock(side_effect=[10, 10, 4])), \
+                patch('dreadfort.correlation.receiver.time.time',
+                      lambda: now[0]), \
+                patch('dreadfort.correlation.receiver.metrics.observe',
+                      observe):
+            self.assertFalse(self.credit.wait(0))
+            now[0] += 0.25
+            self.assertFalse(self.credit.wait(0))
+            now[0] += 0.25
+            self.assertTrue(self.credit.wait(0))
+        observe.assert_called_once_with('transport.credit_wait', 0.5)
+
+    def test_no_credit_when_broker_unreachable(self):
+        with patch.object(self.credit, '_get_queue_depth',
+                          MagicMock(return_value=None)), \
+                patch('dreadfort.correlation.receiver.time.sleep',
+                      self.sleep):
+            self.assertFalse(self.credit.wait(0))
+        self.assertEqual(self.credit.credit, 0)
+
+    def test_get_queue_depth(self):
+        connection = MagicMock()
+        connection.default_channel.queue_declare.return_value = (
+            'celery', 5, 1)
+        with patch('dreadfort.correlation.receiver.celery.connection',
+                   MagicMock(return_value=connection)):
+            self.assertEqual(self.credit._get_queue_depth(), 5)
+        connection.default_channel.queue_declare.assert_called_once_with(
+            queue='celery', passive=True)
+
+    def test_get_queue_depth_releases_failed_connection(self):
+        connection = MagicMock()
+        connection.default_channel.queue_declare.side_effect = IOError()
+        with patch('dreadfort.correlation.receiver.celery.connection',
+                   MagicMock(return_value=connection)):
+            self.assertIsNone(self.credit._get_queue_depth())
+        connection.release.assert_called_once_with()
+        self.assertIsNone(self.credit._connection)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,6 +3,8 @@ import unittest
 from mock import MagicMock
 from mock import patch
 
+from dreadfort.data import cache_handler
+from dreadfort.data import cache_record
 from dreadfort.data.cache_handler import Cache
 from dreadfort.data.cache_handler import CACHE_CONFIG
 from dreadfort.data.cache_handler import CACHE_TENANT
@@ -13,6 +15,7 @@ from dreadfort.data.cache_handler import DEFAULT_EXPIRES
 from dreadfort.data.cache_handler import TenantCache
 from dreadfort.data.cache_handler import TokenCache
 from dreadfort.data.cache_handler import NativeProxy
+from dreadfort.data.cache_handler import RejectionCache
 from dreadfort.data.model.tenant import Tenant
 from dreadfort.data.model.tenant import Token
 from dreadfort.data.model.worker import WorkerConfiguration
@@ -39,11 +42,9 @@ class WhenTestingConfigCache(unittest.TestCase):
 
     def setUp(self):
         self.cache_clear = MagicMock()
-        self.cache_true = MagicMock(return_value=True)
-        self.cache_false = MagicMock(return_value=False)
-        self.cache_update = MagicMock()
-        self.cache_set = MagicMock()
+        self.cache_upsert = MagicMock()
         self.cache_del = MagicMock()
+        self.cache_none = MagicMock(return_value=None)
         self.config = WorkerConfiguration(
             personality='worker',
             hostname='worker01',
@@ -57,32 +58,18 @@ class WhenTestingConfigCache(unittest.TestCase):
             config_cache.clear()
         self.cache_clear.assert_called_once_with(CACHE_CONFIG)
 
-    def test_set_config_calls_cache_update(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_update', self.cache_update):
+    def test_set_config_calls_cache_upsert(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert):
             config_cache = ConfigCache()
             config_cache.set_config(self.config)
 
-        self.cache_update.assert_called_once_with(
-            'worker_configuration', jsonutils.dumps(self.config.format()),
-            CONFIG_EXPIRES, CACHE_CONFIG)
-
-    def test_set_config_calls_cache_set(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_set', self.cache_set):
-            config_cache = ConfigCache()
-            config_cache.set_config(self.config)
-
-        self.cache_set.assert_called_once_with(
+        self.cache_upsert.assert_called_once_with(
             'worker_configuration', jsonutils.dumps(self.config.format()),
             CONFIG_EXPIRES, CACHE_CONFIG)
 
     def test_get_config_calls_returns_config(self):
         with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_get',  self.cache_get_config):
+                NativeProxy, 'cache_get_or_none', self.cache_get_config):
             config_cache = ConfigCache()
             config = config_cache.get_config()
 
@@ -91,51 +78,36 @@ class WhenTestingConfigCache(unittest.TestCase):
         self.assertIsInstance(config, WorkerConfiguration)
 
     def test_get_config_calls_returns_none(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false):
+        with patch.object(NativeProxy, 'cache_get_or_none', self.cache_none):
             config_cache = ConfigCache()
             config = config_cache.get_config()
 
         self.assertIs(config, None)
 
     def test_delete_config_calls_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
+        with patch.object(NativeProxy, 'cache_del', self.cache_del):
             config_cache = ConfigCache()
             config_cache.delete_config()
 
         self.cache_del.assert_called_once_with(
             'worker_configuration', CACHE_CONFIG)
 
-    def test_delete_config_does_not_call_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
-            config_cache = ConfigCache()
-            config_cache.delete_config()
-
-        with self.assertRaises(AssertionError):
-            self.cache_del.assert_called_once_with(
-                'worker_configuration', CACHE_CONFIG)
-
 
 class WhenTestingTenantCache(unittest.TestCase):
 
     def setUp(self):
         self.cache_clear = MagicMock()
-        self.cache_true = MagicMock(return_value=True)
-        self.cache_false = MagicMock(return_value=False)
-        self.cache_update = MagicMock()
-        self.cache_set = MagicMock()
+        self.cache_upsert = MagicMock()
         self.cache_del = MagicMock()
+        self.cache_none = MagicMock(return_value=None)
         self.tenant_id = '101'
         self.tenant = Tenant(
             tenant_id=self.tenant_id,
             token=Token()
         )
-        self.tenant_json = jsonutils.dumps(self.tenant.format())
-        self.cache_get_tenant = MagicMock(return_value=self.tenant_json)
+        self.tenant_record = cache_record.encode_tenant(self.tenant)
+        self.cache_get_tenant = MagicMock(return_value=self.tenant_record)
+        cache_handler._local_tenants.clear()
 
     def test_clear_calls_cache_clear(self):
         with patch.object(NativeProxy, 'cache_clear', self.cache_clear):
@@ -143,32 +115,21 @@ class WhenTestingTenantCache(unittest.TestCase):
             tenant_cache.clear()
         self.cache_clear.assert_called_once_with(CACHE_TENANT)
 
-    def test_set_tenant_calls_cache_update(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_update', self.cache_update):
-            tenant_cache = TenantCache()
-            tenant_cache.set_tenant(self.tenant)
-
-        self.cache_update.assert_called_once_with(
-            self.tenant_id, jsonutils.dumps(self.tenant.format()),
-            DEFAULT_EXPIRES, CACHE_TENANT)
-
-    def test_set_tenant_calls_cache_set(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_set', self.cache_set):
+    def test_set_tenant_calls_cache_upsert(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert), \
+                patch('dreadfort.data.cache_handler.time.time',
+                      return_value=1000.0):
             tenant_cache = TenantCache()
             tenant_cache.set_tenant(self.tenant)
 
-        self.cache_set.assert_called_once_with(
-            self.tenant_id, jsonutils.dumps(self.tenant.format()),
+        self.cache_upsert.assert_called_once_with(
+            self.tenant_id,
+            cache_record.encode_tenant(self.tenant, 1000.0 + DEFAULT_EXPIRES),
             DEFAULT_EXPIRES, CACHE_TENANT)
 
     def test_get_tenant_calls_returns_tenant(self):
         with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_get',  self.cache_get_tenant):
+                NativeProxy, 'cache_get_or_none', self.cache_get_tenant):
             tenant_cache = TenantCache()
             tenant = tenant_cache.get_tenant(self.tenant_id)
 
@@ -176,49 +137,119 @@ class WhenTestingTenantCache(unittest.TestCase):
             self.tenant_id, CACHE_TENANT)
         self.assertIsInstance(tenant, Tenant)
 
-    def test_get_tenant_calls_returns_none(self):
+    def test_get_tenant_returns_local_tenant_without_cache_get(self):
         with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false):
+                NativeProxy, 'cache_get_or_none', self.cache_get_tenant):
             tenant_cache = TenantCache()
+            first_tenant = tenant_cache.get_tenant(self.tenant_id)
+            second_tenant = tenant_cache.get_tenant(self.tenant_id)
+
+        self.cache_get_tenant.assert_called_once_with(
+            self.tenant_id, CACHE_TENANT)
+        self.assertIs(first_tenant, second_tenant)
+
+    def test_set_tenant_stores_local_tenant(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert):
+            tenant_cache = TenantCache()
+            tenant_cache.set_tenant(self.tenant)
             tenant = tenant_cache.get_tenant(self.tenant_id)
 
-        self.assertIs(tenant, None)
+        self.assertIs(tenant, self.tenant)
 
-    def test_delete_tenant_calls_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
+    def test_delete_tenant_removes_local_tenant(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert), \
+                patch.object(NativeProxy, 'cache_get_or_none',
+                             self.cache_none):
             tenant_cache = TenantCache()
+            tenant_cache.set_tenant(self.tenant)
             tenant_cache.delete_tenant(self.tenant_id)
+            tenant = tenant_cache.get_tenant(self.tenant_id)
 
-        self.cache_del.assert_called_once_with(
-            self.tenant_id, CACHE_TENANT)
+        self.assertIs(tenant, None)
 
-    def test_delete_tenant_does_not_call_cache_del(self):
+    def test_get_tenant_counts_hits_and_misses(self):
+        increment = MagicMock()
         with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
+                NativeProxy, 'cache_get_or_none', self.cache_get_tenant), \
+                patch('dreadfort.data.cache_handler.metrics.increment',
+                      increment):
+            tenant_cache = TenantCache()
+            tenant_cache.get_tenant(self.tenant_id)
+            tenant_cache.get_tenant(self.tenant_id)
+            with patch.object(
+                    NativeProxy, 'cache_get_or_none', self.cache_none):
+                tenant_cache.get_tenant('102')
+
+        self.assertEqual(
+            [args[0] for args, _ in increment.call_args_list],
+            ['cache.tenant.hit', 'cache.tenant.local_hit',
+             'cache.tenant.miss'])
+
+    def test_get_tenant_calls_returns_none(self):
+        with patch.object(NativeProxy, 'cache_get_or_none', self.cache_none):
+            tenant_cache = TenantCache()
+            tenant = tenant_cache.get_tenant(self.tenant_id)
+
+        self.assertIs(tenant, None)
+
+    def test_get_tenant_treats_unreadable_record_as_miss(self):
+        cache_get = MagicMock(return_value='{"tenant_id": "101"}')
+        with patch.object(NativeProxy, 'cache_get_or_none', cache_get):
+            tenant = TenantCache().get_tenant(self.tenant_id)
+
+        self.assertIsNone(tenant)
+        self.assertIsNone(cache_handler._local_tenants.get(self.tenant_id))
+
+    def test_get_tenants_looks_up_missing_tenants_in_one_pass(self):
+        local_tenant = Tenant(tenant_id='100', token=Token())
+        cache_handler._local_tenants.set('100', local_tenant)
+        cache_get_many = MagicMock(
+            return_value={self.tenant_id: self.tenant_record})
+
+        with patch.object(NativeProxy, 'cache_get_many', cache_get_many):
+            tenant_cache = TenantCache()
+            tenants = tenant_cache.get_tenants(['100', self.tenant_id, '102'])
+
+        cache_get_many.assert_called_once_with(
+            [self.tenant_id, '102'], CACHE_TENANT)
+        self.assertEqual(sorted(tenants.keys()), ['100', self.tenant_id])
+        self.assertIs(tenants['100'], local_tenant)
+        self.assertIsInstance(tenants[self.tenant_id], Tenant)
+        self.assertIs(
+            cache_handler._local_tenants.get(self.tenant_id),
+            tenants[self.tenant_id])
+
+    def test_get_tenants_without_missing_tenants(self):
+        cache_handler._local_tenants.set(self.tenant_id, self.tenant)
+        cache_get_many = MagicMock()
+
+        with patch.object(NativeProxy, 'cache_get_many', cache_get_many):
+            tenants = TenantCache().get_tenants([self.tenant_id])
+
+        self.assertFalse(cache_get_many.called)
+        self.assertEqual(tenants, {self.tenant_id: self.tenant})
+
+    def test_delete_tenant_calls_cache_del(self):
+        with patch.object(NativeProxy, 'cache_del', self.cache_del):
             tenant_cache = TenantCache()
             tenant_cache.delete_tenant(self.tenant_id)
 
-        with self.assertRaises(AssertionError):
-            self.cache_del.assert_called_once_with(
-                self.tenant_id, CACHE_TENANT)
+        self.cache_del.assert_called_once_with(
+            self.tenant_id, CACHE_TENANT)
 
 
 class WhenTestingTokenCache(unittest.TestCase):
 
     def setUp(self):
         self.cache_clear = MagicMock()
-        self.cache_true = MagicMock(return_value=True)
-        self.cache_false = MagicMock(return_value=False)
-        self.cache_update = MagicMock()
-        self.cache_set = MagicMock()
+        self.cache_upsert = MagicMock()
         self.cache_del = MagicMock()
+        self.cache_none = MagicMock(return_value=None)
         self.tenant_id = '101'
         self.token = Token()
-        self.token_json = jsonutils.dumps(self.token.format())
-        self.cache_get_token = MagicMock(return_value=self.token_json)
+        self.token_record = cache_record.encode_token(self.token)
+        self.cache_get_token = MagicMock(return_value=self.token_record)
+        cache_handler._local_tokens.clear()
 
     def test_clear_calls_cache_clear(self):
         with patch.object(NativeProxy, 'cache_clear', self.cache_clear):
@@ -226,67 +257,190 @@ class WhenTestingTokenCache(unittest.TestCase):
             token_cache.clear()
         self.cache_clear.assert_called_once_with(CACHE_TOKEN)
 
-    def test_set_token_calls_cache_update(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_update', self.cache_update):
+    def test_set_token_calls_cache_upsert(self):
+        with patch.object(NativeProxy, 'cache_upsert', self.cache_upsert), \
+                patch('dreadfort.data.cache_handler.time.time',
+                      return_value=1000.0):
             token_cache = TokenCache()
             token_cache.set_token(self.tenant_id, self.token)
 
-        self.cache_update.assert_called_once_with(
-            self.tenant_id, jsonutils.dumps(self.token.format()),
+        self.cache_upsert.assert_called_once_with(
+            self.tenant_id,
+            cache_record.encode_token(self.token, 1000.0 + DEFAULT_EXPIRES),
             DEFAULT_EXPIRES, CACHE_TOKEN)
 
-    def test_set_token_calls_cache_set(self):
+    def test_get_token_calls_returns_tenant(self):
         with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_set', self.cache_set):
+                NativeProxy, 'cache_get_or_none', self.cache_get_token):
             token_cache = TokenCache()
-            token_cache.set_token(self.tenant_id, self.token)
+            token = token_cache.get_token(self.tenant_id)
 
-        self.cache_set.assert_called_once_with(
-            self.tenant_id, jsonutils.dumps(self.token.format()),
-            DEFAULT_EXPIRES, CACHE_TOKEN)
+        self.cache_get_token.assert_called_once_with(
+            self.tenant_id, CACHE_TOKEN)
+        self.assertIsInstance(token, Token)
 
-    def test_get_token_calls_returns_tenant(self):
+    def test_get_token_returns_local_token_without_cache_get(self):
         with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_get',  self.cache_get_token):
+                NativeProxy, 'cache_get_or_none', self.cache_get_token):
             token_cache = TokenCache()
-            token = token_cache.get_token(self.tenant_id)
+            first_token = token_cache.get_token(self.tenant_id)
+            second_token = token_cache.get_token(self.tenant_id)
 
         self.cache_get_token.assert_called_once_with(
             self.tenant_id, CACHE_TOKEN)
-        self.assertIsInstance(token, Token)
+        self.assertIs(first_token, second_token)
 
     def test_get_token_calls_returns_none(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false):
+        with patch.object(NativeProxy, 'cache_get_or_none', self.cache_none):
             token_cache = TokenCache()
             token = token_cache.get_token(self.tenant_id)
 
         self.assertIs(token, None)
 
+    def test_get_tokens_looks_up_missing_tokens_in_one_pass(self):
+        cache_get_many = MagicMock(
+            return_value={self.tenant_id: self.token_record})
+
+        with patch.object(NativeProxy, 'cache_get_many', cache_get_many):
+            tokens = TokenCache().get_tokens([self.tenant_id, '102'])
+
+        cache_get_many.assert_called_once_with(
+            [self.tenant_id, '102'], CACHE_TOKEN)
+        self.assertEqual(tokens.keys(), [self.tenant_id])
+        self.assertIsInstance(tokens[self.tenant_id], Token)
+
     def test_delete_token_calls_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_true
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
+        with patch.object(NativeProxy, 'cache_del', self.cache_del):
             token_cache = TokenCache()
             token_cache.delete_token(self.tenant_id)
 
         self.cache_del.assert_called_once_with(
             self.tenant_id, CACHE_TOKEN)
 
-    def test_delete_token_does_not_call_cache_del(self):
-        with patch.object(
-                NativeProxy, 'cache_exists', self.cache_false
-        ), patch.object(NativeProxy, 'cache_del', self.cache_del):
-            token_cache = TokenCache()
-            token_cache.delete_token(self.tenant_id)
 
-        with self.assertRaises(AssertionError):
-            self.cache_del.assert_called_once_with(
-                self.tenant_id, CACHE_TOKEN)
+class WhenTestingStaleTenants(unittest.TestCase):
+
+    def setUp(self):
+        self.tenant_id = '101'
+        self.tenant = Tenant(tenant_id=self.tenant_id, token=Token())
+        self.stale_handler = MagicMock()
+        self.now = 1000.0
+        self.expired = self.now + DEFAULT_EXPIRES + 1
+
+        patches = [
+            patch('dreadfort.data.cache_handler.GRACE_EXPIRES', 60),
+            patch.object(cache_handler._local_tenants, 'grace', 60),
+            patch.object(cache_handler._local_tokens, 'grace', 60),
+            patch('dreadfort.data.cache_handler._stale_handler',
+                  self.stale_handler)]
+        for stale_patch in patches:
+            stale_patch.start()
+            self.addCleanup(stale_patch.stop)
+
+        self.addCleanup(TenantCache().clear)
+        self.addCleanup(TokenCache().clear)
+        TenantCache().clear()
+        TokenCache().clear()
+
+    def _at(self, now):
+        return patch('dreadfort.data.cache_handler.time.time',
+                     return_value=now)
+
+    def test_stale_tenant_is_served_and_refreshed(self):
+        with self._at(self.now):
+            TenantCache().set_tenant(self.tenant)
+            self.assertIs(TenantCache().get_tenant(self.tenant_id),
+                          self.tenant)
+        self.assertFalse(self.stale_handler.called)
+
+        with self._at(self.expired):
+            self.assertIs(TenantCache().get_tenant(self.tenant_id),
+                          self.tenant)
+        self.stale_handler.assert_called_once_with(self.tenant_id)
+
+    def test_stale_record_of_shared_cache_is_served_and_refreshed(self):
+        with self._at(self.now):
+            TokenCache().set_token(self.tenant_id, self.tenant.token)
+        cache_handler._local_tokens.clear()
+
+        with self._at(self.expired):
+            tokens = TokenCache().get_tokens([self.tenant_id])
+            self.assertEqual(
+                cache_handler._local_tokens.lookup(self.tenant_id)[1], True)
+
+        self.assertEqual(tokens[self.tenant_id].format(),
+                         self.tenant.token.format())
+        self.stale_handler.assert_called_once_with(self.tenant_id)
+
+    def test_tenant_is_dropped_after_grace_period(self):
+        with self._at(self.now):
+            TenantCache().set_tenant(self.tenant)
+
+        with self._at(self.expired + 60):
+            self.assertIsNone(TenantCache().get_tenant(self.tenant_id))
+
+    def test_shared_cache_keeps_tenant_for_grace_period(self):
+        cache_upsert = MagicMock()
+        with patch.object(NativeProxy, 'cache_upsert', cache_upsert):
+            TenantCache().set_tenant(self.tenant)
+
+        self.assertEqual(cache_upsert.call_args[0][2], DEFAULT_EXPIRES + 60)
+
+    def test_get_fresh_tenant_ignores_stale_tenant(self):
+        with self._at(self.now):
+            TenantCache().set_tenant(self.tenant)
+            self.assertEqual(
+                TenantCache().get_fresh_tenant(self.tenant_id).format(),
+                self.tenant.format())
+
+        with self._at(self.expired):
+            self.assertIsNone(TenantCache().get_fresh_tenant(self.tenant_id))
+        self.assertFalse(self.stale_handler.called)
+
+
+class WhenTestingRejectionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tenant_id = '101'
+        self.message_token = 'ffe7104e-8d93-47dc-a49a-8fb0d39e5192'
+        self.rejection_cache = RejectionCache()
+        self.rejection_cache.clear()
+
+    def test_reject_tenant(self):
+        self.assertFalse(self.rejection_cache.is_tenant_rejected(
+            self.tenant_id))
+        self.rejection_cache.reject_tenant(self.tenant_id)
+        self.assertTrue(self.rejection_cache.is_tenant_rejected(
+            self.tenant_id))
+
+    def test_reject_token(self):
+        self.assertFalse(self.rejection_cache.is_token_rejected(
+            self.tenant_id, self.message_token))
+        self.rejection_cache.reject_token(self.tenant_id, self.message_token)
+        self.assertTrue(self.rejection_cache.is_token_rejected(
+            self.tenant_id, self.message_token))
+        self.assertFalse(self.rejection_cache.is_tenant_rejected(
+            self.tenant_id))
+
+    def test_forget_tenant(self):
+        self.rejection_cache.reject_tenant(self.tenant_id)
+        self.rejection_cache.reject_token(self.tenant_id, self.message_token)
+        self.rejection_cache.reject_tenant('102')
+        self.rejection_cache.forget_tenant(self.tenant_id)
+        self.assertFalse(self.rejection_cache.is_tenant_rejected(
+            self.tenant_id))
+        self.assertFalse(self.rejection_cache.is_token_rejected(
+            self.tenant_id, self.message_token))
+        self.assertTrue(self.rejection_cache.is_tenant_rejected('102'))
+
+    def test_clear(self):
+        self.rejection_cache.reject_tenant(self.tenant_id)
+        self.rejection_cache.reject_token(self.tenant_id, self.message_token)
+        self.rejection_cache.clear()
+        self.assertFalse(self.rejection_cache.is_tenant_rejected(
+            self.tenant_id))
+        self.assertFalse(self.rejection_cache.is_token_rejected(
+            self.tenant_id, self.message_token))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,83 @@
+import struct
+import unittest
+
+from dreadfort.data import cache_record
+from dreadfort.data.model.tenant import EventProducer
+from dreadfort.data.model.tenant import Tenant
+from dreadfort.data.model.tenant import Token
+from dreadfort.openstack.common import jsonutils
+
+
+class WhenTestingCacheRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.token = Token(previous='89c38542-0c78-41f1-bcd2-5226189ccab9')
+        self.tenant = Tenant(
+            tenant_id='101', token=self.token, tenant_name=u'tenant \xe9',
+            event_producers=[
+                EventProducer(432, 'apache', 'apache2.cee', durable=True,
+                              sinks=['elasticsearch', 'hdfs']),
+                EventProducer('EVid', 'nginx', 'nginx.cee', encrypted=True,
+                              sinks=['elasticsearch']),
+                EventProducer(None, 'syslog', 'syslog')])
+
+    def test_tenant_round_trip(self):
+        tenant = cache_record.decode_tenant(
+            cache_record.encode_tenant(self.tenant))
+
+        self.assertIsInstance(tenant, Tenant)
+        self.assertEqual(tenant.format(), self.tenant.format())
+        self.assertIs(
+            tenant.get_event_producer_by_name('apache'),
+            tenant.get_event_producer_by_id(432))
+
+    def test_token_round_trip(self):
+        token = cache_record.decode_token(
+            cache_record.encode_token(self.token))
+
+        self.assertIsInstance(token, Token)
+        self.assertEqual(token.format(), self.token.format())
+
+    def test_token_without_previous_round_trip(self):
+        token = Token()
+        self.assertIsNone(cache_record.decode_token(
+            cache_record.encode_token(token)).previous)
+
+    def test_read_fresh_until(self):
+        self.assertEqual(cache_record.read_fresh_until(
+            cache_record.encode_tenant(self.tenant, 1000.5)), 1000.5)
+        self.assertEqual(cache_record.read_fresh_until(
+            cache_record.encode_token(self.token)), 0)
+        self.assertIsNone(cache_record.read_fresh_until('{}'))
+
+    def test_strings_are_stored_once(self):
+        record = cache_record.encode_tenant(self.tenant)
+
+        self.assertEqual(record.count('elasticsearch'), 1)
+        self.assertLess(
+            len(record), len(jsonutils.dumps(self.tenant.format())))
+
+    def test_other_versions_are_not_decoded(self):
+        record = cache_record.encode_tenant(self.tenant)
+        record = record[:2] + struct.pack(
+            '!B', cache_record.VERSION + 1) + record[3:]
+
+        self.assertIsNone(cache_record.decode_tenant(record))
+
+    def test_records_of_another_kind_are_not_decoded(self):
+        self.assertIsNone(cache_record.decode_tenant(
+            cache_record.encode_token(self.token)))
+        self.assertIsNone(cache_record.decode_token(
+            cache_record.encode_tenant(self.tenant)))
+
+    def test_invalid_records_are_not_decoded(self):
+        record = cache_record.encode_tenant(self.tenant)
+
+        self.assertIsNone(cache_record.decode_tenant(record[:-3]))
+        self.assertIsNone(cache_record.decode_tenant('D'))
+        self.assertIsNone(cache_record.decode_tenant(
+            jsonutils.dumps(self.tenant.format())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+
+from mock import MagicMock
+from mock import patch
+
+from dreadfort.data import invalidation
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingTenantChangePublishing())
+    suite.addTest(WhenTestingTenantChangeListener())
+    return suite
+
+
+class WhenTestingTenantChangePublishing(unittest.TestCase):
+
+    def setUp(self):
+        self.tenant_id = '101'
+        self.publisher = MagicMock()
+        self.publisher_class = MagicMock(return_value=self.publisher)
+
+    def test_publish_tenant_change_does_nothing_when_disabled(self):
+        with patch.object(invalidation, 'ENABLED', False), \
+                patch('dreadfort.data.invalidation.transport.'
+                      'ZeroMQPublisher', self.publisher_class):
+            invalidation.publish_tenant_change(self.tenant_id)
+
+        self.assertFalse(self.publisher_class.called)
+
+    def test_publish_tenant_change_publishes_tenant_id(self):
+        with patch.object(invalidation, 'ENABLED', True), \
+                patch.object(invalidation, '_publisher_pid', None), \
+                patch('dreadfort.data.invalidation.transport.'
+                      'ZeroMQPublisher', self.publisher_class):
+            invalidation.publish_tenant_change(self.tenant_id)
+            invalidation.publish_tenant_change(self.tenant_id)
+
+        self.publisher_class.assert_called_once_with(['127.0.0.1', '5101'])
+        self.publisher.connect.assert_called_once_with()
+        self.publisher.wait_for_subscription.assert_called_once_with(
+            invalidation.transport.POLL_INTERVAL)
+        self.publisher.publish.assert_called_with(
+            invalidation.TENANT_TOPIC, self.tenant_id)
+        self.assertEqual(self.publisher.publish.call_count, 2)
+
+    def test_new_forwarder(self):
+        forwarder = invalidation.new_forwarder()
+        self.assertEqual(forwarder.frontend_host, 'tcp://127.0.0.1:5101')
+        self.assertEqual(forwarder.backend_host, 'tcp://0.0.0.0:5102')
+
+
+class WhenTestingTenantChangeListener(unittest.TestCase):
+
+    def setUp(self):
+        self.tenant_id = '101'
+        self.listener_class = MagicMock()
+
+    def test_evict_tenant_deletes_tenant_and_token(self):
+        delete_tenant = MagicMock()
+        delete_token = MagicMock()
+        with patch.object(invalidation.cache_handler.TenantCache,
+                          'delete_tenant', delete_tenant), \
+                patch.object(invalidation.cache_handler.TokenCache,
+                             'delete_token', delete_token):
+            invalidation.evict_tenant(self.tenant_id)
+
+        delete_tenant.assert_called_once_with(self.tenant_id)
+        delete_token.assert_called_once_with(self.tenant_id)
+
+    def test_evict_tenant_forgets_rejections(self):
+        rejection_cache = invalidation.cache_handler.RejectionCache()
+        rejection_cache.reject_tenant(self.tenant_id)
+        rejection_cache.reject_token(self.tenant_id, 'token')
+        rejection_cache.reject_token('102', 'token')
+        with patch.object(invalidation.cache_handler.TenantCache,
+                          'delete_tenant'), \
+                patch.object(invalidation.cache_handler.TokenCache,
+                             'delete_token'):
+            invalidation.evict_tenant(self.tenant_id)
+
+        self.assertFalse(rejection_cache.is_tenant_rejected(self.tenant_id))
+        self.assertFalse(
+            rejection_cache.is_token_rejected(self.tenant_id, 'token'))
+        self.assertTrue(rejection_cache.is_token_rejected('102', 'token'))
+        rejection_cache.clear()
+
+    def test_start_listener_does_nothing_when_disabled(self):
+        with patch.object(invalidation, 'ENABLED', False), \
+                patch('dreadfort.data.invalidation.TenantChangeListener',
+                      self.listener_class):
+            invalidation.start_listener()
+
+        self.assertFalse(self.listener_class.called)
+
+    def test_start_listener_starts_once_per_process(self):
+        with patch.object(invalidation, 'ENABLED', True), \
+                patch.object(invalidation, '_listener_pid', None), \
+                patch('dreadfort.data.invalidation.TenantChangeListener',
+                      self.listener_class):
+            invalidation.start_listener()
+            invalidation.start_listener()
+
+        self.assertEqual(self.listener_class.call_count, 1)
+        self.listener_class.return_value.start.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+
+from mock import patch
+
+from dreadfort.data.local_cache import LocalCache
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingLocalCache())
+    return suite
+
+
+class WhenTestingLocalCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LocalCache(max_items=2, expires=60)
+
+    def test_get_returns_value(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_get_returns_none_for_missing_key(self):
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_get_returns_none_for_expired_key(self):
+        with patch('dreadfort.data.local_cache.time.time',
+                   return_value=1000.0):
+            self.cache.set('key', 'value')
+        with patch('dreadfort.data.local_cache.time.time',
+                   return_value=1060.0):
+            self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lookup_returns_stale_entry_during_grace(self):
+        cache = LocalCache(max_items=2, expires=60, grace=30)
+        with patch('dreadfort.data.local_cache.time.time',
+                   return_value=1000.0):
+            cache.set('key', 'value')
+            self.assertEqual(cache.lookup('key'), ('value', False))
+        with patch('dreadfort.data.local_cache.time.time',
+                   return_value=1070.0):
+            self.assertEqual(cache.lookup('key'), ('value', True))
+            self.assertEqual(cache.get('key'), 'value')
+        with patch('dreadfort.data.local_cache.time.time',
+                   return_value=1090.0):
+            self.assertEqual(cache.lookup('key'), (None, False))
+
+    def test_set_with_expires_at(self):
+        with patch('dreadfort.data.local_cache.time.time',
+                   return_value=1000.0):
+            self.cache.set('key', 'value', expires_at=1010.0)
+        with patch('dreadfort.data.local_cache.time.time',
+                   return_value=1010.0):
+            self.assertIsNone(self.cache.get('key'))
+
+    def test_set_evicts_least_recently_used(self):
+        self.cache.set('key1', 'value1')
+        self.cache.set('key2', 'value2')
+        self.cache.get('key1')
+        self.cache.set('key3', 'value3')
+
+        self.assertEqual(self.cache.get('key1'), 'value1')
+        self.assertIsNone(self.cache.get('key2'))
+        self.assertEqual(self.cache.get('key3'), 'value3')
+
+    def test_set_does_nothing_when_disabled(self):
+        cache = LocalCache(max_items=0, expires=60)
+        cache.set('key', 'value')
+        self.assertIsNone(cache.get('key'))
+
+    def test_delete(self):
+        self.cache.set('key', 'value')
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_delete_matching(self):
+        self.cache.set(('101', 'a'), 'value1')
+        self.cache.set(('102', 'a'), 'value2')
+        self.cache.delete_matching(lambda key: key[0] == '101')
+        self.assertIsNone(self.cache.get(('101', 'a')))
+        self.assertEqual(self.cache.get(('102', 'a')), 'value2')
+
+    def test_clear(self):
+        self.cache.set('key1', 'value1')
+        self.cache.set('key2', 'value2')
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -120,5 +120,114 @@ class WhenTestingTenantObject(unittest.TestCase):
         self.assertEqual(tenant_dict['event_producers'], [])
         self.assertEqual(tenant_dict['_id'], 'MDBid')
 
+
+class WhenTestingTenantEventProducerIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.test_token = Token('89c38542-0c78-41f1-bcd2-5226189ccab9',
+                                '89c38542-0c78-41f1-bcd2-5226189ddab1',
+                                '2013-04-01T21:58:16.995031Z')
+        self.producer = EventProducer(432, 'apache', 'apache2.cee')
+        self.new_producer = EventProducer(433, 'nginx', 'nginx.cee')
+        self.test_tenant = Tenant('1022', self.test_token,
+                                  event_producers=[self.producer])
+
+    def test_constructor_indexes_event_producers(self):
+        self.assertIs(
+            self.test_tenant.get_event_producer_by_id(432), self.producer)
+        self.assertIs(
+            self.test_tenant.get_event_producer_by_name('apache'),
+            self.producer)
+
+    def test_add_event_producer(self):
+        self.test_tenant.add_event_producer(self.new_producer)
+        self.assertIn(self.new_producer, self.test_tenant.event_producers)
+        self.assertIs(
+            self.test_tenant.get_event_producer_by_id(433), self.new_producer)
+        self.assertIs(
+            self.test_tenant.get_event_producer_by_name('nginx'),
+            self.new_producer)
+
+    def test_remove_event_producer(self):
+        self.test_tenant.remove_event_producer(self.producer)
+        self.assertNotIn(self.producer, self.test_tenant.event_producers)
+        self.assertIsNone(self.test_tenant.get_event_producer_by_id(432))
+        self.assertIsNone(
+            self.test_tenant.get_event_producer_by_name('apache'))
+
+    def test_rename_event_producer(self):
+        self.test_tenant.rename_event_producer(self.producer, 'httpd')
+        self.assertEqual(self.producer.name, 'httpd')
+        self.assertIsNone(
+            self.test_tenant.get_event_producer_by_name('apache'))
+        self.assertIs(
+            self.test_tenant.get_event_producer_by_name('httpd'),
+            self.producer)
+
+
+class WhenTestingTenantCorrelationTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.test_token = Token('89c38542-0c78-41f1-bcd2-5226189ccab9',
+                                '89c38542-0c78-41f1-bcd2-5226189ddab1',
+                                '2013-04-01T21:58:16.995031Z')
+        self.producer = EventProducer(432, 'apache', 'apache2.cee',
+                                      durable=True, sinks=['elasticsearch'])
+        self.test_tenant = Tenant('1022', self.test_token,
+                                  event_producers=[self.producer],
+                                  tenant_name='TenantName')
+
+    def test_get_correlation_template(self):
+        template = self.test_tenant.get_correlation_template('apache')
+        self.assertEqual(template['tenant_name'], 'TenantName')
+        self.assertEqual(template['ep_id'], 432)
+        self.assertEqual(template['pattern'], 'apache2.cee')
+        self.assertTrue(template['durable'])
+        self.assertFalse(template['encrypted'])
+        self.assertEqual(template['sinks'], ['elasticsearch'])
+        self.assertNotIn('destinations', template)
+
+    def test_get_correlation_template_is_cached(self):
+        template = self.test_tenant.get_correlation_template('apache')
+        self.assertIs(
+            self.test_tenant.get_correlation_template('apache'), template)
+
+    def test_get_correlation_template_for_unknown_producer(self):
+        template = self.test_tenant.get_correlation_template('nginx')
+        self.assertIsNone(template['ep_id'])
+        self.assertEqual(template['pattern'], 'default')
+        self.assertIs(
+            self.test_tenant.get_correlation_template('mysql'), template)
+
+    def test_rename_event_producer_drops_templates(self):
+        self.test_tenant.get_correlation_template('apache')
+        self.test_tenant.rename_event_producer(self.producer, 'httpd')
+        self.assertEqual(
+            self.test_tenant.get_correlation_template('apache')['pattern'],
+            'default')
+        self.assertEqual(
+            self.test_tenant.get_correlation_template('httpd')['ep_id'], 432)
+
+    def test_templates_are_built_when_tenant_is_loaded(self):
+        self.assertIn('apache', self.test_tenant._correlation_templates)
+
+    def test_update_event_producer_rebuilds_templates(self):
+        self.test_tenant.get_correlation_template('apache')
+        self.test_tenant.update_event_producer(
+            self.producer, pattern='httpd.cee', durable=False,
+            sinks=['hdfs'])
+        template = self.test_tenant.get_correlation_template('apache')
+        self.assertEqual(template['pattern'], 'httpd.cee')
+        self.assertFalse(template['durable'])
+        self.assertFalse(template['encrypted'])
+        self.assertEqual(template['sinks'], ['hdfs'])
+
+    def test_add_event_producer_drops_templates(self):
+        self.test_tenant.get_correlation_template('nginx')
+        self.test_tenant.add_event_producer(
+            EventProducer(433, 'nginx', 'nginx.cee'))
+        self.assertEqual(
+            self.test_tenant.get_correlation_template('nginx')['ep_id'], 433)
+
 if __name__ == '__main__':
     unittest.main()
@@ -89,16 +89,21 @@ class WhenTestingFindMethods(unittest.TestCase):
 
     def test_create_tenant(self):
         ttl_create_index_call = MagicMock()
+        publish_tenant_change = MagicMock()
         with patch('dreadfort.data.model.tenant_util._db_handler',
                    self.ds_handler), patch(
                 'dreadfort.data.model.tenant_util.'
                 'mapping_tasks.create_index.delay',
-                ttl_create_index_call):
+                ttl_create_index_call), patch(
+                'dreadfort.data.model.tenant_util.'
+                'invalidation.publish_tenant_change',
+                publish_tenant_change):
             tenant_util.create_tenant(self.tenant_id)
             self.ds_handler.put.assert_called_once()
             self.ds_handler.create_sequence.assert_called_once_with(
                 self.tenant_id)
             ttl_create_index_call.assert_called_once_with(self.tenant_id)
+            publish_tenant_change.assert_called_once_with(self.tenant_id)
 
     def test_retrieve_tenant_returns_tenant_obj(self):
         self.ds_handler.find_one = MagicMock(return_value=self.tenant_dict)
@@ -161,6 +166,9 @@ class WhenTestingFindMethods(unittest.TestCase):
                 tenant_id=self.tenant_obj.tenant_id,
                 producer_pattern=self.event_producer.pattern)
             self.assertEqual(new_producer_id, self.producer_id)
+            self.assertIsInstance(
+                self.tenant_obj.get_event_producer_by_id(self.producer_id),
+                EventProducer)
 
     def test_delete_event_producer(self):
         save_tenant_call = MagicMock()
@@ -171,6 +179,8 @@ class WhenTestingFindMethods(unittest.TestCase):
                 self.tenant_obj, producer_to_delete)
             self.assertFalse(
                 producer_to_delete in self.tenant_obj.event_producers)
+            self.assertIsNone(tenant_util.find_event_producer(
+                self.tenant_obj, producer_name=producer_to_delete.name))
             save_tenant_call.assert_called_once_with(self.tenant_obj)
 
     def test_find_event_producer_by_id_returns_instance(self):
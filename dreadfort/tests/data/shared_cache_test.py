@@ -0,0 +1,152 @@
+from multiprocessing import Process
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import MagicMock, patch
+
+from dreadfort.data import shared_cache
+from dreadfort.data.shared_cache import SharedCacheServer
+from dreadfort import metrics
+
+
+class WhenTestingSharedCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.path = os.path.join(self.cache_dir, 'cache')
+        self.cache = self._new_cache()
+        self.addCleanup(self.cache.close)
+        metrics.reset()
+
+    def _new_cache(self, size=64 * 1024, slot_size=512):
+        return SharedCacheServer(self.path, size, slot_size)
+
+    def test_set_and_get(self):
+        self.assertTrue(self.cache.cache_set('key', 'value', 0, 'tenant'))
+        self.assertTrue(self.cache.cache_exists('key', 'tenant'))
+        self.assertEqual(self.cache.cache_get('key', 'tenant'), 'value')
+
+    def test_named_caches_are_separate(self):
+        self.cache.cache_set('key', 'tenant', 0, 'cache-tenant')
+        self.assertIsNone(self.cache.cache_get('key', 'cache-token'))
+
+    def test_cache_set_does_not_replace_item(self):
+        self.cache.cache_set('key', 'a', 0, 'cache')
+        self.assertIsNone(self.cache.cache_set('key', 'b', 0, 'cache'))
+        self.assertEqual(self.cache.cache_get('key', 'cache'), 'a')
+
+        self.assertTrue(self.cache.cache_update('key', 'bb', 0, 'cache'))
+        self.assertEqual(self.cache.cache_get('key', 'cache'), 'bb')
+
+    def test_items_expire(self):
+        self.cache.cache_set('key', 'value', 1, 'cache')
+        with patch('dreadfort.data.shared_cache.time.time',
+                   MagicMock(return_value=time.time() + 2)):
+            self.assertIsNone(self.cache.cache_get('key', 'cache'))
+            self.assertTrue(self.cache.cache_set('key', 'new', 0, 'cache'))
+        self.assertEqual(self.cache.cache_get('key', 'cache'), 'new')
+
+    def test_delete_and_clear(self):
+        self.cache.cache_set('a', 'a', 0, 'cache')
+        self.cache.cache_set('b', 'b', 0, 'cache')
+        self.cache.cache_set('a', 'a', 0, 'other')
+        self.cache.cache_del('a', 'cache')
+        self.assertIsNone(self.cache.cache_get('a', 'cache'))
+
+        self.cache.cache_clear('cache')
+        self.assertIsNone(self.cache.cache_get('b', 'cache'))
+        self.assertEqual(self.cache.cache_get('a', 'other'), 'a')
+
+    def test_items_larger_than_a_slot_are_not_cached(self):
+        self.assertIsNone(self.cache.cache_set('key', 'x' * 512, 0, 'cache'))
+        self.assertIsNone(self.cache.cache_get('key', 'cache'))
+        self.assertEqual(
+            metrics.snapshot()['counters']['cache.shared.too_large'], 1)
+
+    def test_items_too_large_are_logged_once_per_key(self):
+        warning = MagicMock()
+        with patch('dreadfort.data.shared_cache._LOG.warning', warning):
+            for _ in range(2):
+                self.cache.cache_set('key', 'x' * 512, 0, 'cache')
+            self.cache.cache_set('other', 'x' * 512, 0, 'cache')
+        self.assertEqual(warning.call_count, 2)
+
+    def test_large_items_are_stored_in_large_slots(self):
+        cache = SharedCacheServer(
+            os.path.join(self.cache_dir, 'large'), 64 * 1024, 512,
+            64 * 1024, 4096)
+        self.addCleanup(cache.close)
+
+        self.assertTrue(cache.cache_set('key', 'x' * 1024, 0, 'cache'))
+        self.assertEqual(cache.cache_get('key', 'cache'), 'x' * 1024)
+        self.assertIsNone(cache.cache_set('key', 'small', 0, 'cache'))
+
+        # an item that shrinks moves to the small slots
+        self.assertTrue(cache.cache_update('key', 'small', 0, 'cache'))
+        self.assertEqual(cache.cache_get('key', 'cache'), 'small')
+        cache.cache_del('key', 'cache')
+        self.assertIsNone(cache.cache_get('key', 'cache'))
+
+        self.assertTrue(cache.cache_set('key', 'x' * 1024, 0, 'cache'))
+        cache.cache_clear('cache')
+        self.assertIsNone(cache.cache_get('key', 'cache'))
+        self.assertIsNone(cache.cache_set('key', 'x' * 4096, 0, 'cache'))
+
+    def test_least_recently_used_item_is_evicted(self):
+        cache = SharedCacheServer(
+            os.path.join(self.cache_dir, 'small'), 1, 128)
+        self.addCleanup(cache.close)
+        self.assertEqual(cache.slot_count, shared_cache.WAYS)
+
+        for n in range(shared_cache.WAYS):
+            cache.cache_set(str(n), str(n), 0, 'cache')
+        cache.cache_get('0', 'cache')
+        cache.cache_set('new', 'new', 0, 'cache')
+
+        self.assertEqual(cache.cache_get('0', 'cache'), '0')
+        self.assertIsNone(cache.cache_get('1', 'cache'))
+        self.assertEqual(cache.cache_get('new', 'cache'), 'new')
+        self.assertEqual(
+            metrics.snapshot()['counters']['cache.shared.evictions'], 1)
+
+    def test_reopened_cache_keeps_items(self):
+        self.cache.cache_set('key', 'value', 0, 'cache')
+        reopened = self._new_cache()
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.cache_get('key', 'cache'), 'value')
+
+    def test_cache_is_recreated_for_new_layout(self):
+        self.cache.cache_set('key', 'value', 0, 'cache')
+        recreated = self._new_cache(slot_size=1024)
+        self.addCleanup(recreated.close)
+        self.assertIsNone(recreated.cache_get('key', 'cache'))
+
+    def test_cache_file_is_replaced_not_truncated(self):
+        inode = os.stat(self.path).st_ino
+        recreated = self._new_cache(size=1024, slot_size=128)
+        self.addCleanup(recreated.close)
+        self.assertNotEqual(os.stat(self.path).st_ino, inode)
+
+        # the mapping of the replaced file stays usable
+        self.cache.cache_set('key', 'value', 0, 'cache')
+        self.assertEqual(self.cache.cache_get('key', 'cache'), 'value')
+        self.assertEqual(os.listdir(self.cache_dir), ['cache'])
+
+    def test_items_are_shared_between_processes(self):
+        def set_item():
+            cache = self._new_cache()
+            cache.cache_set('key', 'from child', 0, 'cache')
+            cache.close()
+
+        child = Process(target=set_item)
+        child.start()
+        child.join(5)
+        self.assertEqual(self.cache.cache_get('key', 'cache'), 'from child')
+
+
+if __name__ == '__main__':
+    unittest.main()
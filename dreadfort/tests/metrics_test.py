@@ -0,0 +1,166 @@
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+from dreadfort import metrics
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(WhenTestingHistogram())
+    suite.addTest(WhenTestingMetrics())
+    return suite
+
+
+class WhenTestingHistogram(unittest.TestCase):
+
+    def setUp(self):
+        self.histogram = metrics.Histogram(bounds=[0.1, 1.0])
+
+    def test_observe_counts_values_in_buckets(self):
+        self.histogram.observe(0.05)
+        self.histogram.observe(0.1)
+        self.histogram.observe(0.5)
+        self.histogram.observe(3.0)
+        self.assertEqual(self.histogram.counts, [2, 1, 1])
+        self.assertEqual(self.histogram.count, 4)
+        self.assertAlmostEqual(self.histogram.sum, 3.65)
+
+
+class WhenTestingMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.metrics_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        metrics.reset()
+        shutil.rmtree(self.metrics_dir)
+
+    def test_increment(self):
+        metrics.increment('cache.tenant.hit')
+        metrics.increment('cache.tenant.hit', 2)
+        self.assertEqual(
+            metrics.snapshot()['counters'], {'cache.tenant.hit': 3})
+
+    def test_increment_does_nothing_when_disabled(self):
+        with patch.object(metrics, 'ENABLED', False):
+            metrics.increment('cache.tenant.hit')
+        self.assertEqual(metrics.snapshot()['counters'], {})
+
+    def test_gauge(self):
+        metrics.gauge('correlation.queue_depth', 10)
+        metrics.gauge('correlation.queue_depth', 4)
+        self.assertEqual(
+            metrics.snapshot()['gauges'], {'correlation.queue_depth': 4})
+
+    def test_timer_observes_duration(self):
+        with metrics.timer('correlation.syslog'):
+            pass
+        histogram = metrics.snapshot()['histograms']['correlation.syslog']
+        self.assertEqual(histogram['count'], 1)
+
+    def test_timed_observes_duration_of_failed_calls(self):
+        @metrics.timed('coordinator.request')
+        def request():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            request()
+        histogram = metrics.snapshot()['histograms']['coordinator.request']
+        self.assertEqual(histogram['count'], 1)
+
+    def test_metrics_discarded_after_fork(self):
+        metrics.increment('cache.tenant.hit')
+        with patch.object(metrics, '_pid', [-1]):
+            metrics.increment('cache.tenant.miss')
+            self.assertEqual(
+                metrics.snapshot()['counters'], {'cache.tenant.miss': 1})
+
+    def test_collect_sums_flushed_metrics(self):
+        metrics.increment('cache.tenant.hit')
+        metrics.observe('correlation.syslog', 0.002)
+
+        metrics.gauge('correlation.queue_depth', 3)
+        with patch('dreadfort.metrics.os.getpid', return_value=1):
+            metrics.flush(self.metrics_dir)
+        metrics.gauge('correlation.queue_depth', 5)
+        with patch('dreadfort.metrics.os.getpid', return_value=2):
+            metrics.flush(self.metrics_dir)
+
+        with patch('dreadfort.metrics._process_exists',
+                   return_value=True):
+            collected = metrics.collect(self.metrics_dir)
+        self.assertEqual(collected['counters'], {'cache.tenant.hit': 2})
+        self.assertEqual(
+            collected['gauges'], {'correlation.queue_depth': 5})
+        histogram = collected['histograms']['correlation.syslog']
+        self.assertEqual(histogram['count'], 2)
+        self.assertEqual(sum(histogram['counts']), 2)
+        self.assertAlmostEqual(histogram['sum'], 0.004)
+
+    def test_collect_removes_metrics_of_exited_processes(self):
+        metrics.increment('cache.tenant.hit')
+        for pid in (1, 2):
+            with patch('dreadfort.metrics.os.getpid', return_value=pid):
+                metrics.flush(self.metrics_dir)
+
+        with patch('dreadfort.metrics._process_exists',
+                   MagicMock(side_effect=lambda pid: pid == 1)):
+            collected = metrics.collect(self.metrics_dir)
+        self.assertEqual(collected['counters'], {'cache.tenant.hit': 1})
+        self.assertEqual(os.listdir(self.metrics_dir), ['1.json'])
+
+    def test_process_exists(self):
+        self.assertTrue(metrics._process_exists(os.getpid()))
+        with patch('dreadfort.metrics.os.kill',
+                   MagicMock(side_effect=OSError(errno.ESRCH, ''))):
+            self.assertFalse(metrics._process_exists(1))
+        with patch('dreadfort.metrics.os.kill',
+                   MagicMock(side_effect=OSError(errno.EPERM, ''))):
+            self.assertTrue(metrics._process_exists(1))
+
+    def test_flusher_started_once_per_process(self):
+        flusher = MagicMock()
+        with patch.object(metrics, '_flusher_pid', [None]), \
+                patch('dreadfort.metrics._Flusher', flusher):
+            metrics.increment('cache.tenant.hit')
+            metrics.increment('cache.tenant.hit')
+        flusher.return_value.start.assert_called_once_with()
+
+    def test_recording_never_writes_metrics(self):
+        flush = MagicMock()
+        with patch.object(metrics, '_flusher_pid', [os.getpid()]), \
+                patch('dreadfort.metrics.FLUSH_INTERVAL', 0), \
+                patch('dreadfort.metrics.flush', flush):
+            metrics.increment('cache.tenant.hit')
+            metrics.gauge('transport.queue_depth', 1)
+            metrics.observe('correlation.latency', 0.001)
+        self.assertFalse(flush.called)
+
+    def test_flush_at_exit(self):
+        flush = MagicMock()
+        with patch('dreadfort.metrics.flush', flush), \
+                patch.object(metrics, '_pid', [os.getpid()]):
+            metrics._flush_at_exit()
+        flush.assert_called_once_with()
+
+    def test_flush_at_exit_skips_child_that_recorded_nothing(self):
+        flush = MagicMock()
+        with patch('dreadfort.metrics.flush', flush), \
+                patch.object(metrics, '_pid', [-1]):
+            metrics._flush_at_exit()
+        self.assertFalse(flush.called)
+
+    def test_collect_without_metrics_dir(self):
+        self.assertEqual(
+            metrics.collect('/nonexistent/dreadfort/metrics'),
+            {'counters': {}, 'gauges': {}, 'histograms': {}})
+
+
+if __name__ == '__main__':
+    unittest.main()
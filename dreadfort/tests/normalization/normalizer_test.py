@@ -1,6 +1,7 @@
 import unittest
 
 from mock import MagicMock, patch
+from dreadfort.normalization import normalizer
 from dreadfort.normalization.normalizer import should_normalize
 
 
@@ -41,3 +42,27 @@ class WhenNormalizingMessages(unittest.TestCase):
         target = 'dreadfort.normalization.normalizer.loaded_normalizer_rules'
         with patch(target, self.loaded_rules):
             self.assertTrue(should_normalize(self.good_message))
+
+    def test_normalize_message_batch_routes_messages_that_normalize(self):
+        route_message_batch = MagicMock()
+        increment = MagicMock()
+        normalize = MagicMock(side_effect=[None, ValueError('bad'), None])
+        with patch('dreadfort.normalization.normalizer._normalize',
+                   normalize), \
+                patch('dreadfort.normalization.normalizer.sinks.'
+                      'route_message_batch', route_message_batch), \
+                patch('dreadfort.normalization.normalizer.metrics.'
+                      'increment', increment):
+            normalizer.normalize_message_batch(['first', 'bad', 'last'])
+        self.assertEqual(normalize.call_count, 3)
+        route_message_batch.assert_called_once_with(['first', 'last'])
+        increment.assert_called_once_with('normalization.failed_messages')
+
+    def test_normalize_message_batch_routes_nothing_when_all_fail(self):
+        route_message_batch = MagicMock()
+        with patch('dreadfort.normalization.normalizer._normalize',
+                   MagicMock(side_effect=ValueError('bad'))), \
+                patch('dreadfort.normalization.normalizer.sinks.'
+                      'route_message_batch', route_message_batch):
+            normalizer.normalize_message_batch(['bad'])
+        self.assertFalse(route_message_batch.called)
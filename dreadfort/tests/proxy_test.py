@@ -0,0 +1,137 @@
+import time
+import unittest
+
+from mock import MagicMock, patch
+
+from dreadfort import proxy
+
+
+class WhenTestingLocalCacheServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = proxy.LocalCacheServer(max_items=2)
+
+    def test_named_caches_are_separate(self):
+        self.server.cache_set('key', 'tenant', 0, 'cache-tenant')
+        self.assertTrue(self.server.cache_exists('key', 'cache-tenant'))
+        self.assertFalse(self.server.cache_exists('key', 'cache-token'))
+        self.assertEqual(
+            self.server.cache_get('key', 'cache-tenant'), 'tenant')
+        self.assertIsNone(self.server.cache_get('key', 'cache-token'))
+
+    def test_cache_set_does_not_replace_item(self):
+        self.assertTrue(self.server.cache_set('key', 'a', 0, 'cache'))
+        self.assertIsNone(self.server.cache_set('key', 'b', 0, 'cache'))
+        self.assertEqual(self.server.cache_get('key', 'cache'), 'a')
+
+        self.server.cache_update('key', 'b', 0, 'cache')
+        self.assertEqual(self.server.cache_get('key', 'cache'), 'b')
+
+    def test_items_expire(self):
+        self.server.cache_set('key', 'value', 1, 'cache')
+        with patch('dreadfort.data.local_cache.time.time',
+                   MagicMock(return_value=time.time() + 2)):
+            self.assertFalse(self.server.cache_exists('key', 'cache'))
+
+    def test_caches_are_bounded(self):
+        for key in ('a', 'b', 'c'):
+            self.server.cache_set(key, key, 0, 'cache')
+        self.assertFalse(self.server.cache_exists('a', 'cache'))
+        self.assertTrue(self.server.cache_exists('c', 'cache'))
+
+    def test_cache_del_and_clear(self):
+        self.server.cache_set('a', 'a', 0, 'cache')
+        self.server.cache_set('b', 'b', 0, 'cache')
+        self.server.cache_del('a', 'cache')
+        self.assertFalse(self.server.cache_exists('a', 'cache'))
+        self.server.cache_clear('cache')
+        self.assertFalse(self.server.cache_exists('b', 'cache'))
+
+
+class WhenTestingNativeProxy(unittest.TestCase):
+
+    def test_falls_back_to_local_caches(self):
+        with patch('dreadfort.proxy.UWSGI', False):
+            cache = proxy.NativeProxy()
+        self.assertIs(cache.server, proxy._local_server)
+
+        cache.cache_set('key', 'value', 0, 'cache-test')
+        self.assertEqual(
+            proxy.NativeProxy().cache_get('key', 'cache-test'), 'value')
+        cache.cache_clear('cache-test')
+
+    def test_uses_shared_cache(self):
+        shared_server = MagicMock()
+        with patch('dreadfort.proxy.BACKEND', 'shared'), \
+                patch('dreadfort.proxy._shared_server', shared_server):
+            cache = proxy.NativeProxy()
+        self.assertIs(cache.server, shared_server)
+
+    def test_falls_back_when_shared_cache_can_not_be_opened(self):
+        with patch('dreadfort.proxy.BACKEND', 'shared'), \
+                patch('dreadfort.proxy._shared_server', None), \
+                patch('dreadfort.proxy.SHARED_PATH', '/nonexistent/cache'):
+            cache = proxy.NativeProxy()
+        self.assertIs(cache.server, proxy._local_server)
+
+    def test_caches_are_shared(self):
+        with patch('dreadfort.proxy.UWSGI', False):
+            self.assertFalse(proxy.caches_are_shared())
+        with patch('dreadfort.proxy.BACKEND', 'shared'), \
+                patch('dreadfort.proxy._shared_server', MagicMock()):
+            self.assertTrue(proxy.caches_are_shared())
+
+    def test_uses_uwsgi_caches(self):
+        uwsgi = MagicMock()
+        with patch('dreadfort.proxy.UWSGI', True), \
+                patch('dreadfort.proxy.uwsgi', uwsgi):
+            cache = proxy.NativeProxy()
+        cache.cache_get('key', 'cache-test')
+        uwsgi.cache_get.assert_called_once_with('key', 'cache-test')
+
+    def test_restart_reloads_uwsgi_with_shared_cache(self):
+        uwsgi = MagicMock()
+        shared_server = MagicMock()
+        with patch('dreadfort.proxy.UWSGI', True), \
+                patch('dreadfort.proxy.uwsgi', uwsgi), \
+                patch('dreadfort.proxy.BACKEND', 'shared'), \
+                patch('dreadfort.proxy._shared_server', shared_server):
+            proxy.NativeProxy().restart()
+        uwsgi.reload.assert_called_once_with()
+        self.assertFalse(shared_server.reload.called)
+
+    def test_cache_get_or_none_and_upsert(self):
+        with patch('dreadfort.proxy.UWSGI', False):
+            cache = proxy.NativeProxy()
+
+        self.assertIsNone(cache.cache_get_or_none('key', 'cache-test'))
+        cache.cache_upsert('key', 'a', 0, 'cache-test')
+        cache.cache_upsert('key', 'b', 0, 'cache-test')
+        self.assertEqual(cache.cache_get_or_none('key', 'cache-test'), 'b')
+        cache.cache_clear('cache-test')
+
+    def test_cache_get_many_returns_cached_keys(self):
+        with patch('dreadfort.proxy.UWSGI', False):
+            cache = proxy.NativeProxy()
+
+        cache.cache_set('a', '1', 0, 'cache-test')
+        cache.cache_set('b', '2', 0, 'cache-test')
+        self.assertEqual(
+            cache.cache_get_many(['a', 'b', 'c'], 'cache-test'),
+            {'a': '1', 'b': '2'})
+        cache.cache_clear('cache-test')
+
+    def test_cache_set_many_stores_every_key(self):
+        with patch('dreadfort.proxy.UWSGI', False):
+            cache = proxy.NativeProxy()
+
+        cache.cache_set('a', 'old', 0, 'cache-test')
+        cache.cache_set_many({'a': '1', 'b': '2'}, 0, 'cache-test')
+        self.assertEqual(
+            cache.cache_get_many(['a', 'b'], 'cache-test'),
+            {'a': '1', 'b': '2'})
+        cache.cache_clear('cache-test')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from mock import MagicMock, patch
+
+from dreadfort.sinks import dispatch
+
+
+class WhenTestingSinkDispatch(unittest.TestCase):
+
+    def setUp(self):
+        self.es_mock = MagicMock()
+        self.durable_msg = self._message(True)
+        self.non_durable_msg = self._message(False)
+
+    def _message(self, durable):
+        return {'dreadfort': {'tenant': '1234',
+                              'correlation': {'durable': durable,
+                                              'pattern': 'default',
+                                              'sinks': ['elasticsearch']}}}
+
+    def _dispatch(self, fast_lane, func, arg):
+        with patch('dreadfort.sinks.dispatch.elasticsearch', self.es_mock), \
+                patch('dreadfort.sinks.dispatch.FAST_LANE', fast_lane):
+            func(arg)
+
+    def test_use_fast_lane(self):
+        with patch('dreadfort.sinks.dispatch.FAST_LANE', True):
+            self.assertTrue(dispatch.use_fast_lane(self.non_durable_msg))
+            self.assertFalse(dispatch.use_fast_lane(self.durable_msg))
+
+        with patch('dreadfort.sinks.dispatch.FAST_LANE', False):
+            self.assertFalse(dispatch.use_fast_lane(self.non_durable_msg))
+
+    def test_route_message_queues_task(self):
+        self._dispatch(False, dispatch.route_message, self.non_durable_msg)
+        self.es_mock.put_message.delay.assert_called_once_with(
+            self.non_durable_msg)
+        self.assertFalse(self.es_mock.put_transient_messages.called)
+
+    def test_route_message_takes_fast_lane(self):
+        self._dispatch(True, dispatch.route_message, self.non_durable_msg)
+        self.es_mock.put_transient_messages.assert_called_once_with(
+            [self.non_durable_msg])
+        self.assertFalse(self.es_mock.put_message.delay.called)
+
+    def test_route_message_batch_splits_durable_messages(self):
+        self._dispatch(True, dispatch.route_message_batch,
+                       [self.durable_msg, self.non_durable_msg])
+        self.es_mock.put_transient_messages.assert_called_once_with(
+            [self.non_durable_msg])
+        self.es_mock.put_message_batch.delay.assert_called_once_with(
+            [self.durable_msg])
+
+    def test_route_message_batch_skips_other_sinks(self):
+        self.durable_msg['dreadfort']['correlation']['sinks'] = ['hdfs']
+        self._dispatch(True, dispatch.route_message_batch, [self.durable_msg])
+        self.assertFalse(self.es_mock.put_message_batch.delay.called)
+        self.assertFalse(self.es_mock.put_transient_messages.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
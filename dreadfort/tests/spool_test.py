@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from dreadfort import metrics
+from dreadfort import spool
+
+
+class WhenTestingSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+        self.spool = self._new_spool()
+        self.spool.open()
+        metrics.reset()
+
+    def _new_spool(self, **kwargs):
+        return spool.Spool(self.spool_dir, fsync_interval=0, **kwargs)
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.spool_dir)
+                      if name.endswith(spool.SEGMENT_SUFFIX))
+
+    def test_empty_spool(self):
+        self.assertTrue(self.spool.empty)
+        self.assertIsNone(self.spool.peek())
+        self.assertEqual(self.spool.depth, 0)
+        self.assertEqual(self.spool.age, 0)
+
+    def test_batches_are_replayed_in_order(self):
+        self.assertTrue(self.spool.append([{'n': 1}, {'n': 2}]))
+        self.assertTrue(self.spool.append([{'n': 3}]))
+        self.assertEqual(self.spool.depth, 3)
+
+        self.assertEqual(self.spool.peek(), [{'n': 1}, {'n': 2}])
+        self.assertEqual(self.spool.peek(), [{'n': 1}, {'n': 2}])
+        self.spool.commit()
+        self.assertEqual(self.spool.peek(), [{'n': 3}])
+        self.spool.commit()
+        self.assertTrue(self.spool.empty)
+        self.assertEqual(self.spool.depth, 0)
+
+    def test_replayed_segments_are_deleted(self):
+        self.spool = self._new_spool(segment_size=1)
+        self.spool.open()
+        for n in range(3):
+            self.spool.append([{'n': n}])
+        self.assertEqual(len(self._segments()), 3)
+
+        self.spool.peek()
+        self.spool.commit()
+        self.assertEqual(len(self._segments()), 2)
+
+        self.spool.commit()
+        self.spool.commit()
+        self.assertEqual(self._segments(), [])
+        self.assertEqual(self.spool.size, 0)
+
+    def test_reopened_spool_resumes_after_replayed_batches(self):
+        for n in range(3):
+            self.spool.append([{'n': n}])
+        self.spool.peek()
+        self.spool.commit()
+        self.spool.close()
+
+        reopened = self._new_spool()
+        reopened.open()
+        self.assertEqual(reopened.depth, 2)
+        self.assertEqual(reopened.peek(), [{'n': 1}])
+
+        reopened.append([{'n': 3}])
+        reopened.commit()
+        reopened.commit()
+        self.assertEqual(reopened.peek(), [{'n': 3}])
+
+    def test_spool_reopened_after_emptying_keeps_new_batches(self):
+        self.spool.append([{'n': 1}])
+        self.spool.commit()
+        self.spool.append([{'n': 2}])
+        self.spool.close()
+
+        reopened = self._new_spool()
+        reopened.open()
+        self.assertEqual(reopened.peek(), [{'n': 2}])
+
+    def test_batches_are_dropped_when_spool_is_full(self):
+        self.spool = self._new_spool(max_size=100)
+        self.spool.open()
+        self.assertTrue(self.spool.append([{'n': 1}]))
+        self.assertFalse(self.spool.append([{'n': 'x' * 100}]))
+        self.assertEqual(self.spool.depth, 1)
+        self.assertEqual(
+            metrics.snapshot()['counters']['spool.dropped_messages'], 1)
+
+    def test_incomplete_record_is_truncated_on_open(self):
+        self.spool.append([{'n': 1}])
+        self.spool.close()
+        segment_path = os.path.join(self.spool_dir, self._segments()[0])
+        with open(segment_path, 'ab') as segment_file:
+            segment_file.write('\x00\x00\x01')
+        size = os.path.getsize(segment_path)
+
+        reopened = self._new_spool()
+        reopened.open()
+        self.assertEqual(reopened.depth, 1)
+        self.assertEqual(os.path.getsize(segment_path), size - 3)
+        reopened.append([{'n': 2}])
+        reopened.commit()
+        self.assertEqual(reopened.peek(), [{'n': 2}])
+
+    def test_corrupt_records_are_skipped(self):
+        self.spool.append([{'n': 1}])
+        self.spool.append([{'n': 2}])
+        segment_path = os.path.join(self.spool_dir, self._segments()[0])
+        with open(segment_path, 'r+b') as segment_file:
+            segment_file.seek(spool._RECORD_HEADER.size)
+            segment_file.write('X')
+
+        self.assertEqual(self.spool.peek(), [{'n': 2}])
+        self.assertEqual(
+            metrics.snapshot()['counters']['spool.corrupt_records'], 1)
+
+    def test_metrics(self):
+        self.spool.append([{'n': 1}, {'n': 2}])
+        gauges = metrics.snapshot()['gauges']
+        self.assertEqual(gauges['spool.depth'], 2)
+        self.assertEqual(gauges['spool.bytes'], self.spool.size)
+        self.assertGreaterEqual(gauges['spool.age'], 0)
+        self.assertEqual(
+            metrics.snapshot()['counters']['spool.appended_messages'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,7 @@
+from multiprocessing import Process
+import os
+import signal
+import time
 import unittest
 
 from mock import MagicMock, patch
@@ -45,20 +49,59 @@ class WhenTestingZeroMqReceiver(unittest.TestCase):
         with patch('dreadfort.transport.zmq', self.zmq_mock):
             self.receiver.connect()
         self.context_mock.socket.assert_called_once_with(transport.zmq.PULL)
+        self.socket_mock.setsockopt.assert_called_once_with(
+            self.zmq_mock.RCVHWM, transport.RCVHWM)
         self.socket_mock.connect.assert_called_once_with(
             'tcp://{0}:{1}'.format(self.host, self.port))
         self.assertTrue(self.receiver.connected)
 
     def test_get(self):
+        self.socket_mock.recv.return_value = '{"key": "value"}'
         with patch('dreadfort.transport.zmq', self.zmq_mock):
             self.receiver.connect()
-        self.receiver.get()
-        self.socket_mock.recv.assert_called_once()
+        self.assertEqual(self.receiver.get(), '{"key": "value"}')
+        self.socket_mock.recv.assert_called_once_with()
 
         self.receiver.close()
         with self.assertRaises(transport.zmq.error.ZMQError):
             self.receiver.get()
 
+    def test_get_without_blocking(self):
+        self.socket_mock.recv.side_effect = transport.zmq.error.Again()
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.receiver.connect()
+        self.zmq_mock.NOBLOCK = transport.zmq.NOBLOCK
+        self.zmq_mock.error = transport.zmq.error
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.assertIsNone(self.receiver.get(block=False))
+        self.socket_mock.recv.assert_called_once_with(transport.zmq.NOBLOCK)
+
+    def test_get_splits_batch_frames(self):
+        self.socket_mock.recv.side_effect = [
+            transport.encode_batch(['first', 'second'], compress=True),
+            'third']
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.receiver.connect()
+        self.assertEqual(self.receiver.get(), 'first')
+        self.assertTrue(self.receiver.poll(10))
+        self.assertFalse(self.socket_mock.poll.called)
+        self.assertEqual(self.receiver.get(), 'second')
+        self.assertEqual(self.receiver.get(), 'third')
+
+    def test_get_drops_malformed_batch_frames(self):
+        self.socket_mock.recv.side_effect = [
+            transport.BATCH_MAGIC + '\x09\x00', 'message']
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.receiver.connect()
+        self.assertEqual(self.receiver.get(), 'message')
+
+    def test_poll(self):
+        self.socket_mock.poll.return_value = 0
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.receiver.connect()
+        self.assertFalse(self.receiver.poll(10))
+        self.socket_mock.poll.assert_called_once_with(10)
+
     def test_close(self):
         with patch('dreadfort.transport.zmq', self.zmq_mock):
             self.receiver.connect()
@@ -96,31 +139,77 @@ class WhenTestingZeroMQInputServer(unittest.TestCase):
 
     def setUp(self):
         self.receiver_mock = MagicMock()
+        self.receiver_mock.has_pending = False
+        self.ready = [(self.receiver_mock.socket, transport.zmq.POLLIN)]
+
+        poller_patcher = patch('dreadfort.transport.zmq.Poller')
+        self.poller_mock = poller_patcher.start().return_value
+        self.poller_mock.poll.return_value = []
+        self.addCleanup(poller_patcher.stop)
 
         # create a test class from the base class and override process_msg
         class TestInputServer(transport.ZeroMQInputServer):
 
             def process_msg(self):
-                self.test_stop = self._stop
+                self.test_stop = self._stop.is_set()
                 self.process_msg_called = True
                 self.stop()
 
         self.server = TestInputServer(self.receiver_mock)
+        self.server._poller = self.poller_mock
         self.msg = {"key": "value"}
         self.valid_json_msg = json.dumps(self.msg)
         self.bad_msg = "gigdiu"
 
     def test_constructor(self):
         self.assertEqual(self.server.zmq_receiver, self.receiver_mock)
-        self.assertTrue(self.server._stop)
+        self.assertTrue(self.server._stop.is_set())
 
     def test_start_stop(self):
-        self.assertTrue(self.server._stop)
+        self.assertTrue(self.server._stop.is_set())
         self.server.start()
         self.receiver_mock.connect.assert_called_once_with()
         self.assertFalse(self.server.test_stop)
-        self.assertTrue(self.server._stop)
+        self.assertTrue(self.server._stop.is_set())
         self.assertTrue(self.server.process_msg_called)
+        self.receiver_mock.close.assert_called_once_with()
+
+    def test_start_registers_receiver_sockets(self):
+        priority_receiver = MagicMock()
+        self.server.priority_receivers = [priority_receiver]
+        self.server.start()
+        self.poller_mock.register.assert_any_call(
+            priority_receiver.socket, transport.zmq.POLLIN)
+        self.poller_mock.register.assert_any_call(
+            self.receiver_mock.socket, transport.zmq.POLLIN)
+        priority_receiver.close.assert_called_once_with()
+        self.assertIsNone(self.server._poller)
+
+    def test_sigterm_drains_server(self):
+        server = self.server
+
+        def process_msg():
+            os.kill(os.getpid(), signal.SIGTERM)
+            server.process_msg_called = True
+            server._get_msg_batch()
+
+        server.process_msg = process_msg
+        previous_handler = signal.getsignal(signal.SIGTERM)
+        server.start()
+        self.assertTrue(server._drain.is_set())
+        self.assertTrue(server._stop.is_set())
+        self.assertTrue(server.process_msg_called)
+        self.assertEqual(signal.getsignal(signal.SIGTERM), previous_handler)
+
+    def test_stop_is_shared_with_child_process(self):
+        self.server.process_msg = lambda: time.sleep(0.01)
+        server_proc = Process(target=self.server.start)
+        server_proc.start()
+        time.sleep(0.2)
+        self.server.stop()
+        server_proc.join(5)
+        self.assertFalse(server_proc.is_alive())
+        self.assertEqual(server_proc.exitcode, 0)
 
     def test_get_msg_returns_dict(self):
         self.receiver_mock.get.return_value = self.valid_json_msg
@@ -128,6 +217,141 @@ class WhenTestingZeroMQInputServer(unittest.TestCase):
         self.receiver_mock.get.assert_called_once_with()
         self.assertEquals(msg, self.msg)
 
+    def test_get_msg_batch_returns_empty_batch_when_idle(self):
+        msgs = self.server._get_msg_batch()
+        self.assertEqual(msgs, [])
+        self.poller_mock.poll.assert_called_once_with(
+            transport.POLL_INTERVAL)
+        self.assertFalse(self.receiver_mock.get.called)
+
+    def test_get_msg_batch_drains_ready_messages(self):
+        self.receiver_mock.get.side_effect = [
+            self.valid_json_msg, self.valid_json_msg, self.bad_msg,
+            self.valid_json_msg, None]
+        self.poller_mock.poll.side_effect = [self.ready, []]
+        msgs = self.server._get_msg_batch()
+        self.assertEqual(msgs, [self.msg, self.msg, self.msg])
+        self.receiver_mock.get.assert_called_with(block=False)
+        self.assertEqual(self.server.messages, 3)
+        self.assertEqual(self.server.batches, 1)
+
+    def test_get_msg_batch_stops_at_batch_size(self):
+        self.receiver_mock.get.return_value = self.valid_json_msg
+        self.poller_mock.poll.return_value = self.ready
+        self.server.batch_size = 3
+        msgs = self.server._get_msg_batch()
+        self.assertEqual(len(msgs), 3)
+        self.assertEqual(self.receiver_mock.get.call_count, 3)
+
+    def test_get_msg_batch_waits_for_batch_window(self):
+        self.receiver_mock.get.side_effect = [
+            self.valid_json_msg, None, self.valid_json_msg, None]
+        self.poller_mock.poll.side_effect = [self.ready, self.ready, []]
+        msgs = self.server._get_msg_batch()
+        self.assertEqual(len(msgs), 2)
+        self.assertEqual(self.poller_mock.poll.call_count, 3)
+
+    def test_get_msg_batch_does_not_wait_after_window(self):
+        self.receiver_mock.get.side_effect = [self.valid_json_msg, None]
+        self.poller_mock.poll.return_value = self.ready
+        self.server.batch_window = 0
+        msgs = self.server._get_msg_batch()
+        self.assertEqual(msgs, [self.msg])
+        self.poller_mock.poll.assert_called_once_with(
+            transport.POLL_INTERVAL)
+
+    def test_get_msg_batch_drains_priority_receivers_first(self):
+        priority_receiver = MagicMock()
+        priority_receiver.has_pending = False
+        priority_receiver.get.side_effect = [
+            json.dumps({'priority': True}), None]
+        self.server.priority_receivers = [priority_receiver]
+        self.receiver_mock.get.side_effect = [self.valid_json_msg, None]
+        self.poller_mock.poll.side_effect = [
+            self.ready + [(priority_receiver.socket, transport.zmq.POLLIN)],
+            []]
+        msgs = self.server._get_msg_batch()
+        self.assertEqual(msgs, [{'priority': True}, self.msg])
+
+    def test_get_msg_batch_stops_server_once_drained(self):
+        self.receiver_mock.get.side_effect = [self.valid_json_msg, None]
+        self.poller_mock.poll.side_effect = [self.ready, []]
+        self.server._stop.clear()
+        self.server.drain()
+
+        msgs = self.server._get_msg_batch()
+        self.assertEqual(msgs, [self.msg])
+        self.assertFalse(self.server._stop.is_set())
+
+        msgs = self.server._get_msg_batch()
+        self.assertEqual(msgs, [])
+        self.assertTrue(self.server._stop.is_set())
+        self.poller_mock.poll.assert_called_with(0)
+
+    def _control(self, command):
+        control_socket = MagicMock()
+        control_socket.recv.return_value = command
+        self.server._control_socket = control_socket
+        self.poller_mock.poll.return_value = [
+            (control_socket, transport.zmq.POLLIN)]
+        self.server._stop.clear()
+        self.server._get_msg_batch()
+        return json.loads(control_socket.send.call_args[0][0])
+
+    def test_control_stats(self):
+        self.server.messages = 10
+        reply = self._control(transport.CONTROL_STATS)
+        self.assertEqual(reply['messages'], 10)
+        self.assertEqual(reply['pid'], os.getpid())
+        self.assertFalse(reply['draining'])
+
+    def test_control_stop(self):
+        reply = self._control(transport.CONTROL_STOP)
+        self.assertEqual(reply, {'status': 'stopping'})
+        self.assertTrue(self.server._stop.is_set())
+
+    def test_control_drain(self):
+        reply = self._control(transport.CONTROL_DRAIN)
+        self.assertEqual(reply, {'status': 'draining'})
+        self.assertTrue(self.server._drain.is_set())
+
+    def test_idle_handles_control_command(self):
+        control_socket = MagicMock()
+        control_socket.recv.return_value = transport.CONTROL_STOP
+        control_socket.poll.return_value = transport.zmq.POLLIN
+        self.server._control_socket = control_socket
+        self.server._stop.clear()
+
+        self.server._idle(100)
+
+        control_socket.poll.assert_called_once_with(100)
+        self.assertTrue(self.server._stop.is_set())
+        self.assertFalse(self.receiver_mock.get.called)
+
+    def test_idle_stops_draining_server_without_ready_messages(self):
+        self.server._stop.clear()
+        self.server.drain()
+
+        self.server._idle(100)
+
+        self.assertTrue(self.server._stop.is_set())
+
+    def test_idle_keeps_draining_server_with_ready_messages(self):
+        self.poller_mock.poll.return_value = self.ready
+        self.server._stop.clear()
+        self.server.drain()
+
+        with patch('dreadfort.transport.time.sleep') as sleep:
+            self.server._idle(100)
+
+        sleep.assert_called_once_with(0.1)
+        self.assertFalse(self.server._stop.is_set())
+
+    def test_control_unknown_command(self):
+        reply = self._control('reboot')
+        self.assertIn('error', reply)
+        self.assertFalse(self.server._stop.is_set())
+
 
 class WhenTestingZeroMqCaster(unittest.TestCase):
 
@@ -165,6 +389,8 @@ class WhenTestingZeroMqCaster(unittest.TestCase):
         with patch('dreadfort.transport.zmq', self.zmq_mock):
             self.caster.bind()
         self.context_mock.socket.assert_called_once_with(transport.zmq.PUSH)
+        self.socket_mock.setsockopt.assert_called_once_with(
+            self.zmq_mock.SNDHWM, transport.SNDHWM)
         self.socket_mock.bind.assert_called_once_with(
             'tcp://{0}:{1}'.format(self.host, self.port))
         self.assertTrue(self.caster.bound)
@@ -179,6 +405,17 @@ class WhenTestingZeroMqCaster(unittest.TestCase):
         with self.assertRaises(transport.zmq.error.ZMQError):
             self.caster.cast(self.msg)
 
+    def test_cast_batch(self):
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.caster.bind()
+        self.caster.cast_batch([self.msg, self.msg])
+        self.socket_mock.send.assert_called_once_with(
+            transport.encode_batch([self.msg, self.msg]))
+
+        self.caster.close()
+        with self.assertRaises(transport.zmq.error.ZMQError):
+            self.caster.cast_batch([self.msg])
+
     def test_close(self):
         with patch('dreadfort.transport.zmq', self.zmq_mock):
             self.caster.bind()
@@ -190,6 +427,223 @@ class WhenTestingZeroMqCaster(unittest.TestCase):
         self.assertFalse(self.caster.bound)
 
 
+class WhenTestingBufferedZeroMqCaster(unittest.TestCase):
+
+    def setUp(self):
+        self.zmq_mock = MagicMock()
+        self.zmq_mock.PUSH = transport.zmq.PUSH
+        self.zmq_mock.NOBLOCK = transport.zmq.NOBLOCK
+        self.zmq_mock.error = transport.zmq.error
+        self.socket_mock = MagicMock()
+        self.context_mock = MagicMock()
+        self.context_mock.socket.return_value = self.socket_mock
+        self.zmq_mock.Context.return_value = self.context_mock
+
+        self.caster = transport.BufferedZeroMQCaster(
+            ('127.0.0.1', '5000'), batch_size=3, batch_window=60000,
+            max_buffered=4)
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.caster.bind()
+
+    def _cast(self, *msgs):
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            for msg in msgs:
+                self.caster.cast(msg)
+
+    def test_cast_sends_full_batches(self):
+        self._cast('1', '2')
+        self.assertFalse(self.socket_mock.send.called)
+
+        self._cast('3')
+        self.socket_mock.send.assert_called_once_with(
+            transport.encode_batch(['1', '2', '3']), transport.zmq.NOBLOCK)
+
+    def test_cast_sends_batch_after_batch_window(self):
+        self.caster.batch_window = 0
+        self._cast('1')
+        self.socket_mock.send.assert_called_once_with(
+            transport.encode_batch(['1']), transport.zmq.NOBLOCK)
+
+    def test_cast_keeps_messages_while_socket_blocks(self):
+        self.socket_mock.send.side_effect = transport.zmq.error.Again()
+        self._cast('1', '2', '3')
+        self.assertEqual(list(self.caster._buffer), ['1', '2', '3'])
+
+        self.socket_mock.send.side_effect = None
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.caster.flush()
+        self.socket_mock.send.assert_called_with(
+            transport.encode_batch(['1', '2', '3']), transport.zmq.NOBLOCK)
+        self.assertEqual(len(self.caster._buffer), 0)
+
+    def test_overflow_drops_newest_messages(self):
+        self.socket_mock.send.side_effect = transport.zmq.error.Again()
+        self._cast('1', '2', '3', '4', '5')
+        self.assertEqual(list(self.caster._buffer), ['1', '2', '3', '4'])
+
+    def test_overflow_keeps_newest_message_when_flush_makes_room(self):
+        self.caster.batch_size = 10
+        self.caster.max_buffered = 2
+        increment = MagicMock()
+        with patch('dreadfort.transport.metrics.increment', increment):
+            self._cast('a', 'b', 'c')
+        self.socket_mock.send.assert_called_once_with(
+            transport.encode_batch(['a', 'b']), transport.zmq.NOBLOCK)
+        self.assertEqual(list(self.caster._buffer), ['c'])
+        self.assertFalse(increment.called)
+
+    def test_flush_if_due_sends_partial_batch_after_batch_window(self):
+        self._cast('1')
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.caster.flush_if_due()
+        self.assertFalse(self.socket_mock.send.called)
+        self.assertGreater(self.caster.poll_timeout(), 0)
+
+        self.caster.batch_window = 0
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.caster.flush_if_due()
+        self.socket_mock.send.assert_called_once_with(
+            transport.encode_batch(['1']), transport.zmq.NOBLOCK)
+        self.assertIsNone(self.caster.poll_timeout())
+
+    def test_overflow_drops_oldest_messages(self):
+        self.caster.overflow = transport.OVERFLOW_DROP_OLDEST
+        self.socket_mock.send.side_effect = transport.zmq.error.Again()
+        self._cast('1', '2', '3', '4', '5')
+        self.assertEqual(list(self.caster._buffer), ['2', '3', '4', '5'])
+
+    def test_close_flushes_buffer(self):
+        self._cast('1')
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.caster.close()
+        self.socket_mock.send.assert_called_once_with(
+            transport.encode_batch(['1']), transport.zmq.NOBLOCK)
+        self.socket_mock.close.assert_called_once_with()
+        self.assertFalse(self.caster.bound)
+
+
+class WhenTestingBatchFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.msgs = ['{"key": "value"}', '', '{"key": "other value"}']
+
+    def test_decode_single_message_frame(self):
+        self.assertEqual(
+            transport.decode_frame(self.msgs[0]), [self.msgs[0]])
+
+    def test_encode_and_decode_batch(self):
+        frame = transport.encode_batch(self.msgs)
+        self.assertTrue(frame.startswith(transport.BATCH_MAGIC))
+        self.assertEqual(transport.decode_frame(frame), self.msgs)
+
+    def test_encode_and_decode_compressed_batch(self):
+        msgs = self.msgs * 100
+        frame = transport.encode_batch(msgs, compress=True)
+        self.assertLess(len(frame), len(transport.encode_batch(msgs)))
+        self.assertEqual(transport.decode_frame(frame), msgs)
+
+    def test_decode_empty_batch(self):
+        self.assertEqual(
+            transport.decode_frame(transport.encode_batch([])), [])
+
+    def test_decode_malformed_batch_frames(self):
+        frame = transport.encode_batch(self.msgs)
+        header = transport.BATCH_MAGIC + '\x01\x01'
+        for malformed_frame in [
+                transport.BATCH_MAGIC,
+                transport.BATCH_MAGIC + '\x02\x00',
+                header + 'not compressed',
+                frame[:-1],
+                frame + '\x00\x00']:
+            with self.assertRaises(ValueError):
+                transport.decode_frame(malformed_frame)
+
+
+class WhenTestingZeroMqPublisher(unittest.TestCase):
+
+    def setUp(self):
+        self.host_tuple = ('127.0.0.1', '5101')
+        self.zmq_mock = MagicMock()
+        self.zmq_mock.XPUB = transport.zmq.XPUB
+        self.socket_mock = MagicMock()
+        self.context_mock = MagicMock()
+        self.context_mock.socket.return_value = self.socket_mock
+        self.zmq_mock.Context.return_value = self.context_mock
+
+        self.publisher = transport.ZeroMQPublisher(self.host_tuple)
+
+    def test_connect(self):
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.publisher.connect()
+        self.context_mock.socket.assert_called_once_with(transport.zmq.XPUB)
+        self.socket_mock.connect.assert_called_once_with(
+            'tcp://127.0.0.1:5101')
+        self.assertTrue(self.publisher.connected)
+
+    def test_wait_for_subscription(self):
+        self.socket_mock.poll.side_effect = [1, 1, 0]
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.publisher.connect()
+        self.assertTrue(self.publisher.wait_for_subscription(500))
+        self.socket_mock.poll.assert_any_call(500)
+        self.socket_mock.poll.assert_called_with(0)
+        self.assertEqual(self.socket_mock.recv.call_count, 2)
+
+    def test_wait_for_subscription_times_out(self):
+        self.socket_mock.poll.return_value = 0
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.publisher.connect()
+        self.assertFalse(self.publisher.wait_for_subscription(500))
+        self.socket_mock.poll.assert_called_once_with(500)
+        self.assertFalse(self.socket_mock.recv.called)
+
+    def test_publish(self):
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.publisher.connect()
+        self.publisher.publish('tenant', '101')
+        self.socket_mock.send_multipart.assert_called_once_with(
+            ['tenant', '101'])
+
+        self.publisher.close()
+        with self.assertRaises(transport.zmq.error.ZMQError):
+            self.publisher.publish('tenant', '101')
+
+
+class WhenTestingZeroMqSubscriber(unittest.TestCase):
+
+    def setUp(self):
+        self.host_tuples = [('127.0.0.1', '5102'), ('127.0.0.2', '5102')]
+        self.zmq_mock = MagicMock()
+        self.zmq_mock.SUB = transport.zmq.SUB
+        self.zmq_mock.SUBSCRIBE = transport.zmq.SUBSCRIBE
+        self.socket_mock = MagicMock()
+        self.socket_mock.recv_multipart.return_value = ['tenant', '101']
+        self.context_mock = MagicMock()
+        self.context_mock.socket.return_value = self.socket_mock
+        self.zmq_mock.Context.return_value = self.context_mock
+
+        self.subscriber = transport.ZeroMQSubscriber(
+            self.host_tuples, ['tenant'])
+
+    def test_connect(self):
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.subscriber.connect()
+        self.context_mock.socket.assert_called_once_with(transport.zmq.SUB)
+        self.socket_mock.setsockopt.assert_called_once_with(
+            transport.zmq.SUBSCRIBE, 'tenant')
+        self.assertEqual(self.socket_mock.connect.call_count, 2)
+        self.assertTrue(self.subscriber.connected)
+
+    def test_get(self):
+        with patch('dreadfort.transport.zmq', self.zmq_mock):
+            self.subscriber.connect()
+        self.assertEqual(self.subscriber.get(), ('tenant', '101'))
+
+        self.subscriber.close()
+        with self.assertRaises(transport.zmq.error.ZMQError):
+            self.subscriber.get()
+
+
 class WhenIntegrationTestingTransport(unittest.TestCase):
 
     def setUp(self):
@@ -209,7 +663,7 @@ class WhenIntegrationTestingTransport(unittest.TestCase):
         class TestInputServer(transport.ZeroMQInputServer):
 
             def process_msg(self):
-                self.test_stop = self._stop
+                self.test_stop = self._stop.is_set()
                 self.process_msg_called = True
                 msg = self._get_msg()
                 self.stop()
@@ -224,6 +678,31 @@ class WhenIntegrationTestingTransport(unittest.TestCase):
         time.sleep(2)
         self.server_proc.terminate()
 
+    def test_control_socket_drains_server(self):
+        self.receiver = transport.ZeroMQReceiver(self.connect_host_tuples)
+        control_host_tuple = (self.host, '5190')
+
+        class TestInputServer(transport.ZeroMQInputServer):
+
+            def process_msg(self):
+                self._get_msg_batch()
+
+        self.server = TestInputServer(
+            self.receiver, control_host_tuple=control_host_tuple)
+        self.server_proc = Process(target=self.server.start)
+        self.server_proc.start()
+
+        stats = transport.send_control_command(
+            control_host_tuple, transport.CONTROL_STATS, timeout=5000)
+        self.assertEqual(stats['pid'], self.server_proc.pid)
+        self.assertEqual(stats['messages'], 0)
+
+        reply = transport.send_control_command(
+            control_host_tuple, transport.CONTROL_DRAIN, timeout=5000)
+        self.assertEqual(reply, {'status': 'draining'})
+        self.server_proc.join(5)
+        self.assertEqual(self.server_proc.exitcode, 0)
+
     def tearDown(self):
         self.server_proc.terminate()
 
@@ -2,14 +2,32 @@
 The transport module defines the classes that serve as the transport layer for
 dreadfort when passing log messages between nodes.  ZeroMQ is used as the
 transport mechanism.
+
+Messages are sent either as one message per ZeroMQ frame, or as batch
+frames holding many messages.  A batch frame starts with a header of the
+magic bytes BATCH_MAGIC, a version byte and a flags byte.  The header is
+followed by the messages, each prefixed with its length as a 4 byte
+unsigned integer in network byte order.  When the FLAG_ZLIB flag is set,
+everything after the header is compressed with zlib.  A JSON message never
+starts with a null byte, so single message frames and batch frames can be
+mixed on the same socket.
 """
 
+from collections import deque
+from multiprocessing import cpu_count, Event
+import os
+import signal
+import struct
+import time
+import zlib
+
 from oslo.config import cfg
-import simplejson as json
 import zmq
 
+from dreadfort import codec
 import dreadfort.config as config
 from dreadfort import env
+from dreadfort import metrics
 
 
 _LOG = env.get_logger(__name__)
@@ -25,11 +43,80 @@ _ZMQ_OPTS = [
     cfg.ListOpt('zmq_upstream_hosts',
                 default=['127.0.0.1:5000'],
                 help='list of upstream host:port pairs to poll for '
-                     'zmq messages')
+                     'zmq messages'),
+    cfg.ListOpt('priority_upstream_hosts',
+                default=[],
+                help='list of upstream host:port pairs whose messages are '
+                     'drained before those of zmq_upstream_hosts'),
+    cfg.StrOpt('control_host',
+               default='',
+               help='host:port the control socket of the first receiver '
+                    'process binds, each further receiver process binds the '
+                    'next port.  An empty value disables the control '
+                    'sockets'),
+    cfg.IntOpt('batch_size',
+               default=1000,
+               help='maximum number of messages drained from the receiver '
+                    'into one batch'),
+    cfg.IntOpt('batch_window',
+               default=10,
+               help='maximum number of milliseconds to wait for more '
+                    'messages to fill a batch'),
+    cfg.IntOpt('receivers',
+               default=0,
+               help='number of receiver processes pulling messages from the '
+                    'upstream hosts, 0 starts one per cpu core'),
+    cfg.IntOpt('rcvhwm',
+               default=1000,
+               help='maximum number of frames queued in memory by a '
+                    'receiver socket before upstream hosts are blocked'),
+    cfg.IntOpt('max_queued_tasks',
+               default=0,
+               help='only pull messages while fewer correlation tasks than '
+                    'this are waiting on the broker, 0 disables flow '
+                    'control'),
+    cfg.IntOpt('credit_interval',
+               default=500,
+               help='milliseconds between checks of the broker queue depth '
+                    'when flow control is enabled')
 ]
 
 config.get_config().register_opts(_ZMQ_OPTS, group=_ZMQ_GROUP)
 
+_ZMQ_OUT_GROUP = cfg.OptGroup(
+    name='zmq_out', title='ZeroMQ Output Options')
+
+config.get_config().register_group(_ZMQ_OUT_GROUP)
+
+_ZMQ_OUT_OPTS = [
+    cfg.IntOpt('sndhwm',
+               default=1000,
+               help='maximum number of frames queued in memory by a caster '
+                    'socket before sends block'),
+    cfg.IntOpt('batch_size',
+               default=100,
+               help='maximum number of messages a buffered caster sends in '
+                    'one batch frame'),
+    cfg.IntOpt('batch_window',
+               default=10,
+               help='maximum number of milliseconds a buffered caster holds '
+                    'a message before sending its batch'),
+    cfg.IntOpt('max_buffered',
+               default=10000,
+               help='maximum number of messages a buffered caster holds '
+                    'while the socket can not take more frames'),
+    cfg.StrOpt('overflow',
+               default='drop_newest',
+               choices=['drop_newest', 'drop_oldest'],
+               help='messages dropped by a buffered caster when its buffer '
+                    'is full'),
+    cfg.BoolOpt('compress',
+                default=False,
+                help='compress the batch frames of a buffered caster')
+]
+
+config.get_config().register_opts(_ZMQ_OUT_OPTS, group=_ZMQ_OUT_GROUP)
+
 try:
     config.init_config()
 except config.cfg.ConfigFilesNotFoundError as ex:
@@ -37,29 +124,126 @@ except config.cfg.ConfigFilesNotFoundError as ex:
 
 _CONF = config.get_config()
 
+BATCH_SIZE = _CONF.zmq_in.batch_size
+BATCH_WINDOW = _CONF.zmq_in.batch_window
+RECEIVERS = _CONF.zmq_in.receivers or cpu_count()
+RCVHWM = _CONF.zmq_in.rcvhwm
+MAX_QUEUED_TASKS = _CONF.zmq_in.max_queued_tasks
+CREDIT_INTERVAL = _CONF.zmq_in.credit_interval
+PRIORITY_UPSTREAM_HOSTS = _CONF.zmq_in.priority_upstream_hosts
+CONTROL_HOST = _CONF.zmq_in.control_host
+SNDHWM = _CONF.zmq_out.sndhwm
+CAST_BATCH_SIZE = _CONF.zmq_out.batch_size
+CAST_BATCH_WINDOW = _CONF.zmq_out.batch_window
+MAX_BUFFERED = _CONF.zmq_out.max_buffered
+OVERFLOW = _CONF.zmq_out.overflow
+COMPRESS = _CONF.zmq_out.compress
+
+OVERFLOW_DROP_NEWEST = 'drop_newest'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+
+# milliseconds an idle server waits for a message before checking whether it
+# has been stopped
+POLL_INTERVAL = 1000
+
+# commands accepted on the control socket of an input server
+CONTROL_STOP = 'stop'
+CONTROL_DRAIN = 'drain'
+CONTROL_STATS = 'stats'
+
+# batch frame format
+BATCH_MAGIC = '\x00DFB'
+BATCH_VERSION = 1
+FLAG_ZLIB = 0x01
+_BATCH_HEADER = struct.Struct('!4sBB')
+_MSG_LENGTH = struct.Struct('!I')
+
+
+def encode_batch(msgs, compress=False):
+    """
+    Encodes a list of messages into a batch frame, optionally compressing
+    the messages with zlib.  The messages must be byte strings.
+    """
+    payload = ''.join(
+        _MSG_LENGTH.pack(len(msg)) + msg for msg in msgs)
+
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= FLAG_ZLIB
+
+    return _BATCH_HEADER.pack(BATCH_MAGIC, BATCH_VERSION, flags) + payload
+
+
+def decode_frame(frame):
+    """
+    Returns the list of messages of a frame, which is either a batch frame or
+    a single message.  Raises a ValueError for a malformed batch frame.
+    """
+    if not frame.startswith(BATCH_MAGIC):
+        return [frame]
+
+    if len(frame) < _BATCH_HEADER.size:
+        raise ValueError('Batch frame header is truncated')
+
+    magic, version, flags = _BATCH_HEADER.unpack_from(frame)
+    if version != BATCH_VERSION:
+        raise ValueError(
+            'Unsupported batch frame version {0}'.format(version))
+
+    payload = frame[_BATCH_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        try:
+            payload = zlib.decompress(payload)
+        except zlib.error as ex:
+            raise ValueError('Unable to decompress batch frame: {0}'
+                             .format(ex))
+
+    msgs = list()
+    offset = 0
+    payload_size = len(payload)
+
+    while offset < payload_size:
+        if offset + _MSG_LENGTH.size > payload_size:
+            raise ValueError('Batch frame message length is truncated')
+        (msg_length,) = _MSG_LENGTH.unpack_from(payload, offset)
+        offset += _MSG_LENGTH.size
+
+        end = offset + msg_length
+        if end > payload_size:
+            raise ValueError('Batch frame message is truncated')
+        msgs.append(payload[offset:end])
+        offset = end
+
+    return msgs
+
 
 class ZeroMQReceiver(object):
 
     """
     ZeroMQReceiver allows for messages to be received by pulling
     messages over a zmq socket from an upstream host.  This client may
-    connect to multiple upstream hosts.
+    connect to multiple upstream hosts.  Batch frames are split into their
+    messages, which are returned one at a time.
     """
 
-    def __init__(self, connect_host_tuples):
+    def __init__(self, connect_host_tuples, rcvhwm=RCVHWM):
         """
         Creates an instance of the ZeroMQReceiver.
 
         :param connect_host_tuples: [(host, port), (host, port)],
         for example [('127.0.0.1', '5000'), ('127.0.0.1', '5001')]
+        :param rcvhwm: maximum number of frames queued by the socket
         """
         self.upstream_hosts = [
             "tcp://{}:{}".format(*host_tuple)
             for host_tuple in connect_host_tuples]
+        self.rcvhwm = rcvhwm
         self.socket_type = zmq.PULL
         self.context = None
         self.socket = None
         self.connected = False
+        self._pending = deque()
 
     def connect(self):
         """
@@ -69,20 +253,63 @@ class ZeroMQReceiver(object):
         """
         self.context = zmq.Context()
         self.socket = self.context.socket(self.socket_type)
+        self.socket.setsockopt(zmq.RCVHWM, self.rcvhwm)
 
         for host in self.upstream_hosts:
             self.socket.connect(host)
 
         self.connected = True
 
-    def get(self):
+    @property
+    def has_pending(self):
+        """
+        True if messages of an already received batch frame are waiting to
+        be read
+        """
+        return bool(self._pending)
+
+    def get(self, block=True):
         """
-        Read a message form the zmq socket and return
+        Read a message form the zmq socket and return.  When block is False,
+        None is returned if no message is ready.
         """
         if not self.connected:
             raise zmq.error.ZMQError(
                 "ZeroMQReceiver is not connected to a socket")
-        return self.socket.recv()
+
+        while not self._pending:
+            frame = self._recv_frame(block)
+            if frame is None:
+                return None
+
+            try:
+                self._pending.extend(decode_frame(frame))
+            except ValueError as ex:
+                _LOG.exception(ex)
+                metrics.increment('transport.malformed_frames')
+
+        return self._pending.popleft()
+
+    def _recv_frame(self, block):
+        if block:
+            return self.socket.recv()
+
+        try:
+            return self.socket.recv(zmq.NOBLOCK)
+        except zmq.error.Again:
+            return None
+
+    def poll(self, timeout):
+        """
+        Wait up to timeout milliseconds for a message to be ready, returns
+        True if a message can be read without blocking
+        """
+        if not self.connected:
+            raise zmq.error.ZMQError(
+                "ZeroMQReceiver is not connected to a socket")
+        if self._pending:
+            return True
+        return bool(self.socket.poll(timeout))
 
     def close(self):
         """
@@ -94,21 +321,25 @@ class ZeroMQReceiver(object):
             self.socket = None
             self.context = None
             self.connected = False
+            self._pending.clear()
 
 
-def new_zmq_receiver():
+def new_zmq_receiver(upstream_hosts=None):
     """
     Factory method creates a new instance of ZeroMQReceiver to connect to all
-    host:ports listed in zmq_upstream_hosts from dreadfort config.
+    host:ports listed in zmq_upstream_hosts from dreadfort config, or to the
+    host:ports given in upstream_hosts.
     """
+    if upstream_hosts is None:
+        upstream_hosts = _CONF.zmq_in.zmq_upstream_hosts
 
     # build a list of (host, port) tuples from config
-    upstream_hosts = [
+    upstream_host_tuples = [
         (host_port_str.split(':'))
-        for host_port_str in _CONF.zmq_in.zmq_upstream_hosts
+        for host_port_str in upstream_hosts
     ]
 
-    return ZeroMQReceiver(upstream_hosts)
+    return ZeroMQReceiver(upstream_host_tuples)
 
 
 class ZeroMQInputServer(object):
@@ -118,42 +349,195 @@ class ZeroMQInputServer(object):
     to pull messages through a ZeroMQReceiver for processing.
     This class should be inherited and the process_msg() method overridden in
     order to implement the desired behavior.
+
+    A single zmq.Poller watches the sockets of the receiver, of any priority
+    receivers and of the optional control socket, so an idle server sleeps
+    in one poll call.  Messages of the priority receivers are always drained
+    before those of the receiver.
+
+    The server is meant to run in a child process.  It can be stopped from
+    the parent process by calling stop() or drain(), by sending SIGTERM to
+    the child, which drains it, or by sending a command to its control
+    socket:
+
+        stop   stop once the current batch has been processed
+        drain  stop pulling once the messages that are already received
+               have been processed
+        stats  reply with the message and batch counts of the server
     """
 
-    def __init__(self, zmq_receiver):
+    def __init__(self, zmq_receiver, batch_size=BATCH_SIZE,
+                 batch_window=BATCH_WINDOW, priority_receivers=None,
+                 control_host_tuple=None):
         """
         Creates a new instance of ZeroMQInputServer by setting the receiver to
         be used to pull messages.
 
         :param zmq_receiver: an instance of ZeroMQReceiver
+        :param batch_size: maximum number of messages in a batch
+        :param batch_window: maximum number of milliseconds to wait for more
+        messages to fill a batch
+        :param priority_receivers: list of ZeroMQReceivers drained before
+        zmq_receiver
+        :param control_host_tuple: (host, port) the control socket binds, for
+        example ('127.0.0.1', '5200'), None disables the control socket
         """
         self.zmq_receiver = zmq_receiver
-        self._stop = True
+        self.priority_receivers = priority_receivers or []
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.control_host = None
+        if control_host_tuple:
+            self.control_host = 'tcp://{0}:{1}'.format(*control_host_tuple)
+
+        self.messages = 0
+        self.batches = 0
+        self._poller = None
+        self._control_context = None
+        self._control_socket = None
+
+        # Events are shared with the child process the server runs in
+        self._stop = Event()
+        self._stop.set()
+        self._drain = Event()
+
+    @property
+    def receivers(self):
+        """
+        The receivers of the server, in the order they are drained
+        """
+        return self.priority_receivers + [self.zmq_receiver]
 
     def start(self):
         """
-        Connect the ZeroMQReceiver and start the server IO loop to
-        process messages. The receiver is connected here so that this method
+        Connect the ZeroMQReceivers and start the server IO loop to
+        process messages. The receivers are connected here so that this method
         can easily be passed as a runnable to a child process, as zmq should
         not share context and sockets between a parent and child process.
+        The receivers are closed when the server stops.
         """
-        self.zmq_receiver.connect()
-        self._stop = False
+        previous_handler = signal.signal(
+            signal.SIGTERM, lambda signum, frame: self.drain())
 
-        while not self._stop:
-            self.process_msg()
+        self._drain.clear()
+        self._stop.clear()
+
+        try:
+            self._connect()
+            while not self._stop.is_set():
+                self.process_msg()
+        finally:
+            self._close()
+            signal.signal(signal.SIGTERM, previous_handler)
 
     def stop(self):
         """
         set the server control variable that will break the IO Loop
         """
-        self._stop = True
+        self._stop.set()
+
+    def drain(self):
+        """
+        Stop the server once the messages already received have been
+        processed
+        """
+        self._drain.set()
+
+    def stats(self):
+        """
+        Returns the message and batch counts of the server
+        """
+        return {'pid': os.getpid(),
+                'draining': self._drain.is_set(),
+                'messages': self.messages,
+                'batches': self.batches}
+
+    def _connect(self):
+        self._poller = zmq.Poller()
+
+        for receiver in self.receivers:
+            receiver.connect()
+            self._poller.register(receiver.socket, zmq.POLLIN)
+
+        if self.control_host:
+            self._control_context = zmq.Context()
+            self._control_socket = self._control_context.socket(zmq.REP)
+            self._control_socket.bind(self.control_host)
+            self._poller.register(self._control_socket, zmq.POLLIN)
+
+    def _close(self):
+        for receiver in self.receivers:
+            receiver.close()
+
+        if self._control_socket is not None:
+            self._control_socket.close()
+            self._control_context.destroy()
+            self._control_socket = None
+            self._control_context = None
+
+        self._poller = None
+
+    def _poll(self, timeout):
+        """
+        Wait up to timeout milliseconds for messages, handling any control
+        command received meanwhile.  Returns the receivers that have messages
+        ready, in the order they are drained.
+        """
+        receivers = self.receivers
+        if any(receiver.has_pending for receiver in receivers):
+            timeout = 0
+
+        events = dict(self._poller.poll(timeout))
+
+        if self._control_socket is not None and \
+                self._control_socket in events:
+            self._handle_control()
+
+        return [receiver for receiver in receivers
+                if receiver.has_pending or receiver.socket in events]
+
+    def _idle(self, timeout):
+        """
+        Wait up to timeout milliseconds without pulling messages, such as
+        while the server is held back by flow control, handling any control
+        command received meanwhile.  A draining server stops when no message
+        is ready, since it has nothing left to process.
+        """
+        if self._drain.is_set() and not self._poll(0):
+            self.stop()
+            return
+
+        if self._control_socket is None:
+            time.sleep(timeout / 1000.0)
+        elif self._control_socket.poll(timeout):
+            self._handle_control()
+
+    def _handle_control(self):
+        try:
+            command = self._control_socket.recv(zmq.NOBLOCK)
+        except zmq.error.Again:
+            return
+
+        if command == CONTROL_STOP:
+            self.stop()
+            reply = {'status': 'stopping'}
+        elif command == CONTROL_DRAIN:
+            self.drain()
+            reply = {'status': 'draining'}
+        elif command == CONTROL_STATS:
+            reply = self.stats()
+        else:
+            reply = {'error': 'unknown command {0}'.format(command)}
+
+        self._control_socket.send(codec.JSON_CODEC.dumps(reply))
 
     def process_msg(self):
         """
         This method should be overridden to implement the desired message
         processing.  To retrieve the message for processing you can call:
         >>>  msg = self._get_msg()
+        or, to retrieve a batch of messages:
+        >>>  msgs = self._get_msg_batch()
         """
         pass
 
@@ -164,9 +548,87 @@ class ZeroMQInputServer(object):
         """
         try:
             msg = self.zmq_receiver.get()
-            return json.loads(msg)
+            return codec.loads_json(msg)
         except Exception as ex:
             _LOG.exception(ex)
+            metrics.increment('transport.undecodable_messages')
+
+    def _get_msg_batch(self):
+        """
+        Pulls a batch of JSON messages received over the ZeroMQ sockets.  This
+        call waits up to POLL_INTERVAL milliseconds for a first message, and
+        returns an empty batch if none arrives so that the server can check
+        whether it has been stopped.  It then drains the messages that are
+        ready without blocking, those of the priority receivers first.  When
+        no message is ready, it waits for more until the batch is full or the
+        batch window has passed since the first message.  Messages that can
+        not be decoded are dropped from the batch.
+
+        While the server drains, it does not wait for messages, and it stops
+        once no more messages are ready.
+        """
+        batch = list()
+        draining = self._drain.is_set()
+
+        ready = self._poll(0 if draining else POLL_INTERVAL)
+        if not ready:
+            if draining:
+                self.stop()
+            return batch
+
+        deadline = time.time()
+        if not draining:
+            deadline += self.batch_window / 1000.0
+
+        while len(batch) < self.batch_size:
+            if not ready:
+                remaining = (deadline - time.time()) * 1000
+                if remaining <= 0:
+                    break
+                ready = self._poll(remaining)
+                if not ready:
+                    break
+
+            msg = ready[0].get(block=False)
+            if msg is None:
+                ready.pop(0)
+                continue
+
+            try:
+                batch.append(codec.loads_json(msg))
+            except ValueError as ex:
+                _LOG.exception(ex)
+                metrics.increment('transport.undecodable_messages')
+
+        if batch:
+            self.messages += len(batch)
+            self.batches += 1
+
+        return batch
+
+
+def send_control_command(host_tuple, command, timeout=POLL_INTERVAL):
+    """
+    Sends a command to the control socket of an input server and returns
+    its decoded reply, or None if no reply arrives within timeout
+    milliseconds
+
+    :param host_tuple: (host, port) of the control socket
+    :param command: CONTROL_STOP, CONTROL_DRAIN or CONTROL_STATS
+    """
+    context = zmq.Context()
+    socket = context.socket(zmq.REQ)
+    socket.setsockopt(zmq.LINGER, 0)
+
+    try:
+        socket.connect('tcp://{0}:{1}'.format(*host_tuple))
+        socket.send(command)
+        if not socket.poll(timeout):
+            return None
+        return codec.loads_json(socket.recv())
+    finally:
+        socket.close()
+        context.destroy()
 
 
 class ZeroMQCaster(object):
@@ -178,16 +640,18 @@ class ZeroMQCaster(object):
     across the clients.
     """
 
-    def __init__(self, bind_host_tuple):
+    def __init__(self, bind_host_tuple, sndhwm=SNDHWM):
         """
         Creates an instance of the ZeroMQCaster.  A zmq PUSH socket is
         created and is bound to the specified host:port.
 
         :param bind_host_tuple: (host, port), for example ('127.0.0.1', '5000')
+        :param sndhwm: maximum number of frames queued by the socket
         """
 
         self.socket_type = zmq.PUSH
         self.bind_host = 'tcp://{0}:{1}'.format(*bind_host_tuple)
+        self.sndhwm = sndhwm
         self.context = None
         self.socket = None
         self.bound = False
@@ -200,6 +664,7 @@ class ZeroMQCaster(object):
         """
         self.context = zmq.Context()
         self.socket = self.context.socket(self.socket_type)
+        self.socket.setsockopt(zmq.SNDHWM, self.sndhwm)
         self.socket.bind(self.bind_host)
         self.bound = True
 
@@ -214,6 +679,21 @@ class ZeroMQCaster(object):
             self.socket.send(msg)
         except Exception as ex:
             _LOG.exception(ex)
+            metrics.increment('transport.send_failures')
+
+    def cast_batch(self, msgs, compress=False):
+        """
+        Sends a list of messages over the zmq PUSH socket as a single batch
+        frame, optionally compressed with zlib
+        """
+        if not self.bound:
+            raise zmq.error.ZMQError(
+                "ZeroMQCaster is not bound to a socket")
+        try:
+            self.socket.send(encode_batch(msgs, compress))
+        except Exception as ex:
+            _LOG.exception(ex)
+            metrics.increment('transport.send_failures', len(msgs))
 
     def close(self):
         """
@@ -225,3 +705,302 @@ class ZeroMQCaster(object):
             self.socket = None
             self.context = None
             self.bound = False
+
+
+class BufferedZeroMQCaster(ZeroMQCaster):
+
+    """
+    A ZeroMQCaster that buffers messages and sends them in batch frames.  A
+    batch is sent once it holds batch_size messages or once its first
+    message has been buffered for batch_window milliseconds.  Frames are
+    sent without blocking, so a slow downstream client never stalls the
+    caller.  While the socket can not take more frames, messages stay in a
+    buffer of at most max_buffered messages, and the overflow policy decides
+    whether the newest or the oldest messages are dropped when it is full.
+
+    The batch window is checked when a message is cast, so callers that may
+    go idle call flush_if_due() from their poll loop, waiting at most
+    poll_timeout() milliseconds between calls.
+    """
+
+    def __init__(self, bind_host_tuple, sndhwm=SNDHWM,
+                 batch_size=CAST_BATCH_SIZE, batch_window=CAST_BATCH_WINDOW,
+                 max_buffered=MAX_BUFFERED, overflow=OVERFLOW,
+                 compress=COMPRESS):
+        """
+        Creates an instance of the BufferedZeroMQCaster.
+
+        :param bind_host_tuple: (host, port), for example ('127.0.0.1', '5000')
+        :param sndhwm: maximum number of frames queued by the socket
+        :param batch_size: maximum number of messages in a batch frame
+        :param batch_window: maximum number of milliseconds a message is held
+        before its batch is sent
+        :param max_buffered: maximum number of messages held in the buffer
+        :param overflow: OVERFLOW_DROP_NEWEST or OVERFLOW_DROP_OLDEST
+        :param compress: compress the batch frames with zlib
+        """
+        super(BufferedZeroMQCaster, self).__init__(bind_host_tuple, sndhwm)
+        self.batch_size = batch_size
+        self.batch_window = batch_window / 1000.0
+        self.max_buffered = max_buffered
+        self.overflow = overflow
+        self.compress = compress
+        self._buffer = deque()
+        self._first_buffered_at = None
+
+    def cast(self, msg):
+        """
+        Buffers a message, and sends the buffered messages if the batch is
+        full or the batch window has passed
+        """
+        if not self.bound:
+            raise zmq.error.ZMQError(
+                "ZeroMQCaster is not bound to a socket")
+
+        if len(self._buffer) >= self.max_buffered:
+            # make room by sending first, only drop if the socket is full
+            self.flush()
+
+        if len(self._buffer) >= self.max_buffered:
+            metrics.increment('transport.caster_dropped')
+            if self.overflow == OVERFLOW_DROP_OLDEST:
+                self._buffer.popleft()
+            else:
+                return
+
+        if not self._buffer:
+            self._first_buffered_at = time.time()
+        self._buffer.append(msg)
+
+        if (len(self._buffer) >= self.batch_size or
+                time.time() - self._first_buffered_at >= self.batch_window):
+            self.flush()
+
+    def poll_timeout(self):
+        """
+        Returns the number of milliseconds until the batch window of the
+        buffered messages passes, or None if nothing is buffered
+        """
+        if self._first_buffered_at is None:
+            return None
+        remaining = self._first_buffered_at + self.batch_window - time.time()
+        return max(0, int(remaining * 1000))
+
+    def flush_if_due(self):
+        """
+        Sends the buffered messages if their batch window has passed, so that
+        a partial batch is not held while no messages are cast
+        """
+        if self._buffer and self.poll_timeout() == 0:
+            self.flush()
+
+    def flush(self):
+        """
+        Sends the buffered messages in batch frames until the buffer is empty
+        or the socket can not take more frames without blocking
+        """
+        if not self.bound:
+            raise zmq.error.ZMQError(
+                "ZeroMQCaster is not bound to a socket")
+
+        while self._buffer:
+            batch = [self._buffer.popleft()
+                     for _ in range(min(self.batch_size, len(self._buffer)))]
+            try:
+                self.socket.send(
+                    encode_batch(batch, self.compress), zmq.NOBLOCK)
+            except zmq.error.Again:
+                # the socket is at its high water mark, keep the batch
+                self._buffer.extendleft(reversed(batch))
+                metrics.increment('transport.caster_blocked')
+                break
+            except Exception as ex:
+                _LOG.exception(ex)
+                metrics.increment('transport.send_failures', len(batch))
+
+        self._first_buffered_at = time.time() if self._buffer else None
+
+    def close(self):
+        """
+        Sends what can be sent of the buffered messages, drops the rest and
+        close the zmq socket
+        """
+        if self.bound:
+            self.flush()
+            if self._buffer:
+                metrics.increment(
+                    'transport.caster_dropped', len(self._buffer))
+                self._buffer.clear()
+        super(BufferedZeroMQCaster, self).close()
+
+
+class ZeroMQPublisher(object):
+
+    """
+    ZeroMQPublisher allows for messages to be published to subscribers by
+    connecting a zmq XPUB socket to a forwarder.  Publishing over a connected
+    socket allows many processes on a host to publish through one forwarder.
+
+    zmq drops the messages published before the subscriptions of the
+    forwarder have reached a newly connected socket.  An XPUB socket
+    receives those subscriptions, so wait_for_subscription() can hold back
+    the first message until the forwarder is listening.
+    """
+
+    def __init__(self, connect_host_tuple):
+        """
+        Creates an instance of the ZeroMQPublisher.
+
+        :param connect_host_tuple: (host, port), for example
+        ('127.0.0.1', '5101')
+        """
+        self.socket_type = zmq.XPUB
+        self.connect_host = 'tcp://{0}:{1}'.format(*connect_host_tuple)
+        self.context = None
+        self.socket = None
+        self.connected = False
+
+    def connect(self):
+        """
+        Create a zmq.Context and a zmq.XPUB socket, and connect the socket to
+        the specified host:port
+        """
+        self.context = zmq.Context()
+        self.socket = self.context.socket(self.socket_type)
+        self.socket.connect(self.connect_host)
+        self.connected = True
+
+    def wait_for_subscription(self, timeout):
+        """
+        Wait up to timeout milliseconds for a subscription to reach the
+        socket, returns True if one did.  The subscriptions received are
+        discarded, the socket only uses them to filter messages.
+        """
+        subscribed = False
+        while self.socket.poll(0 if subscribed else timeout):
+            self.socket.recv()
+            subscribed = True
+        return subscribed
+
+    def publish(self, topic, msg):
+        """
+        Publishes a message under a topic over the zmq PUB socket
+        """
+        if not self.connected:
+            raise zmq.error.ZMQError(
+                "ZeroMQPublisher is not connected to a socket")
+        try:
+            self.socket.send_multipart([topic, msg])
+        except Exception as ex:
+            _LOG.exception(ex)
+
+    def close(self):
+        """
+        Close the zmq socket
+        """
+        if self.connected:
+            self.socket.close()
+            self.context.destroy()
+            self.socket = None
+            self.context = None
+            self.connected = False
+
+
+class ZeroMQSubscriber(object):
+
+    """
+    ZeroMQSubscriber allows for published messages to be received by
+    connecting a zmq SUB socket to one or more publishing hosts.
+    """
+
+    def __init__(self, connect_host_tuples, topics):
+        """
+        Creates an instance of the ZeroMQSubscriber.
+
+        :param connect_host_tuples: [(host, port), (host, port)],
+        for example [('127.0.0.1', '5102'), ('127.0.0.1', '5103')]
+        :param topics: list of topics to subscribe to
+        """
+        self.upstream_hosts = [
+            "tcp://{}:{}".format(*host_tuple)
+            for host_tuple in connect_host_tuples]
+        self.topics = topics
+        self.socket_type = zmq.SUB
+        self.context = None
+        self.socket = None
+        self.connected = False
+
+    def connect(self):
+        """
+        Create a zmq.Context and a zmq.SUB socket, subscribe to the topics
+        and connect the socket to all specified host:port tuples.
+        """
+        self.context = zmq.Context()
+        self.socket = self.context.socket(self.socket_type)
+
+        for topic in self.topics:
+            self.socket.setsockopt(zmq.SUBSCRIBE, topic)
+
+        for host in self.upstream_hosts:
+            self.socket.connect(host)
+
+        self.connected = True
+
+    def get(self):
+        """
+        Read a published message from the zmq socket and return it as a
+        (topic, message) tuple
+        """
+        if not self.connected:
+            raise zmq.error.ZMQError(
+                "ZeroMQSubscriber is not connected to a socket")
+        topic, msg = self.socket.recv_multipart()
+        return topic, msg
+
+    def close(self):
+        """
+        Close the zmq socket
+        """
+        if self.connected:
+            self.socket.close()
+            self.context.destroy()
+            self.socket = None
+            self.context = None
+            self.connected = False
+
+
+class ZeroMQForwarder(object):
+
+    """
+    ZeroMQForwarder relays messages published by ZeroMQPublishers connected
+    to its frontend to the ZeroMQSubscribers connected to its backend.
+    """
+
+    def __init__(self, frontend_host_tuple, backend_host_tuple):
+        """
+        Creates an instance of the ZeroMQForwarder.
+
+        :param frontend_host_tuple: (host, port) that publishers connect to
+        :param backend_host_tuple: (host, port) that subscribers connect to
+        """
+        self.frontend_host = 'tcp://{0}:{1}'.format(*frontend_host_tuple)
+        self.backend_host = 'tcp://{0}:{1}'.format(*backend_host_tuple)
+
+    def start(self):
+        """
+        Bind the frontend and backend sockets and relay messages until the
+        process is stopped.  The sockets are bound here so that this method
+        can easily be passed as a runnable to a child process.
+        """
+        context = zmq.Context()
+        frontend = context.socket(zmq.XSUB)
+        frontend.bind(self.frontend_host)
+        backend = context.socket(zmq.XPUB)
+        backend.bind(self.backend_host)
+
+        try:
+            zmq.proxy(frontend, backend)
+        finally:
+            frontend.close()
+            backend.close()
+            context.term()